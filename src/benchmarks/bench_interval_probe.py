@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+'''
+Micro-benchmark of the interval probe used by is_included_order and
+is_included_not_order on patients with thousands of encounters.
+
+Compares the original linear scan (re-sorting the timestamps on every call and
+walking them with is_between) against precomputed sorted timestamps probed with
+first_in_interval.
+
+Usage:
+    python src/benchmarks/bench_interval_probe.py --encounters 1000 5000 --repeat 3
+'''
+import argparse
+import os
+import sys
+import time
+
+import pandas as pd
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "clincial_research_workflow"))
+from temporal_kernel import first_in_interval, sorted_timestamps
+
+DAY = 24 * 60 * 60
+
+
+def linear_is_in_interval(df, time_int):
+    '''
+    The pre-bisect is_in_interval, kept here as the baseline
+    '''
+    def is_between(timestamp, gap):
+        if gap[0] == gap[1]:
+            return False
+        return gap[0] <= timestamp <= gap[1]
+
+    for timestamp in sorted(set(list(df['timestamp']))):
+        if is_between(timestamp, time_int[1]) and not is_between(timestamp, time_int[0]):
+            return [True, timestamp]
+    return [False, None]
+
+
+def make_patient(n_encounters, seed=0):
+    '''
+    One patient with n_encounters timestamps spread over ten years
+    '''
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'timestamp': np.sort(rng.integers(0, 3650, n_encounters)) * DAY})
+
+
+def time_probes(df, min_gap, max_gap, bisect):
+    '''
+    Runs one probe per anchor the way is_included_not_order does and returns
+    (seconds, number of anchors with a match)
+    '''
+    start = time.perf_counter()
+    anchors = sorted_timestamps(df)
+    timestamps = sorted_timestamps(df) if bisect else df
+    probe = first_in_interval if bisect else linear_is_in_interval
+    matches = 0
+    for anchor in anchors:
+        time_int = [[anchor - min_gap * DAY, anchor + min_gap * DAY], [anchor - max_gap * DAY, anchor + max_gap * DAY]]
+        matches += probe(timestamps, time_int)[0]
+    return time.perf_counter() - start, matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--encounters', type=int, nargs='+', default=[500, 1000, 2000, 5000])
+    parser.add_argument('--min-gap', type=int, default=30)
+    parser.add_argument('--max-gap', type=int, default=365)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'encounters':>10} {'linear (s)':>12} {'bisect (s)':>12} {'speedup':>9}")
+    for n_encounters in args.encounters:
+        df = make_patient(n_encounters)
+        linear = min(time_probes(df, args.min_gap, args.max_gap, False) for _ in range(args.repeat))
+        bisect = min(time_probes(df, args.min_gap, args.max_gap, True) for _ in range(args.repeat))
+        assert linear[1] == bisect[1]
+        print(f"{n_encounters:>10} {linear[0]:>12.4f} {bisect[0]:>12.4f} {linear[0] / bisect[0]:>8.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+'''
+Scaling benchmark of patient-sharded constraint evaluation.
+
+Writes synthetic records and loads them once, then times a count constraint
+(two diagnoses 30 to 365 days apart) and a time constraint (a diagnosis within
+180 days after a medication) over every code of the records, so the kernel
+sees every event. events_occur_multiple_vectorized is compared against
+ShardedEvaluator with each requested number of workers. The pool is started
+before timing so only evaluation is measured. Speedup is relative to the single
+process kernel, and efficiency is speedup per worker.
+
+Usage:
+    python src/benchmarks/bench_sharded_eval.py --events 5000000 --workers 1 2 4 8 16 32
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "clincial_research_workflow"))
+from synthetic_ehr import write_synthetic_records
+from sharded import ShardedEvaluator
+from temporal_kernel import events_occur_multiple_vectorized
+
+
+
+def load_events(records_dir):
+    '''
+    Events sorted by patient and time, and the distinct diagnosis and medication codes
+    '''
+    df = pd.read_parquet(os.path.join(records_dir, "events"), columns=["patient_id", "timestamp", "diagnosis_code", "meds_drugs"])
+    df = df.sort_values(by=["patient_id", "timestamp"]).reset_index(drop=True)
+    return df, list(df["diagnosis_code"].dropna().unique()), list(df["meds_drugs"].dropna().unique())
+
+
+def best_time(evaluate, df, args, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        evaluate(df, *args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=2000000)
+    parser.add_argument("--patients", type=int, default=100000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as records_dir:
+        write_synthetic_records(records_dir, args.events, n_patients=args.patients)
+        df, diagnoses, medications = load_events(records_dir)
+    constraints = {
+        'count': (["diagnosis_code"] * 2, [diagnoses] * 2, False, 30, 365),
+        'time': (["meds_drugs", "diagnosis_code"], [medications, diagnoses], True, 0, 180),
+    }
+    print(f"{len(df)} events of {df['patient_id'].nunique()} patients, {os.cpu_count()} CPUs")
+    print(f"{'constraint':<12}{'workers':>8}{'seconds':>10}{'speedup':>10}{'efficiency':>12}")
+    for name, constraint_args in constraints.items():
+        baseline = best_time(events_occur_multiple_vectorized, df, constraint_args, args.repeat)
+        print(f"{name:<12}{'kernel':>8}{baseline:>10.3f}{1:>10.2f}{'':>12}")
+        for n_workers in args.workers:
+            with ShardedEvaluator(n_workers=n_workers, min_rows=0) as evaluator:
+                # starts the pool and imports the workers before timing
+                evaluator(df.head(1000), *constraint_args)
+                seconds = best_time(evaluator, df, constraint_args, args.repeat)
+            speedup = baseline / seconds
+            print(f"{name:<12}{n_workers:>8}{seconds:>10.3f}{speedup:>10.2f}{speedup / n_workers:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
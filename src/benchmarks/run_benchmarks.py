@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmark suite for the cohort-building hot paths.
+
+Writes synthetic records (synthetic_ehr) at each requested scale, points
+build_cohort_je at them through the local records backend, and times:
+
+    events_occur_multiple              per-patient evaluator, mdd count constraint
+    events_occur_multiple_vectorized   the same constraint through temporal_kernel
+    is_included_order                  mdd codes followed by a medication, per patient
+    is_included_not_order              the same code lists in any order
+    evaluate_threshold                 hba1c >= 6.5 over every lab result
+    evaluate_only_one                  one ssri/snri per 30 days, patient level
+    distinct_in_window                 the same constraint, event level
+    find_intersection                  inclusion/exclusion of constraint results
+    create_query_from_constraint       mdd count constraint, fetch included
+    create_cohort                      the seltorexant definitions
+
+Each benchmark is timed over --repeat runs (best run kept) and run once more
+under tracemalloc for its peak memory. Throughput is the number of input
+events divided by the best time. Results are written as JSON; pass a previous
+results file to --compare to print the change per benchmark and scale.
+
+Usage:
+    python src/benchmarks/run_benchmarks.py --scales 10000 100000 1000000
+    python src/benchmarks/run_benchmarks.py --compare src/benchmarks/results/<previous>.json
+'''
+import argparse
+import copy
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(SRC_DIR)
+sys.path.append(os.path.join(SRC_DIR, "clincial_research_workflow"))
+from synthetic_ehr import write_synthetic_records
+from local_records import LocalRecordsAPIWrapper
+from thresholds import evaluate_threshold
+from rolling_windows import evaluate_only_one
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "results")
+STUDY_WINDOW = [20000101, 20220101]
+# constraint types create_cohort can evaluate
+SUPPORTED_CONSTRAINTS = ['count', 'time', 'threshold', 'only_one']
+
+
+def load_build_cohort_je(records_dir):
+    '''
+    Imports build_cohort_je against the local records backend and points it at records_dir
+    '''
+    os.environ.setdefault("LOCAL_RECORDS_DIR", records_dir)
+    import build_cohort_je
+    build_cohort_je.rec = LocalRecordsAPIWrapper(records_dir)
+    return build_cohort_je
+
+
+def seltorexant_cohort():
+    '''
+    ClinicalCohort of the seltorexant variables: mdd and ssri/snri use as
+    inclusion, everything else as exclusion. Constraint types create_cohort
+    cannot evaluate yet are left out
+    '''
+    from cohorts import ClinicalCohort
+    from clincial_research_workflow.seltorexant_variables.diagnosis_variables import diagnosis_variables
+    from clincial_research_workflow.seltorexant_variables.medication_variables import meds_variables
+    cohort = ClinicalCohort('seltorexant', STUDY_WINDOW)
+    for variable in diagnosis_variables + meds_variables:
+        variable = copy.copy(variable)
+        variable.constraint = {key: value for key, value in variable.constraint.items() if key in SUPPORTED_CONSTRAINTS}
+        category = 'inclusion' if variable.name in ['mdd inclusion', 'ssri_snri'] else 'exclusion'
+        cohort.add_clinical_variable(variable, category)
+    return cohort
+
+
+def measure(function, repeat):
+    '''
+    Best wall time over repeat runs, then peak traced memory of one more run
+
+    Returns
+    -------
+    (seconds, peak_bytes, result of the last run)
+    '''
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return min(seconds), peak, result
+
+
+def benchmarks(bcj, records_dir):
+    '''
+    Name -> (number of input events, function) of every benchmark at one scale
+    '''
+    from clincial_research_workflow.seltorexant_variables.diagnosis_variables import mdd_codes
+    from clincial_research_workflow.seltorexant_variables.medication_variables import ssri_snri
+
+    study_window = [bcj.convert_to_unix(element) for element in STUDY_WINDOW]
+    events = pd.read_parquet(os.path.join(records_dir, "events"))
+    n_records = len(events)
+    events = events[events["diagnosis_code"].isin(mdd_codes) | events["meds_drugs"].isin(ssri_snri)]
+    events = events.sort_values(by=["patient_id", "timestamp"])
+    records = pd.read_parquet(os.path.join(records_dir, "events"))
+    records = records[records["diagnosis_code"].isin(mdd_codes) | records["meds_drugs"].notna()].sort_values(by=["patient_id", "timestamp"])
+    per_patient = [
+        [group[group["diagnosis_code"].isin(mdd_codes)], group[group["meds_drugs"].notna()]]
+        for _, group in records.groupby("patient_id", sort=True)
+    ]
+    per_patient = [dfs for dfs in per_patient if len(dfs[0]) and len(dfs[1])]
+    labs = pd.read_parquet(os.path.join(records_dir, "events"), columns=["patient_id", "timestamp", "lab_test_name", "lab_value"])
+    labs = labs[labs["lab_test_name"].notna()].sort_values(by=["patient_id", "timestamp"])
+    drugs = records[records["meds_drugs"].isin(ssri_snri)]
+    n_per_patient = sum(len(dfs[0]) + len(dfs[1]) for dfs in per_patient)
+    count_args = (["diagnosis_code"] * 2, [mdd_codes] * 2, False, 30, 365)
+
+    rng = np.random.default_rng(0)
+    patients = events["patient_id"].unique()
+    constraint_results = [pd.DataFrame({"patient_id": rng.choice(patients, len(patients) // 2)}) for _ in range(8)]
+    n_constraint_rows = sum(len(df) for df in constraint_results)
+
+    from clincial_research_workflow.seltorexant_variables.diagnosis_variables import mdd_var
+    cohort = seltorexant_cohort()
+    return {
+        "events_occur_multiple": (len(events), lambda: bcj.events_occur_multiple(events, *count_args)),
+        "events_occur_multiple_vectorized": (len(events), lambda: bcj.events_occur_multiple_vectorized(events, *count_args)),
+        "is_included_order": (n_per_patient, lambda: [bcj.is_included_order(dfs, 0, 90) for dfs in per_patient]),
+        "is_included_not_order": (n_per_patient, lambda: [bcj.is_included_not_order(dfs, 30, 365) for dfs in per_patient]),
+        "evaluate_threshold": (len(labs), lambda: evaluate_threshold(labs, "lab", ["hba1c"], [6.5, None])),
+        "evaluate_only_one": (len(drugs), lambda: evaluate_only_one(drugs, "meds_drugs", ssri_snri, 30)),
+        "distinct_in_window": (len(drugs), lambda: evaluate_only_one(drugs, "meds_drugs", ssri_snri, 30, event_level=True)),
+        "find_intersection": (n_constraint_rows, lambda: bcj.find_intersection(inclusion_or=constraint_results[:2], inclusion_and=constraint_results[2:5], exclusion=constraint_results[5:])),
+        "create_query_from_constraint": (n_records, lambda: bcj.create_query_from_constraint(mdd_var.name, mdd_var, mdd_var.constraint["count"][0], "count", study_window)),
+        "create_cohort": (n_records, lambda: bcj.create_cohort(cohort, max_workers=1)),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scales, repeat, only=None, work_dir=None, seed=0):
+    '''
+    Runs the suite at every scale
+
+    Returns
+    -------
+    dict with run metadata and one result per benchmark and scale
+    '''
+    results = []
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp_dir:
+        for scale in scales:
+            records_dir = os.path.join(tmp_dir, f"records-{scale}")
+            write_synthetic_records(records_dir, scale, seed=seed)
+            bcj = load_build_cohort_je(records_dir)
+            for name, (n_events, function) in benchmarks(bcj, records_dir).items():
+                if only and name not in only:
+                    continue
+                seconds, peak, _ = measure(function, repeat)
+                results.append({
+                    "benchmark": name,
+                    "scale": scale,
+                    "events": n_events,
+                    "seconds": seconds,
+                    "events_per_sec": n_events / seconds if seconds else None,
+                    "peak_bytes": peak,
+                })
+                print(f"{name:>34} {scale:>11} {n_events:>10} {seconds:>10.4f}s {results[-1]['events_per_sec'] or 0:>14,.0f} ev/s {peak / 2 ** 20:>9.1f} MiB")
+    return {
+        "commit": git_commit(),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compare(current, previous):
+    '''
+    Prints the time ratio current / previous of every benchmark and scale run in both
+    '''
+    before = {(result["benchmark"], result["scale"]): result for result in previous["results"]}
+    print(f"\ncompared to {previous.get('commit')} ({previous.get('created')}):")
+    for result in current["results"]:
+        old = before.get((result["benchmark"], result["scale"]))
+        if old is None:
+            continue
+        ratio = result["seconds"] / old["seconds"] if old["seconds"] else float("nan")
+        memory = result["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] else float("nan")
+        print(f"{result['benchmark']:>34} {result['scale']:>11} time x{ratio:>6.2f} memory x{memory:>6.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", default=None, help="benchmark names to run")
+    parser.add_argument("--out", default=None, help="results file, by default results/<timestamp>-<commit>.json")
+    parser.add_argument("--compare", default=None, help="previous results file")
+    parser.add_argument("--work-dir", default=None, help="where synthetic records are written")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    current = run(args.scales, args.repeat, args.only, args.work_dir, args.seed)
+    out = args.out
+    if out is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        out = os.path.join(RESULTS_DIR, f"{stamp}-{current['commit'] or 'nogit'}.json")
+    with open(out, "w") as handle:
+        json.dump(current, handle, indent=2)
+    print(f"\nresults written to {out}")
+    if args.compare:
+        with open(args.compare) as handle:
+            compare(current, json.load(handle))
+
+
+if __name__ == "__main__":
+    main()
@@ -27,5 +27,14 @@
 # limitations under the License.
 """Clinical Research Workflow
 """
+import os
+import sys
 
 __version__ = "0.1"
+
+# the workflow modules (build_cohort_je, variables, cohorts, ...) import each
+# other as top level modules, as when run from this directory. The Kedro
+# pipelines and their runner processes import them through the package
+_WORKFLOW_DIR = os.path.dirname(os.path.realpath(__file__))
+if _WORKFLOW_DIR not in sys.path:
+    sys.path.append(_WORKFLOW_DIR)
@@ -1,45 +1,777 @@
 # -*- coding: utf-8 -*-
+import os
 import numpy as np
-from nferx_sdk.data_sources import RecordsAPIWrapper
-from nferx_sdk.utils.query import *
+import pandas as pd
+if os.environ.get("LOCAL_RECORDS_DIR"):
+    # offline backend over parquet files, e.g. written by synthetic_ehr
+    from local_records import *
+else:
+    from nferx_sdk.data_sources import RecordsAPIWrapper
+    from nferx_sdk.utils.query import *
 from variables import *
 from cohorts import *
+from temporal_kernel import (
+    events_occur_multiple_vectorized,
+    sorted_timestamps,
+    first_in_interval,
+    event_arrays_of,
+)
+from ingest import iter_chunks, evaluate_chunks, distinct_patients, frame_nbytes
+from stage_metrics import stage, metered_chunks
+from dump_cache import (
+    in_spec,
+    prefix_spec,
+    and_spec,
+    or_spec,
+    range_spec,
+    dump_spec,
+    spec_key,
+)
+from codesets import compile_code_set, code_mask
+from fetch_planner import (
+    ConstraintFetch,
+    FetchPlan,
+    fan_out,
+    existence_results,
+    CATEGORY_TO_EVENT,
+    EVENT_TO_COL_HEAD,
+    EVENT_TO_VALUE_COL,
+)
+from thresholds import (
+    evaluate_threshold,
+    linked_thresholds,
+    threshold_event,
+    apply_thresholds,
+)
+from rolling_windows import evaluate_only_one
+from concurrent_fetch import run_concurrently
+from patient_sets import PatientIndex, combine
+from criteria_matrix import CriteriaMatrix
+from constraint_memo import constraint_fingerprint
+from sensitivity import sweep_distances, sweep_table
+from cost_estimator import CostEstimate, pull_cost, row_bytes, scale_sample
 import time
 import datetime
+import itertools
+import logging
+import threading
 
-rec = RecordsAPIWrapper()
+if "prefixQuery" not in globals():
+    # without prefix queries, code lists with 'F32*' stems are rejected
+    # (see create_query)
+    prefixQuery = None
 
-def create_cohort(clinical_cohort):
+if os.environ.get("LOCAL_RECORDS_DIR"):
+    rec = LocalRecordsAPIWrapper(os.environ["LOCAL_RECORDS_DIR"])
+else:
+    rec = RecordsAPIWrapper()
+
+logger = logging.getLogger(__name__)
+
+# records clients of the threads of run_concurrently (see records_client)
+_thread_records = threading.local()
+
+# patient ids pushed into a single SDK query, and the most pushed down for one pull
+PUSHDOWN_BATCH_SIZE = 10000
+MAX_PUSHDOWN = 200000
+
+def create_cohort(
+    clinical_cohort,
+    memory_limit=None,
+    cache=None,
+    fetch_scope='variable',
+    max_workers=4,
+    memo=None,
+    evaluator=events_occur_multiple_vectorized,
+    budget=None,
+):
     '''
     Creates cohort from clinical cohort object
 
     Parameters
     ----------
     clinical_cohort : Clinical Cohort object
+    memory_limit, cache, fetch_scope, max_workers, memo, evaluator, budget : optional
+        See evaluate_criteria
     Returns
     -------
     cohort: list of patients that belong to the cohort
 
     '''
-    df_from_variable = []
+    return evaluate_criteria(
+        clinical_cohort,
+        memory_limit=memory_limit,
+        cache=cache,
+        fetch_scope=fetch_scope,
+        max_workers=max_workers,
+        memo=memo,
+        evaluator=evaluator,
+        budget=budget,
+    ).patients()
+
+def evaluate_criteria(
+    clinical_cohort,
+    memory_limit=None,
+    cache=None,
+    fetch_scope='variable',
+    max_workers=4,
+    memo=None,
+    evaluator=events_occur_multiple_vectorized,
+    budget=None,
+):
+    '''
+    Evaluates every variable of a clinical cohort over the whole population into
+    a patient x variable CriteriaMatrix, from which the cohort, funnels and
+    drop-one-criterion counts are read without evaluating anything again
+
+    Parameters
+    ----------
+    clinical_cohort : Clinical Cohort object
+    memory_limit : int, optional
+        Memory ceiling in bytes for each constraint's SDK pull (see
+        create_query_from_constraint)
+    cache : DumpCache, optional
+        On-disk cache of SDK dumps shared between runs
+    fetch_scope : str, optional
+        'variable' merges the queries of all constraints of a variable into one pull,
+        'cohort' issues a single pull for the whole cohort (see plan_cohort_fetches).
+        None queries the SDK once per constraint
+    max_workers : int, optional
+        Number of SDK pulls run concurrently. The limit is lowered automatically
+        while the service throttles (see concurrent_fetch)
+    memo : ConstraintMemo, optional
+        Patient sets of constraints evaluated before, by this or any other cohort
+        (see constraint_memo). Only the constraints it does not hold are fetched.
+        Ignored when neither the memo nor the records backend give a data version
+    evaluator : function, optional
+        Temporal evaluator of count and time constraints (see
+        create_query_from_constraint), e.g. a sharded.ShardedEvaluator to spread
+        patients over a process pool
+    budget : CostBudget, optional
+        Limits checked against a dry run (see estimate_cohort) of the constraints
+        memo does not hold, estimated with budget.method, before anything is
+        fetched. A build over budget raises cost_estimator.BudgetExceeded, or runs
+        with the budget's memory limit when only its memory is over and it may spill
+    Returns
+    -------
+    CriteriaMatrix with one criterion per variable
+
+    '''
     study_window = [convert_to_unix(element) for element in clinical_cohort.study_window]
-    for variable in clinical_cohort.clinical_variable:
-        df_from_constraint = []
-        for item in list(variable.constraint.items()):
-            for constraint in item[1]:
-                df = create_query_from_constraint(variable.name, variable, constraint, item[0], study_window)
-                df_from_constraint.append(df)
-        df_from_variable.append(find_intersection(inclusion_or = df_from_constraint))
-    inclusion_variable = []
-    exclusion_variable = []
-    for counter, df in enumerate(df_from_variable):
-        if clinical_cohort.variable_category[counter] == "inclusion":
-            inclusion_variable.append(df)
-        elif clinical_cohort.variable_category[counter] == "exclusion":
-            exclusion_variable.append(df)
-    return find_intersection(inclusion_and = inclusion_variable, exclusion = exclusion_variable, is_df = False)
-
-def create_query_from_constraint(disease_name, variable, variable_constraint, constraint_type, study_window):
+    constraints = [
+        (variable, constraint_type, constraint)
+        for variable in clinical_cohort.clinical_variable
+        for constraint_type, constraint in evaluated_constraints(variable)
+    ]
+    fingerprints = [None] * len(constraints)
+    dfs = [None] * len(constraints)
+    if memo is not None:
+        data_version = (
+            memo.data_version if memo.data_version is not None else records_version()
+        )
+        if data_version is None:
+            # sets stored against unknown records could be served after they change
+            logger.warning(
+                'records report no data version, constraints are not memoized; '
+                'pass ConstraintMemo(data_version=...)'
+            )
+            memo = None
+    if memo is not None:
+        for ii, (variable, constraint_type, constraint) in enumerate(constraints):
+            fetch = constraint_fetch(variable, constraint, constraint_type)
+            fingerprints[ii] = constraint_fingerprint(
+                fetch, constraint_links(variable, fetch), study_window, data_version
+            )
+            dfs[ii] = memo.get(fingerprints[ii])
+    missing = [ii for ii, df in enumerate(dfs) if df is None]
+    if budget is not None and missing:
+        estimate = estimate_cohort(
+            clinical_cohort,
+            fetch_scope,
+            cache,
+            max_workers,
+            method=budget.method,
+            constraints=[constraints[ii] for ii in missing],
+        )
+        memory_limit = budget.check(estimate, memory_limit)
+    if fetch_scope is None:
+        def run_constraint(variable, constraint_type, constraint):
+            return create_query_from_constraint(
+                variable.name,
+                variable,
+                constraint,
+                constraint_type,
+                study_window,
+                evaluator=evaluator,
+                memory_limit=worker_memory_limit(memory_limit, max_workers),
+                cache=cache,
+            )
+
+        results = run_concurrently(
+            [lambda ii=ii: run_constraint(*constraints[ii]) for ii in missing],
+            max_workers,
+        )
+    else:
+        plan = FetchPlan(study_window, fetch_scope)
+        for ii in missing:
+            variable, constraint_type, constraint = constraints[ii]
+            plan.add(constraint_fetch(variable, constraint, constraint_type, evaluator))
+        df_from_constraint = execute_plan(
+            plan, memory_limit=memory_limit, cache=cache, max_workers=max_workers
+        )
+        # the constraints of each variable come back in the order they were planned
+        results = [df_from_constraint[constraints[ii][0].name].pop(0) for ii in missing]
+    for ii, df in zip(missing, results):
+        dfs[ii] = df
+        if memo is not None:
+            memo.put(fingerprints[ii], df)
+    df_from_constraint = {}
+    for (variable, constraint_type, constraint), df in zip(constraints, dfs):
+        df_from_constraint.setdefault(variable.name, []).append(df)
+    with stage("set_algebra", cohort=clinical_cohort.name) as counts:
+        # patients are interned once; each variable becomes one bit per patient
+        patient_index = PatientIndex()
+        patients_from_variable = [
+            patient_index.encode_frames(df_from_constraint.get(variable.name, []))
+            for variable in clinical_cohort.clinical_variable
+        ]
+        names = [variable.name for variable in clinical_cohort.clinical_variable]
+        matrix = CriteriaMatrix(
+            patient_index,
+            names,
+            clinical_cohort.variable_category,
+            patients_from_variable,
+        )
+        if counts is not None:
+            counts.update(
+                rows=len(patient_index),
+                patients=matrix.count() if matrix.criteria("inclusion") else 0,
+            )
+    return matrix
+
+def records_client():
+    '''
+    Records client of the calling thread. The SDK client is not known to be
+    thread-safe, so the main thread uses rec and every other thread (the pulls
+    of run_concurrently) gets a client of its own, made from rec with its clone
+    method or, for the SDK, a new RecordsAPIWrapper
+    '''
+    if threading.current_thread() is threading.main_thread():
+        return rec
+    if getattr(_thread_records, "source", None) is not rec:
+        _thread_records.client = rec.clone() if hasattr(rec, "clone") else type(rec)()
+        _thread_records.source = rec
+    return _thread_records.client
+
+def records_version():
+    '''
+    Version of the records behind rec, None if the backend does not report one
+    '''
+    client = records_client()
+    if hasattr(client, "dataVersion"):
+        return client.dataVersion()
+    return None
+
+def constraint_links(variable, fetch):
+    '''
+    Thresholds of a variable linked to one of its constraints (see
+    thresholds.linked_thresholds)
+    '''
+    if fetch.constraint_type != "time":
+        return []
+    return [
+        link for link in linked_thresholds(variable) if link[1] in fetch.event_criteria
+    ]
+
+def sweep_cohort(
+    clinical_cohort,
+    variable_name,
+    counts=None,
+    min_gaps=None,
+    max_gaps=None,
+    constraint_index=0,
+    cache=None,
+    fetch_scope='variable',
+    max_workers=4,
+    memo=None,
+):
+    '''
+    Cohort size for every combination of the parameters of one count or time
+    constraint, the rest of the cohort held fixed. The rows of the constraint
+    are fetched and sorted once and every combination is counted from them
+    (see sensitivity); the other constraints are evaluated once
+
+    Parameters
+    ----------
+    clinical_cohort : Clinical Cohort object
+    variable_name : str
+        Name of the inclusion or exclusion variable of the constraint
+    counts : list of int, optional
+        Occurrence counts of a count constraint. Defaults to the constraint's own
+    min_gaps, max_gaps : list of int, optional
+        Minimum and maximum gaps in days. Default to the constraint's own
+    constraint_index : int, optional
+        Position of the constraint among evaluated_constraints(variable)
+    cache, fetch_scope, max_workers, memo : optional
+        See evaluate_criteria
+    Returns
+    -------
+    Dataframe of count (count constraints only), min_gap, max_gap and n, the
+    size of create_cohort with those parameters
+
+    '''
+    study_window = [convert_to_unix(element) for element in clinical_cohort.study_window]
+    position = [variable.name for variable in clinical_cohort.clinical_variable].index(
+        variable_name
+    )
+    variable, category = (
+        clinical_cohort.clinical_variable[position],
+        clinical_cohort.variable_category[position],
+    )
+    constraints = list(evaluated_constraints(variable))
+    constraint_type, constraint = constraints[constraint_index]
+    if constraint_type not in ("count", "time"):
+        raise ValueError(
+            f"only count and time constraints can be swept, not {constraint_type}"
+        )
+    if category not in ("inclusion", "exclusion"):
+        raise ValueError(
+            f"only inclusion and exclusion variables can be swept, not {category}"
+        )
+    if constraint_type == "count":
+        counts = [constraint[0][0]] if counts is None else counts
+        min_gaps = [constraint[0][1]] if min_gaps is None else min_gaps
+        max_gaps = [constraint[0][2]] if max_gaps is None else max_gaps
+    else:
+        min_gaps = [constraint[0][0]] if min_gaps is None else min_gaps
+        max_gaps = [constraint[0][1]] if max_gaps is None else max_gaps
+
+    # the other variables, and the other constraints of the swept one
+    others = ClinicalCohort(clinical_cohort.name, clinical_cohort.study_window)
+    for other, other_category in zip(
+        clinical_cohort.clinical_variable, clinical_cohort.variable_category
+    ):
+        if other is not variable:
+            others.add_clinical_variable(other, other_category)
+    matrix = (
+        evaluate_criteria(
+            others,
+            cache=cache,
+            fetch_scope=fetch_scope,
+            max_workers=max_workers,
+            memo=memo,
+        )
+        if others.clinical_variable
+        else None
+    )
+    rest = set()
+    for ii, (rest_type, rest_constraint) in enumerate(constraints):
+        if ii != constraint_index:
+            df = create_query_from_constraint(
+                variable.name,
+                variable,
+                rest_constraint,
+                rest_type,
+                study_window,
+                cache=cache,
+            )
+            rest.update(distinct_patients([df])['patient_id'])
+
+    fetch = constraint_fetch(variable, constraint, constraint_type)
+    chunks = [
+        df
+        for df in fetch_chunks(
+            variable.name, fetch.events, fetch.event_criteria, study_window, cache
+        )
+        if len(df)
+    ]
+    df = (
+        apply_thresholds(
+            pd.concat(chunks, ignore_index=True), constraint_links(variable, fetch)
+        )
+        if chunks
+        else pd.DataFrame()
+    )
+    if len(df):
+        col_heads = [EVENT_TO_COL_HEAD[event] for event in fetch.events]
+        patient_codes, patient_ids, event_arrays = event_arrays_of(
+            df, col_heads, fetch.event_criteria
+        )
+        distances = sweep_distances(event_arrays, constraint_type, counts, min_gaps)
+    else:
+        patient_ids = pd.Index([], dtype=object)
+        distances = {
+            (count, min_gap): np.empty(0)
+            for count in ([None] if constraint_type == "time" else counts)
+            for min_gap in min_gaps
+        }
+
+    def members(name):
+        return pd.Index(matrix.patients(inclusion=[name], exclusion=[]))
+
+    inclusion = matrix.criteria("inclusion") if matrix is not None else []
+    exclusion = matrix.criteria("exclusion") if matrix is not None else []
+    if category == "inclusion":
+        # patients of the other inclusions, without exclusions, join with the constraint
+        candidates = pd.Index(sorted(rest | set(patient_ids)))
+        eligible = np.ones(len(candidates), dtype=bool)
+        for name in inclusion:
+            eligible &= candidates.isin(members(name))
+        for name in exclusion:
+            eligible &= ~candidates.isin(members(name))
+        in_rest = candidates.isin(list(rest))
+        base, sign = int((eligible & in_rest).sum()), 1
+        candidates = candidates[eligible & ~in_rest]
+    elif not inclusion:
+        base, sign, candidates = 0, -1, pd.Index([])
+    else:
+        # patients of the cohort without the constraint leave with it
+        cohort = pd.Index(matrix.patients(inclusion=inclusion, exclusion=exclusion))
+        cohort = cohort[~cohort.isin(list(rest))]
+        base, sign = len(cohort), -1
+        candidates = cohort
+    position = pd.Index(patient_ids).get_indexer(candidates)
+    position = position[position >= 0]
+    return sweep_table(
+        {
+            key: patient_distances[position]
+            for key, patient_distances in distances.items()
+        },
+        max_gaps,
+        base=base,
+        sign=sign,
+    )
+
+def create_cohort_pushdown(
+    clinical_cohort,
+    memory_limit=None,
+    cache=None,
+    max_workers=4,
+    selectivity=None,
+    budget=None,
+):
+    '''
+    Creates cohort from clinical cohort object, evaluating the most restrictive
+    inclusion variable first. Every later variable is queried and evaluated only
+    for the patients still in the cohort, and the build stops as soon as the
+    cohort is empty. Gives the same patients as create_cohort
+
+    Parameters
+    ----------
+    clinical_cohort : Clinical Cohort object
+    memory_limit : int, optional
+        Memory ceiling in bytes for each variable's SDK pulls
+    cache : DumpCache, optional
+        On-disk cache of SDK dumps shared between runs
+    max_workers : int, optional
+        Number of SDK pulls run concurrently within a variable
+    selectivity : function or dict, optional
+        Estimated number of patients of each inclusion variable, as a function
+        taking (variable, study_window, cache) or a dict keyed by variable name.
+        Defaults to estimate_selectivity. Inclusion variables keep their
+        definition order if any estimate is None. Exclusion variables are not
+        estimated; they are checked in definition order against the remaining patients
+    budget : CostBudget, optional
+        As for evaluate_criteria. The estimate is of the unrestricted pulls of
+        every variable, an upper bound of what the pushed down build fetches
+    Returns
+    -------
+    cohort: list of patients that belong to the cohort
+
+    '''
+    if budget is not None:
+        memory_limit = budget.check(
+            estimate_cohort(
+                clinical_cohort, 'variable', cache, max_workers, method=budget.method
+            ),
+            memory_limit,
+        )
+    study_window = [convert_to_unix(element) for element in clinical_cohort.study_window]
+    variables = list(
+        zip(clinical_cohort.clinical_variable, clinical_cohort.variable_category)
+    )
+    inclusion = [
+        variable for variable, category in variables if category == "inclusion"
+    ]
+    exclusion = [
+        variable for variable, category in variables if category == "exclusion"
+    ]
+    if not inclusion:
+        return []
+    if isinstance(selectivity, dict):
+        estimates = [selectivity[variable.name] for variable in inclusion]
+    else:
+        estimates = [
+            (selectivity or estimate_selectivity)(variable, study_window, cache)
+            for variable in inclusion
+        ]
+    if None not in estimates:
+        order = sorted(range(len(inclusion)), key=lambda ii: estimates[ii])
+        inclusion = [inclusion[ii] for ii in order]
+
+    patient_index = PatientIndex()
+    cohort = None
+    for counter, variable in enumerate(inclusion + exclusion):
+        patients = None if cohort is None else patient_index.decode(cohort)
+        df_from_constraint = execute_plan(
+            variable_plan(variable, study_window),
+            memory_limit=memory_limit,
+            cache=cache,
+            max_workers=max_workers,
+            patients=patients,
+        )
+        variable_patients = patient_index.encode_frames(
+            df_from_constraint.get(variable.name, [])
+        )
+        if cohort is None:
+            cohort = variable_patients
+        elif counter < len(inclusion):
+            cohort = cohort & variable_patients
+        else:
+            cohort = cohort - variable_patients
+        if not len(cohort):
+            return []
+    return patient_index.decode(cohort)
+
+def variable_plan(variable, study_window):
+    '''
+    FetchPlan with a single union query for every constraint of a variable
+    '''
+    plan = FetchPlan(study_window, 'variable')
+    for constraint_type, constraint in evaluated_constraints(variable):
+        plan.add(constraint_fetch(variable, constraint, constraint_type))
+    return plan
+
+def estimate_selectivity(variable, study_window, cache=None):
+    '''
+    Upper bound of the number of patients a variable can include: the distinct
+    patients with any of its codes in the study window, read from the statistics
+    of a cached dump of its pull or counted by the records backend (see
+    estimate_query). None if neither is available
+    '''
+    plan = variable_plan(variable, study_window)
+    if not plan.n_queries:
+        return 0
+    events, criteria = plan.union_query(variable.name)
+    columns = (
+        plan.existence_columns(variable.name)
+        if plan.existence_only(variable.name)
+        else fetch_columns(events)
+    )
+    try:
+        return estimate_query(
+            variable.name,
+            events,
+            criteria,
+            study_window,
+            columns,
+            cache,
+            method=('cache', 'count'),
+        )['patients']
+    except ValueError:
+        return None
+
+def estimate_cohort(
+    clinical_cohort,
+    fetch_scope='variable',
+    cache=None,
+    max_workers=4,
+    method='auto',
+    sample_fraction=0.05,
+    rows_per_second=None,
+    constraints=None,
+):
+    '''
+    Dry run of create_cohort: compiles the queries of every constraint and of
+    every pull the build would issue, and estimates their rows and patients
+    without fetching them (see cost_estimator)
+
+    Parameters
+    ----------
+    clinical_cohort : Clinical Cohort object
+    fetch_scope, cache, max_workers : optional
+        As for evaluate_criteria
+    method, sample_fraction : optional
+        How rows and patients are estimated (see estimate_query)
+    rows_per_second : float, optional
+        Throughput of one pull, e.g. cost_estimator.calibrated_rate of an earlier
+        run. Defaults to cost_estimator.ROWS_PER_SECOND
+    constraints : list, optional
+        (variable, constraint_type, constraint) of the constraints to estimate,
+        e.g. those a ConstraintMemo does not hold. Defaults to every evaluated
+        constraint of the cohort
+    Returns
+    -------
+    CostEstimate
+
+    '''
+    study_window = [convert_to_unix(element) for element in clinical_cohort.study_window]
+    estimates = {}
+
+    def estimate(name, events, criteria, columns):
+        # a pull of a variable with one constraint is the constraint's own query
+        key = spec_key(dump_spec(query_spec(events, criteria, study_window), columns))
+        if key not in estimates:
+            estimates[key] = estimate_query(
+                name,
+                events,
+                criteria,
+                study_window,
+                columns,
+                cache,
+                method,
+                sample_fraction,
+            )
+        return estimates[key]
+
+    if constraints is None:
+        constraints = [
+            (variable, constraint_type, constraint)
+            for variable in clinical_cohort.clinical_variable
+            for constraint_type, constraint in evaluated_constraints(variable)
+        ]
+    rows = []
+    pulls = []
+    plan = FetchPlan(study_window, fetch_scope or 'variable')
+    for variable, constraint_type, constraint in constraints:
+        fetch = constraint_fetch(variable, constraint, constraint_type)
+        columns = ['patient_id'] if fetch.existence else fetch_columns(fetch.events)
+        stats = estimate(variable.name, fetch.events, fetch.event_criteria, columns)
+        rows.append(
+            {
+                'variable': variable.name,
+                'constraint_type': constraint_type,
+                'constraint': constraint,
+                'rows': stats['rows'],
+                'patients': stats['patients'],
+                'method': stats['method'],
+            }
+        )
+        if fetch_scope is None:
+            pulls.append(
+                pull_cost(
+                    variable.name, columns, stats, fetch.existence, rows_per_second
+                )
+            )
+        else:
+            plan.add(fetch)
+    for group in plan.groups:
+        events, criteria = plan.union_query(group)
+        existence = plan.existence_only(group)
+        columns = plan.existence_columns(group) if existence else fetch_columns(events)
+        pulls.append(
+            pull_cost(
+                group,
+                columns,
+                estimate(group, events, criteria, columns),
+                existence,
+                rows_per_second,
+            )
+        )
+    return CostEstimate(rows, pulls, max_workers)
+
+def estimate_query(
+    disease_name,
+    events,
+    event_criteria,
+    study_window,
+    columns,
+    cache=None,
+    method='auto',
+    sample_fraction=0.05,
+):
+    '''
+    Estimated rows, distinct patients and bytes per row of the pull of columns
+    fetch_chunks would issue, without pulling it
+
+    Parameters
+    ----------
+    method : str or tuple of str, optional
+        'cache' reads the statistics of a cached dump of the pull, 'count' asks
+        the records backend for counts only (countCohort), 'sample' pulls
+        sample_fraction of the study window around its middle and scales the
+        counts up. A tuple uses the first of its methods that is available, and
+        'auto' the first of all three
+    Returns
+    -------
+    dict with rows, patients, row_bytes and method
+
+    '''
+    methods = (
+        ('cache', 'count', 'sample')
+        if method == 'auto'
+        else (method,) if isinstance(method, str) else tuple(method)
+    )
+    if 'cache' in methods and cache is not None:
+        parts = cache.parts(
+            dump_spec(query_spec(events, event_criteria, study_window), columns)
+        )
+        if parts is not None:
+            meta, paths = parts
+            patients = distinct_patients(
+                pd.read_parquet(path, columns=['patient_id']) for path in paths
+            )
+            first = pd.read_parquet(paths[0]) if paths else None
+            per_row = (
+                frame_nbytes(first) / len(first)
+                if first is not None and len(first)
+                else row_bytes(columns)
+            )
+            return {
+                'rows': meta['n_rows'],
+                'patients': len(patients),
+                'row_bytes': per_row,
+                'method': 'cache',
+            }
+    if 'count' in methods and hasattr(records_client(), "countCohort"):
+        counts = records_client().countCohort(
+            query_sdk(disease_name, events, event_criteria, study_window)
+        )
+        return {
+            'rows': counts['rows'],
+            'patients': counts['patients'],
+            'row_bytes': row_bytes(columns),
+            'method': 'count',
+        }
+    if 'sample' in methods:
+        middle = (study_window[0] + study_window[1]) / 2
+        half_width = (study_window[1] - study_window[0]) * sample_fraction / 2
+        n_rows = 0
+        nbytes = 0
+        patients = {}
+        for df in fetch_chunks(
+            disease_name,
+            events,
+            event_criteria,
+            [middle - half_width, middle + half_width],
+            columns=columns,
+        ):
+            n_rows += len(df)
+            nbytes += frame_nbytes(df)
+            patients.update(dict.fromkeys(df['patient_id'].unique()))
+        per_row = nbytes / n_rows if n_rows else row_bytes(columns)
+        return scale_sample(
+            {
+                'rows': n_rows,
+                'patients': len(patients),
+                'row_bytes': per_row,
+                'method': 'sample',
+            },
+            sample_fraction,
+        )
+    raise ValueError(f"no {method} estimate available for {disease_name}")
+
+def create_query_from_constraint(
+    disease_name,
+    variable,
+    variable_constraint,
+    constraint_type,
+    study_window,
+    evaluator=events_occur_multiple_vectorized,
+    memory_limit=None,
+    patient_sorted=False,
+    cache=None,
+):
     '''
     Creates a dataframe from a variable constrain
 
@@ -55,68 +787,447 @@ def create_query_from_constraint(disease_name, variable, variable_constraint, co
         "count", "time", ...
     study_window : list
         study window in unix (ie. [121212122, 1212121334])
+    evaluator : function, optional
+        Temporal evaluator with the signature of events_occur_multiple. Defaults
+        to the vectorized kernel; pass events_occur_multiple for the per-patient loop
+    memory_limit : int, optional
+        Bytes of SDK chunks held in memory before they are spilled to disk and
+        evaluated one patient partition at a time. None keeps the pull in memory
+    patient_sorted : boolean, optional
+        True if the SDK returns chunks ordered by patient_id, in which case
+        patient groups are evaluated as soon as they are complete
+    cache : DumpCache, optional
+        On-disk cache of SDK dumps. The SDK is only queried on a cache miss
 
     Returns
     -------
-    Dataframe of cohort defined by constraint
+    Dataframe of cohort defined by constraint. Existence constraints (see
+    is_existence_constraint) only return the patient_id column
 
     '''
-    category_to_col_head = {"drug": "meds_drugs", "dx": "diagnosis_code"}
-    if constraint_type == "time":
-        cohort = rec.makeCohort(disease_name, cohortSpecifier = query_sdk(disease_name, [get_code_type(variable_constraint[1]), get_code_type(variable_constraint[2])], [variable_constraint[1], variable_constraint[2]], study_window))
-    if constraint_type == "count":
-        cohort = rec.makeCohort(disease_name, cohortSpecifier = query_sdk(disease_name, [get_code_type(variable_constraint[1])], [variable_constraint[1]], study_window))
-    cohort_df = pd.DataFrame()
-    columns = ['patient_id','timestamp', "diagnosis_code", "meds_drugs"]
-    cohort.initDump(cohortProjector=columns)
-    ii = 0
-    while cohort.advanceDF():
-        ii+=1
-        df = cohort.getDF() # Gets a new chunk each time called
-        cohort_df = cohort_df.append(df)
-    sorted_df=cohort_df.sort_values(by=['patient_id','timestamp'])
+    fetch = constraint_fetch(variable, variable_constraint, constraint_type, evaluator)
+    if fetch.existence:
+        # any matching event satisfies the constraint: distinct patient ids only
+        return distinct_patients(
+            fetch_chunks(
+                disease_name,
+                fetch.events,
+                fetch.event_criteria,
+                study_window,
+                cache,
+                columns=['patient_id'],
+            )
+        )
+    chunks = fetch_chunks(
+        disease_name, fetch.events, fetch.event_criteria, study_window, cache
+    )
+    return evaluate_chunks(
+        chunks,
+        fetch.evaluate,
+        memory_limit=memory_limit,
+        patient_sorted=patient_sorted,
+        variable=variable.name,
+    )
+
+def create_query_from_index(
+    index,
+    variable,
+    variable_constraint,
+    constraint_type,
+    study_window,
+    evaluator=events_occur_multiple_vectorized,
+    block_size=1000000,
+):
+    '''
+    Creates a dataframe from a variable constraint, evaluated over a
+    TimelineIndex (see timeline_index) instead of an SDK pull. Events are read
+    from the memory-mapped timelines already in patient and time order
+
+    Parameters
+    ----------
+    index : TimelineIndex
+        Timeline index of a local extract
+    variable, variable_constraint, constraint_type, study_window, evaluator
+        As for create_query_from_constraint
+    block_size : int, optional
+        Events of complete patients evaluated at a time
+
+    Returns
+    -------
+    Dataframe of cohort defined by constraint, as create_query_from_constraint
+    '''
+    fetch = constraint_fetch(variable, variable_constraint, constraint_type, evaluator)
+    timestamps = index.arrays['timestamp']
+    mask = (timestamps >= study_window[0]) & (timestamps <= study_window[1])
+    matches = np.zeros(len(index), dtype=bool)
+    for event, criteria in zip(fetch.events, fetch.event_criteria):
+        matches |= index.code_mask(EVENT_TO_COL_HEAD[event], criteria)
+    mask &= matches
+    if fetch.existence:
+        patients = np.unique(
+            np.searchsorted(index.offsets, np.flatnonzero(mask), side='right') - 1
+        )
+        return pd.DataFrame({'patient_id': index.patient_ids[patients].astype(object)})
+    return index.evaluate(fetch.evaluate, mask, block_size)
+
+def plan_cohort_fetches(
+    clinical_cohort,
+    study_window,
+    scope='variable',
+    evaluator=events_occur_multiple_vectorized,
+):
+    '''
+    Collects the code sets of every constraint of a cohort into a FetchPlan that
+    issues one union query per variable (scope='variable') or per cohort
+    (scope='cohort'). plan.summary() shows the round trips saved.
+
+    Parameters
+    ----------
+    clinical_cohort : Clinical Cohort object
+    study_window : list
+        study window in unix
+    scope : str, optional
+        'variable' or 'cohort'
+    evaluator : function, optional
+        Temporal evaluator with the signature of events_occur_multiple
+
+    Returns
+    -------
+    FetchPlan
+    '''
+    plan = FetchPlan(study_window, scope)
+    for variable in clinical_cohort.clinical_variable:
+        for constraint_type, constraint in evaluated_constraints(variable):
+            plan.add(constraint_fetch(variable, constraint, constraint_type, evaluator))
+    return plan
+
+def execute_plan(plan, memory_limit=None, cache=None, max_workers=1, patients=None):
+    '''
+    Runs the union queries of a FetchPlan, up to max_workers at a time, and
+    evaluates every constraint on the rows its own query would have returned.
+    With patients, only the rows of those patient ids are fetched and evaluated
+    (see fetch_patient_chunks)
+
+    Returns
+    -------
+    dict of variable name -> list of constraint dataframes, in constraint order
+    '''
+    def run_group(group, fetches):
+        events, criteria = plan.union_query(group)
+        columns = plan.existence_columns(group) if plan.existence_only(group) else None
+        if patients is None:
+            chunks = fetch_chunks(
+                group, events, criteria, plan.study_window, cache, columns=columns
+            )
+        else:
+            chunks = fetch_patient_chunks(
+                group,
+                events,
+                criteria,
+                plan.study_window,
+                patients,
+                cache,
+                columns=columns,
+            )
+        if columns is not None:
+            return existence_results(chunks, fetches)
+        return fan_out(
+            chunks, fetches, memory_limit=worker_memory_limit(memory_limit, max_workers)
+        )
+
+    groups = list(plan.groups.items())
+    results = run_concurrently(
+        [
+            lambda group=group, fetches=fetches: run_group(group, fetches)
+            for group, fetches in groups
+        ],
+        max_workers,
+    )
+    df_from_constraint = {}
+    for (group, fetches), dfs in zip(groups, results):
+        for fetch, df in zip(fetches, dfs):
+            df_from_constraint.setdefault(fetch.variable_name, []).append(df)
+    return df_from_constraint
+
+def worker_memory_limit(memory_limit, max_workers):
+    '''
+    Share of a memory ceiling available to each concurrent pull
+    '''
+    if memory_limit is None:
+        return None
+    return memory_limit // max(max_workers, 1)
+
+def fetch_chunks(
+    disease_name,
+    events,
+    event_criteria,
+    study_window,
+    cache=None,
+    patients=None,
+    columns=None,
+):
+    '''
+    Chunks of the SDK pull for query_sdk(disease_name, events, event_criteria,
+    study_window, patients), read from cache when possible. columns defaults to
+    the columns the evaluators need (see fetch_columns)
+    '''
+    columns = fetch_columns(events) if columns is None else columns
+
+    def fetch():
+        # a generator, so the query is built and sent when the first chunk is metered
+        cohort = records_client().makeCohort(
+            disease_name,
+            cohortSpecifier=query_sdk(
+                disease_name, events, event_criteria, study_window, patients
+            ),
+        )
+        cohort.initDump(cohortProjector=columns)
+        yield from iter_chunks(cohort)
+
+    if cache is None:
+        return metered_chunks(fetch(), variable=disease_name)
+    return metered_chunks(
+        cache.chunks(
+            dump_spec(
+                query_spec(events, event_criteria, study_window, patients), columns
+            ),
+            fetch,
+        ),
+        variable=disease_name,
+        cached=True,
+    )
+
+def fetch_patient_chunks(
+    disease_name,
+    events,
+    event_criteria,
+    study_window,
+    patients,
+    cache=None,
+    max_pushdown=None,
+    batch_size=None,
+    columns=None,
+):
+    '''
+    Chunks of fetch_chunks holding only the rows of patients. Up to max_pushdown
+    patients the restriction is pushed into the SDK query, batch_size ids per
+    query; above that the unrestricted pull is filtered locally
+    '''
+    max_pushdown = MAX_PUSHDOWN if max_pushdown is None else max_pushdown
+    batch_size = PUSHDOWN_BATCH_SIZE if batch_size is None else batch_size
+    patients = sorted(patients)
+    if len(patients) > max_pushdown:
+        chunks = fetch_chunks(
+            disease_name, events, event_criteria, study_window, cache, columns=columns
+        )
+    else:
+        chunks = itertools.chain.from_iterable(
+            fetch_chunks(
+                disease_name,
+                events,
+                event_criteria,
+                study_window,
+                cache,
+                patients[start : start + batch_size],
+                columns,
+            )
+            for start in range(0, len(patients), batch_size)
+        )
+    patients = pd.Index(patients)
+    for df in chunks:
+        yield df[df['patient_id'].isin(patients)]
+
+def fetch_columns(events):
+    '''
+    Columns pulled for the evaluators of a query over events: patient and timestamp,
+    the code column of each event, and the result column of lab and vital events
+    '''
+    columns = ['patient_id','timestamp']
+    for event in events:
+        if EVENT_TO_COL_HEAD[event] not in columns:
+            columns += [EVENT_TO_COL_HEAD[event]]
+            if event in EVENT_TO_VALUE_COL:
+                columns += [EVENT_TO_VALUE_COL[event]]
+    return columns
+
+def evaluated_constraints(variable):
+    '''
+    (constraint_type, constraint) of every constraint of a variable that is
+    evaluated on its own. Threshold constraints linked to a time constraint
+    (see thresholds.linked_thresholds) are applied within that time constraint
+    '''
+    linked = [names for event, names, bounds in linked_thresholds(variable)]
+    for constraint_type, constraints in variable.constraint.items():
+        for constraint in constraints:
+            if constraint_type == "threshold" and constraint[-1] in linked:
+                continue
+            yield constraint_type, constraint
+
+def constraint_fetch(
+    variable,
+    variable_constraint,
+    constraint_type,
+    evaluator=events_occur_multiple_vectorized,
+):
+    '''
+    Describes the query and temporal evaluation of one constraint as a ConstraintFetch.
+    The event type of each code list comes from the category of its subvariable
+    '''
+    event_of = lambda codes: CATEGORY_TO_EVENT[
+        variable.get_subvariable_dict_from_list(codes)['category']
+    ]
     if constraint_type == "time":
-        event_col_head = [category_to_col_head[variable.get_subvariable_dict_from_list(variable_constraint[1])['category']], category_to_col_head[diabetes.get_subvariable_dict_from_list(variable_constraint[2])['category']]]
-        return events_occur_multiple(sorted_df, event_col_head, [variable_constraint[1], variable_constraint[2]], True, variable_constraint[0][0], variable_constraint[0][1])
+        events, criteria = [
+            event_of(variable_constraint[1]),
+            event_of(variable_constraint[2]),
+        ], [variable_constraint[1], variable_constraint[2]]
+        event_col_head = [EVENT_TO_COL_HEAD[event] for event in events]
+        links = [link for link in linked_thresholds(variable) if link[1] in criteria]
+        evaluate = lambda sorted_df: evaluator(
+            apply_thresholds(sorted_df, links),
+            event_col_head,
+            [variable_constraint[1], variable_constraint[2]],
+            True,
+            variable_constraint[0][0],
+            variable_constraint[0][1],
+        )
     if constraint_type == "count":
-        event_col_head = [category_to_col_head[variable.get_subvariable_dict_from_list(variable_constraint[1])['category']] for ii in range(variable_constraint[0][0])]
+        events, criteria = [event_of(variable_constraint[1])], [variable_constraint[1]]
+        event_col_head = [
+            EVENT_TO_COL_HEAD[events[0]] for ii in range(variable_constraint[0][0])
+        ]
         event_criteria = [variable_constraint[1] for ii in range(variable_constraint[0][0])]
-        return events_occur_multiple(sorted_df, event_col_head, event_criteria, False, variable_constraint[0][1], variable_constraint[0][2])
+        evaluate = lambda sorted_df: evaluator(
+            sorted_df,
+            event_col_head,
+            event_criteria,
+            False,
+            variable_constraint[0][1],
+            variable_constraint[0][2],
+        )
+    if constraint_type == "threshold":
+        events, criteria = [threshold_event(variable, variable_constraint[1])], [
+            variable_constraint[1]
+        ]
+        evaluate = lambda sorted_df: evaluate_threshold(
+            sorted_df, events[0], variable_constraint[1], variable_constraint[0]
+        )
+    if constraint_type == "only_one":
+        events, criteria = [event_of(variable_constraint[1])], [variable_constraint[1]]
+        evaluate = lambda sorted_df: evaluate_only_one(
+            sorted_df,
+            EVENT_TO_COL_HEAD[events[0]],
+            variable_constraint[1],
+            variable_constraint[0],
+        )
+    return ConstraintFetch(
+        variable.name,
+        constraint_type,
+        variable_constraint,
+        events,
+        criteria,
+        evaluate,
+        existence=is_existence_constraint(variable_constraint, constraint_type),
+    )
+
+def is_existence_constraint(variable_constraint, constraint_type):
+    '''
+    True for count constraints of a single occurrence, such as the [1, 0, 0]
+    default added by ClinicalVariable.finalize_variable: any event in the window
+    satisfies them whatever the gaps
+    '''
+    return constraint_type == "count" and variable_constraint[0][0] <= 1
 
-def query_sdk(disease_name, events, event_criteria, study_window):
+def query_sdk(disease_name, events, event_criteria, study_window, patients=None):
     '''
-    Queries SDK to form preliminary temporally unfiltered cohort. 
-    
+    Queries SDK to form preliminary temporally unfiltered cohort.
+
     Inputs:
     disease_name (str): the name of the disease. Can be used to get diagnostic codes if necessary
-    events (list): list of event types ("diagnosis", "medication")
-    event_criteria (list of lists): list of lists of criteria (diagnostic codes or medication names)
+    events (list): list of event types ("diagnosis", "medication", "lab", "vital")
+    event_criteria (list of lists): list of lists of criteria (diagnostic codes,
+    medication, lab or vital names)
     study_window (list): [start of study in unix, end of study in unix]
-    
+    patients (list, optional): only return rows of these patient ids
+
     Outputs:
     cohort (dataframe): Dataframe of the patients that fulfill the criteria. Will be filtered further by temoral criterial.
     '''
-    if len(events) == 1:
-        query = andQuery(create_query(events[0], event_criteria[0]), rangeQuery("timestamp", study_window[0], study_window[1]))
-        
-    if len(events) == 2:
-        query = andQuery(orQuery(create_query(events[0], event_criteria[0]), create_query(events[1], event_criteria[1])), rangeQuery("timestamp", study_window[0], study_window[1]))
-    
-    if len(events) == 3:
-        query = andQuery(orQuery(create_query(events[0], event_criteria[0]), create_query(events[1], event_criteria[1]), create_query(events[2], event_criteria[2])), rangeQuery("timestamp", study_window[0], study_window[1]))
-        
+    with stage("query_build", variable=disease_name):
+        queries = [
+            create_query(event, criteria)
+            for event, criteria in zip(events, event_criteria)
+        ]
+        query = queries[0] if len(queries) == 1 else orQuery(*queries)
+        query = andQuery(
+            query, rangeQuery("timestamp", study_window[0], study_window[1])
+        )
+
+        if patients is not None:
+            query = andQuery(query, inQuery("patient_id", list(patients)))
+
+    return query
+
+def query_spec(events, event_criteria, study_window, patients=None):
+    '''
+    Canonical description of the query built by query_sdk, used as a cache key
+    '''
+    query = [
+        create_query_spec(event, criteria)
+        for event, criteria in zip(events, event_criteria)
+    ]
+    if len(query) > 1:
+        query = [or_spec(*query)]
+    query = and_spec(
+        query[0], range_spec("timestamp", study_window[0], study_window[1])
+    )
+    if patients is not None:
+        query = and_spec(query, in_spec("patient_id", patients))
     return query
 
+def create_query_spec(event, event_criteria):
+    '''
+    Canonical description of the query built by create_query
+    '''
+    code_set = require_prefix_queries(
+        compile_code_set(event_criteria, EVENT_TO_COL_HEAD[event])
+    )
+    spec = in_spec(EVENT_TO_COL_HEAD[event], code_set.query_values())
+    if code_set.stems:
+        spec = or_spec(spec, prefix_spec(EVENT_TO_COL_HEAD[event], code_set.stems))
+    return spec
+
 def create_query(event, event_criteria):
-    if event == "diagnosis":
-        return inQuery("diagnosis_code", event_criteria)
+    '''
+    Query of the rows of an event matching a code list, compiled once into a
+    CodeSet (see codesets): every spelling of its codes, and the children of
+    its 'F32*' stems through a prefix query
+    '''
     if event == "medication":
         drug_list = event_criteria
         #drug_list = []
         #for drug in event_criteria:
            # drug_list += list(rec.getSynonyms(drug)['name'])
-        return inQuery("meds_drugs", drug_list)
-    
+        event_criteria = drug_list
+    code_set = require_prefix_queries(
+        compile_code_set(event_criteria, EVENT_TO_COL_HEAD[event])
+    )
+    query = inQuery(EVENT_TO_COL_HEAD[event], code_set.query_values())
+    if code_set.stems:
+        query = orQuery(query, prefixQuery(EVENT_TO_COL_HEAD[event], code_set.stems))
+    return query
+
+def require_prefix_queries(code_set):
+    '''
+    Returns code_set, raising ValueError if it has stems and the records backend
+    has no prefix queries: the children of its stems could not be fetched
+    '''
+    if code_set.stems and prefixQuery is None:
+        raise ValueError(
+            f"code stems {code_set.stems} need a records backend with prefixQuery"
+        )
+    return code_set
+
 def get_code_type(codes):
     '''
     Returns "medication" or "diagnosis" given list of codes
@@ -130,7 +1241,7 @@ def get_code_type(codes):
             return "diagnosis"
     else:
         return ""
-    
+
 def events_occur_multiple(sorted_df_pre_filt, event_col_head, event_criteria, order_matters, minimum_gap, max_gap):
     """
     Filters sorted df to only include patients that fulfill some temporal criterium (has x medication within 6 months of y diagnosis). 
@@ -139,30 +1250,34 @@ def events_occur_multiple(sorted_df_pre_filt, event_col_head, event_criteria, or
     event_col_head (lst): list of column headers that the function should use to filter
     event_criteria (lst of lst): list of criterial for each column header. (ie. list of diagnosis codes and a list of medications)
     """
-    occurs_multiple = pd.DataFrame()
-    patient_id_lst = sorted(set(list(sorted_df_pre_filt['patient_id'])))
-    for patient in patient_id_lst:
-        temp_df = sorted_df_pre_filt[sorted_df_pre_filt['patient_id']==patient]
-        temp_df_lst_by_criteria = [temp_df[temp_df[event_col_head[ii]].isin(event_criteria[ii])] for ii in range(len(event_col_head))]
+    included_dfs = []
+    for patient, temp_df in sorted_df_pre_filt.groupby('patient_id', sort=True):
+        temp_df_lst_by_criteria = [
+            temp_df[code_mask(temp_df, event_col_head[ii], event_criteria[ii])]
+            for ii in range(len(event_col_head))
+        ]
         if order_matters:
             include = is_included_order(temp_df_lst_by_criteria, minimum_gap, max_gap)
         else:
             include = is_included_not_order(temp_df_lst_by_criteria, minimum_gap, max_gap)
         if include:
-            occurs_multiple = occurs_multiple.append(temp_df)
-    return occurs_multiple
+            included_dfs.append(temp_df)
+    if not included_dfs:
+        return pd.DataFrame()
+    return pd.concat(included_dfs)
 
 def is_included_order(temp_df_lst, min_gap, max_gap):
     '''
     Suboordinate function of events_occur_multiple. The order of events does
     not matter
     '''
-    lst_of_timestamps = sorted(set(list(temp_df_lst[0]['timestamp'])))
+    timestamps_lst = [sorted_timestamps(df) for df in temp_df_lst]
+    lst_of_timestamps = timestamps_lst[0]
     lst_of_time_intervals = [[[time, time + min_gap * 24 * 60 * 60], [time, time + max_gap * 24 * 60 * 60]] for time in lst_of_timestamps]
     for time_int in lst_of_time_intervals:
-        columns_in_interval_check = [False for ii in range(len(temp_df_lst[1:]))]
-        for counter, df in enumerate(temp_df_lst[1:]):
-            in_interval, next_event_timestamp = is_in_interval(df, time_int)
+        columns_in_interval_check = [False for ii in range(len(timestamps_lst[1:]))]
+        for counter, timestamps in enumerate(timestamps_lst[1:]):
+            in_interval, next_event_timestamp = is_in_interval(timestamps, time_int)
             if in_interval:
                 columns_in_interval_check[counter] = True
                 time_int[0][0] = next_event_timestamp
@@ -170,7 +1285,6 @@ def is_included_order(temp_df_lst, min_gap, max_gap):
         if False not in columns_in_interval_check:
             return True
     return False
-                
 
 def is_included_not_order(temp_df_lst, min_gap, max_gap):
     '''
@@ -179,29 +1293,31 @@ def is_included_not_order(temp_df_lst, min_gap, max_gap):
     '''
     lengths_of_dfs = [len(df) for df in temp_df_lst]
     start_idx = lengths_of_dfs.index(min(lengths_of_dfs))
-    start_df = temp_df_lst[start_idx]
-    remaining_dfs = temp_df_lst[0:start_idx] + temp_df_lst[start_idx+1:]
-    lst_of_timestamps = sorted(set(list(start_df['timestamp'])))
+    timestamps_lst = [sorted_timestamps(df) for df in temp_df_lst]
+    remaining_timestamps = timestamps_lst[0:start_idx] + timestamps_lst[start_idx+1:]
+    lst_of_timestamps = timestamps_lst[start_idx]
     lst_of_time_intervals = [[[time - min_gap * 24 * 60 * 60, time + min_gap * 24 * 60 * 60], [time - max_gap * 24 * 60 * 60, time + max_gap * 24 * 60 * 60]] for time in lst_of_timestamps]
     for time_int in lst_of_time_intervals:
-        columns_in_interval_check = [False for ii in range(len(remaining_dfs))]
-        for counter, df in enumerate(remaining_dfs):
-            if is_in_interval(df, time_int)[0]:
+        columns_in_interval_check = [False for ii in range(len(remaining_timestamps))]
+        for counter, timestamps in enumerate(remaining_timestamps):
+            if is_in_interval(timestamps, time_int)[0]:
                 columns_in_interval_check[counter] = True
         if False not in columns_in_interval_check:
             return True
     return False
 
-def is_in_interval(df, time_int):
+def is_in_interval(timestamps, time_int):
     '''
     Checks whether there exists a timestamp within a dataframe within a given
     time interval (interva: [anchor - maxgap: anchor - mingap, anchor + mingap: anchor + maxgap])
 
+    timestamps is either a dataframe or the sorted unique timestamps returned by
+    sorted_timestamps; the latter should be precomputed once per patient and
+    subvariable, after which every probe is a binary search.
     '''
-    for timestamp in sorted(set(list(df['timestamp']))):
-        if is_between(timestamp, time_int[1]) and not is_between(timestamp, time_int[0]):
-            return [True, timestamp]
-    return [False, None]
+    if isinstance(timestamps, pd.DataFrame):
+        timestamps = sorted_timestamps(timestamps)
+    return first_in_interval(timestamps, time_int)
 
 def is_between(timestamp, gap):
     '''
@@ -210,18 +1326,21 @@ def is_between(timestamp, gap):
     '''
     if gap[0] == gap[1]:
         return False
-    
+
     if timestamp>=gap[0] and timestamp<=gap[1]:
         return True
     else:
         return False
-    
-def find_intersection(inclusion_or = [], inclusion_and = [], exclusion = [], is_df = True):
+
+def find_intersection(
+    inclusion_or=[], inclusion_and=[], exclusion=[], is_df=True, patient_index=None
+):
     '''
     Finds different intersections between patients from different cohorts depending
     on whether they are demed inclusion_or inclusion_and or exclusion criteria.
     Use inclusion_or for constraints within a variable.
-    Use inclusion_and for cohorts built from different variables
+    Use inclusion_and for cohorts built from different variables.
+    Without inclusion_or the cohort is the intersection of inclusion_and.
 
     Parameters
     ----------
@@ -232,7 +1351,10 @@ def find_intersection(inclusion_or = [], inclusion_and = [], exclusion = [], is_
     exclusion : list, optional
         List of dataframes or lists of patients
     is_df : boolean, optional
-        True if the arguments are lists of dataframes. False if lists of lists
+        True if the arguments are lists of dataframes (empty dataframes are
+        ignored). False if lists of lists
+    patient_index : PatientIndex, optional
+        Index interning the patient ids, shared when several calls are combined
 
     Returns
     -------
@@ -240,39 +1362,22 @@ def find_intersection(inclusion_or = [], inclusion_and = [], exclusion = [], is_
         List of patients that form clinical cohort 
 
     '''
+    index = PatientIndex() if patient_index is None else patient_index
     if is_df:
-        patient_cohort = []
-        for inclusion_cohort in inclusion_or:
-            if len(inclusion_cohort):
-                patient_cohort += list(inclusion_cohort['patient_id'])
-        patient_cohort = sorted(set(patient_cohort))
-
-        for inclusion_cohort in inclusion_and:
-            if len(inclusion_cohort):
-                patient_cohort = list(set(patient_cohort) & set(inclusion_cohort['patient_id']))
-
-        for exclusion_cohort in exclusion:
-            if len(exclusion_cohort):
-                patient_cohort = list(np.setdiff1d(patient_cohort, list(exclusion_cohort['patient_id'])))
+        to_set = lambda cohorts: [
+            index.encode(cohort['patient_id']) for cohort in cohorts if len(cohort)
+        ]
     else:
-        patient_cohort = []
-        
-        for inclusion_cohort in inclusion_or:
-            patient_cohort += inclusion_cohort
-        patient_cohort = sorted(set(patient_cohort))
-
-        for inclusion_cohort in inclusion_and:
-            patient_cohort = list(set(patient_cohort) & set(inclusion_cohort))
-
-        for exclusion_cohort in exclusion:
-            patient_cohort = list(np.setdiff1d(patient_cohort, exclusion_cohort))
-
-    return patient_cohort
+        to_set = lambda cohorts: [index.encode(cohort) for cohort in cohorts]
+    inclusion_or, inclusion_and, exclusion = (
+        to_set(inclusion_or),
+        to_set(inclusion_and),
+        to_set(exclusion),
+    )
+    return index.decode(combine(inclusion_or, inclusion_and, exclusion, len(index)))
 
 def convert_to_unix(date):
     '''
     Time in yyyyymmdd to unix
     '''
     return time.mktime(datetime.datetime.strptime(str(date), "%Y%m%d").timetuple())
-
-
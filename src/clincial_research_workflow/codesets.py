@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+'''
+Compiled code-set matchers.
+
+The variable libraries mix dotted and undotted ICD codes ('F15.15' next to
+'F1925') and repeat codes ('292.89'). compile_code_set turns a subvariable's
+value list into a CodeSet once:
+
+    canonical form    upper case, no dots or surrounding spaces
+    deduplicated      spellings of the same code collapse to one
+    stems             explicit 'F32*' prefixes match every code starting
+                      with them; codes already covered by a stem are dropped.
+                      Category codes without a '*' ('F32', '290') are
+                      matched exactly, like any other code
+
+Matching a column factorizes it (or reuses the categories of a compact event
+frame, see event_frame) and tests each distinct code against the set and the
+stem trie once; results are remembered per CodeSet, so the cost scales with
+the number of distinct codes rather than rows. Columns not listed in
+NORMALIZED_COLUMNS (drug, lab and vital names) are matched exactly.
+'''
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# columns holding ICD codes, normalized before matching
+NORMALIZED_COLUMNS = ['diagnosis_code']
+# length of ICD-9 and ICD-10 category codes, which the dot follows
+STEM_LENGTH = 3
+# ICD-9 external cause categories E800-E999 are one character longer. ICD-10
+# E codes (endocrine, E00-E89) are ordinary 3 character categories
+ICD9_EXTERNAL_CAUSE_LENGTH = 4
+
+
+def normalize_code(code):
+    '''
+    Canonical form of an ICD code: 'f15.15 ' -> 'F1515'
+    '''
+    return str(code).strip().upper().replace('.', '')
+
+
+def is_icd9_external_cause(code):
+    '''
+    True if a canonical code can be an ICD-9 external cause code, E800-E999
+    ('E9500', 'E888'). 'E1165' is the ICD-10 code E11.65. Codes of E80-E89 are
+    also ICD-10 codes: 'E8889' is E888.9 in ICD-9 and E88.89 in ICD-10
+    '''
+    return code[:1] == 'E' and code[1:2] in ('8', '9') and len(code) >= ICD9_EXTERNAL_CAUSE_LENGTH and code[1:ICD9_EXTERNAL_CAUSE_LENGTH].isdigit()
+
+
+def category_length(code):
+    '''
+    Length of the category of a canonical ICD code
+    '''
+    return ICD9_EXTERNAL_CAUSE_LENGTH if is_icd9_external_cause(code) else STEM_LENGTH
+
+
+def dotted_codes(code):
+    '''
+    Dotted spellings of a canonical ICD code: the dot follows the category
+    ('F1515' -> ['F15.15'], '29289' -> ['292.89'], 'E1165' -> ['E11.65'],
+    'E9500' -> ['E950.0']). Codes that are both ICD-9 and ICD-10 codes get both
+    spellings ('E8889' -> ['E888.9', 'E88.89'])
+    '''
+    categories = [category_length(code)]
+    if code[1:2] == '8' and categories[0] != STEM_LENGTH:
+        categories.append(STEM_LENGTH)
+    return [code[:category] + '.' + code[category:] for category in categories if len(code) > category]
+
+
+class PrefixTrie():
+    '''
+    Character trie of code stems
+    '''
+
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, stem):
+        node = self.root
+        for char in stem:
+            if '' in node:
+                # a shorter stem already covers this one
+                return
+            node = node.setdefault(char, {})
+        # longer stems under this one are covered by it
+        node.clear()
+        node[''] = stem
+
+    def covering(self, code):
+        '''
+        Shortest stem that code starts with, None if there is none
+        '''
+        node = self.root
+        for char in code:
+            if '' in node:
+                return node['']
+            node = node.get(char)
+            if node is None:
+                return None
+        return node.get('')
+
+    def stems(self):
+        stems = []
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            for char, child in node.items():
+                if char == '':
+                    stems.append(child)
+                else:
+                    nodes.append(child)
+        return sorted(stems)
+
+
+class CodeSet():
+    '''
+    Compiled matcher of one code list
+
+    Attributes
+    ----------
+    normalize : boolean
+        True for ICD codes, which are matched in canonical form
+    codes : list of str
+        Deduplicated canonical codes of the list, stems aside
+    exact : list of str
+        Codes matched exactly: codes not covered by a stem
+    stems : list of str
+        Prefixes of the list's 'F32*' values, matching every code that starts
+        with them
+    '''
+
+    def __init__(self, values, normalize=True):
+        self.normalize = normalize
+        self.values = list(values)
+        trie = PrefixTrie()
+        exact = {}
+        for value in self.values:
+            if value is None:
+                continue
+            code = normalize_code(value) if normalize else value
+            if normalize and code.endswith('*'):
+                trie.insert(code[:-1])
+            else:
+                exact[code] = None
+        self.trie = trie
+        self.stems = trie.stems()
+        self.codes = list(exact)
+        self.exact = [code for code in self.codes if not self.normalize or trie.covering(code) is None]
+        self._exact = set(self.exact)
+        # record code -> match, filled as distinct codes are seen
+        self._seen = {}
+
+    def match(self, code):
+        '''
+        True if a single record code is in the set
+        '''
+        if not self.normalize:
+            return code in self._exact
+        code = normalize_code(code)
+        return code in self._exact or self.trie.covering(code) is not None
+
+    def match_unique(self, codes):
+        '''
+        Boolean array telling which of an array of distinct codes are in the set.
+        Each distinct code is only tested the first time it is seen
+        '''
+        seen = self._seen
+        for code in codes:
+            if code not in seen:
+                seen[code] = self.match(code)
+        return np.fromiter((seen[code] for code in codes), dtype=bool, count=len(codes))
+
+    def mask(self, series):
+        '''
+        Boolean array of the rows of a series whose code is in the set, testing
+        every distinct code once
+        '''
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            local_codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+        else:
+            local_codes, uniques = pd.factorize(series)
+        hit = np.append(self.match_unique(uniques), False)
+        # missing values have code -1, which picks the trailing False
+        return hit[local_codes]
+
+    def query_values(self):
+        '''
+        Values to query records for: the codes and stems in their original,
+        canonical and dotted spellings. Children of stems are only fetched by a
+        prefix query on the stems
+        '''
+        values = dict.fromkeys(value for value in self.values if value is not None and not str(value).endswith('*'))
+        if self.normalize:
+            values.update(dict.fromkeys(self.codes + self.stems))
+            values.update(dict.fromkeys(spelling for code in self.codes for spelling in dotted_codes(code)))
+        return list(values)
+
+    def __repr__(self):
+        return f'CodeSet({len(self.exact)} codes, {len(self.stems)} stems)'
+
+
+@lru_cache(maxsize=4096)
+def _compile(values, normalize):
+    return CodeSet(values, normalize)
+
+
+def compile_code_set(values, column=None):
+    '''
+    CodeSet of a code list, compiled once per distinct list and column kind
+
+    Parameters
+    ----------
+    values : list
+        Subvariable value list
+    column : str, optional
+        Column the codes are matched against; columns of NORMALIZED_COLUMNS
+        (and None) get ICD normalization and stems, others exact matching
+    '''
+    return _compile(tuple(values), column is None or column in NORMALIZED_COLUMNS)
+
+
+def code_mask(df, column, values):
+    '''
+    Boolean array of the rows of df whose column matches the code list values
+    '''
+    return compile_code_set(values, column).mask(df[column])
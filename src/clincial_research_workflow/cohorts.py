@@ -1,4 +1,5 @@
 # https://github.com/lumenbiomics/clinical-research/issues/4
+import json
 
 
 class ClinicalCohort:
@@ -27,6 +28,9 @@ class ClinicalCohort:
         Ex: drug exposure = primary, drug stoppage = secondary
     primary_anchor_specified: booelan
         Boolean indicating if primary anchor has been specified, which if true alters the cohort building and analysis process
+    criteria_matrix: CriteriaMatrix
+        Patient x variable bitmask from the last build_cohort_funnel, None until then or after a variable is added.
+        Rebuilt whenever the study window, the variables or the fetch arguments have changed since
 
     """
 
@@ -49,6 +53,8 @@ class ClinicalCohort:
         self.washout_window = washout_window
         self.temporal_anchor = temporal_anchor
         self.primary_anchor_specified = False
+        self.criteria_matrix = None
+        self._criteria_key = None
 
     def add_clinical_variable(
         self,
@@ -87,6 +93,7 @@ class ClinicalCohort:
         # Check if this is a primary anchor
         if temporal_anchor == "primary":
             self.primary_anchor_specified = True
+        self.criteria_matrix = None
 
     # I am pretty sure constraints will need to be checked be reasoning over SDK return as its query function is not advanced enough for these besides the
     # default constraint of count = 1 (i.e. any occurence)
@@ -96,39 +103,117 @@ class ClinicalCohort:
     def check_temporal_constraint(constraint):
         pass
 
-    def check_threshold_constraint(constraint):
-        pass
+    @staticmethod
+    def check_threshold_constraint(constraint, sorted_df, event):
+        """
+        Rows of the patients of sorted_df meeting a threshold constraint [[min, max], names]
+        on event ("lab" or "vital"). See thresholds.evaluate_threshold
+        """
+        from thresholds import evaluate_threshold
+        return evaluate_threshold(sorted_df, event, constraint[1], constraint[0])
 
-    def build_cohort(self):
+    def build_cohort(self, memory_limit=None, cache=None, max_workers=4, selectivity=None, budget=None):
         """
+        Builds the cohort, evaluating the most restrictive inclusion variable first and
+        restricting the queries and evaluation of every later variable to the patients
+        still in the cohort. Within a ClinicalVariable constraints are OR'ed, between
+        inclusion variables AND'ed, and exclusion variables are subtracted.
+
         TODO:
-            1. Check if there is a primary anchor
-                a. If primary anchor / exposure base all assessment windows around that
-                b. If not use assessment windows starting on first patient encounter in EHR that meets any inclusion criteria
-            2. Get constraints from 'inclusion' ClinicalVariables and build cohort
-                a. Each of these will likely require a mixture of querying the SDK and taking in and manipulating a returned dataframe
-                b. Within a ClinicalVariable, each constratint should be evaluated as OR (e.g. diabetes is positive if 2x diagnosis code OR hba1c > 6.5)
-                c. Between ClinicalVariables, constraints should be evaulated as AND (e.g. diabetes.constraints AND depression.constraints if both are inclusion criteria)
-            3. Get constraints from 'exclusion' ClinicalVariables and build cohort
-            4. Subtract exclusion cohort from inclusion cohrot to create final cohort
-            5. Covariates and outcome variables should be saved for use in analysis but don't change cohort building
+            1. Primary anchor / assessment windows are not applied yet; every variable is
+               evaluated over the study window
+
+        Parameters
+        ----------
+        memory_limit : int, optional
+            Memory ceiling in bytes for each variable's SDK pulls
+        cache : DumpCache, optional
+            On-disk cache of SDK dumps shared between runs
+        max_workers : int, optional
+            Number of SDK pulls run concurrently
+        selectivity : function or dict, optional
+            Estimated patients per inclusion variable (see build_cohort_je.create_cohort_pushdown)
+        budget : CostBudget, optional
+            Limits checked against a dry run before anything is fetched (see dry_run)
 
         Returns
         -------
         nfer_cohort : list of str
             list of nfer_pids that match the inclusion/exclusion criteria
         """
-        pass
+        # build_cohort_je imports this module
+        from build_cohort_je import create_cohort_pushdown
 
-    def build_cohort_funnel(self):
+        return create_cohort_pushdown(self, memory_limit=memory_limit, cache=cache, max_workers=max_workers, selectivity=selectivity, budget=budget)
+
+    def dry_run(self, fetch_scope='variable', cache=None, max_workers=4, method='auto', budget=None):
+        """
+        Estimates what building the cohort would cost without fetching it: the rows and patients
+        of every constraint's query, and the fetch volume, peak memory and time of the build
+
+        Parameters
+        ----------
+        fetch_scope, cache, max_workers : optional
+            See build_cohort_je.evaluate_criteria
+        method : str, optional
+            'auto', 'cache', 'count' or 'sample' (see build_cohort_je.estimate_query)
+        budget : CostBudget, optional
+            Checked against the estimate; raises cost_estimator.BudgetExceeded if the build
+            would be refused
+
+        Returns
+        -------
+        estimate : CostEstimate
+        """
+        # build_cohort_je imports this module
+        from build_cohort_je import estimate_cohort
+
+        estimate = estimate_cohort(self, fetch_scope=fetch_scope, cache=cache, max_workers=max_workers, method=method)
+        if budget is not None:
+            budget.check(estimate)
+        return estimate
+
+    def criteria_key(self, memory_limit=None, cache=None, fetch_scope='variable'):
+        """
+        JSON description of everything self.criteria_matrix depends on: the study window, every
+        variable's definition and category, and the fetch arguments of build_cohort_funnel
+        """
+        variables = [[variable.variable_to_dict(), category] for variable, category in zip(self.clinical_variable or [], self.variable_category or [])]
+        fetch = {'memory_limit': memory_limit, 'cache': cache.cache_dir if cache is not None else None, 'fetch_scope': fetch_scope}
+        return json.dumps([self.study_window, variables, fetch], sort_keys=True, default=str)
+
+    def build_cohort_funnel(self, order=None, memory_limit=None, cache=None, fetch_scope='variable', max_workers=4, budget=None):
         """
-        TODO
         Shows the cohort attrition as each inclusion/exclusion criteria is applied so user can decide which restrictions
         if any they may need to loosen to increase their N
 
+        Every variable is evaluated once over the whole population into a patient x variable bitmask
+        (build_cohort_je.evaluate_criteria), kept as self.criteria_matrix. Later calls, other orders and
+        self.criteria_matrix.drop_impact() are answered from it without fetching or evaluating again,
+        as long as the study window, the variables, their categories and memory_limit, cache and
+        fetch_scope are unchanged; otherwise the matrix is evaluated again. max_workers and budget only
+        affect how the matrix is fetched, so a call answered from it fetches nothing and checks no budget
+
+        Parameters
+        ----------
+        order : list of str, optional
+            Variable names in the order they are applied. Defaults to inclusion then exclusion variables
+        memory_limit, cache, fetch_scope, max_workers, budget : optional
+            See build_cohort_je.evaluate_criteria
+
         Returns
         -------
         attrition_list : dict of dict
             Lists of lists of format {variable_category: {variable_name: cohort count after applied}}
         """
-        pass
+        key = self.criteria_key(memory_limit=memory_limit, cache=cache, fetch_scope=fetch_scope)
+        if self.criteria_matrix is None or key != self._criteria_key:
+            # build_cohort_je imports this module
+            from build_cohort_je import evaluate_criteria
+
+            self.criteria_matrix = evaluate_criteria(self, memory_limit=memory_limit, cache=cache, fetch_scope=fetch_scope, max_workers=max_workers, budget=budget)
+            self._criteria_key = key
+        attrition_list = {}
+        for name, category, count in self.criteria_matrix.funnel(order):
+            attrition_list.setdefault(category, {})[name] = count
+        return attrition_list
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+'''
+Concurrent execution of independent SDK pulls.
+
+Tasks (one per fetch group or constraint) run on a thread pool under an
+adaptive concurrency limit: the limit is halved whenever the service throttles
+a request and grows back by one slot after a run of successful tasks. Throttled
+tasks are retried with exponential backoff and jitter. Results are returned in
+task order whatever order the tasks finish in, so merges are deterministic.
+
+Tasks must not share an SDK client: build_cohort_je's pulls reach the records
+through records_client, which gives every worker thread a client of its own.
+'''
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_STATUS_CODES = (429, 503)
+THROTTLE_MESSAGES = ('429', 'too many requests', 'throttl', 'rate limit', 'service unavailable')
+
+
+def is_throttled(exc):
+    '''
+    True if an exception raised by the SDK looks like a throttling response
+    '''
+    response = getattr(exc, 'response', None)
+    status_code = getattr(exc, 'status_code', None) or getattr(response, 'status_code', None)
+    if status_code in THROTTLE_STATUS_CODES:
+        return True
+    message = str(exc).lower()
+    return any(text in message for text in THROTTLE_MESSAGES)
+
+
+class AdaptiveLimiter():
+    '''
+    Concurrency limit that backs off multiplicatively when throttled and
+    recovers additively
+
+    Attributes
+    ----------
+    max_limit : int
+        Upper bound of the number of tasks allowed to run at once
+    limit : int
+        Current number of tasks allowed to run at once
+    recover_after : int
+        Number of consecutive successful tasks after which limit grows by one
+    '''
+
+    def __init__(self, max_limit, recover_after=4):
+        self.max_limit = max_limit
+        self.limit = max_limit
+        self.recover_after = recover_after
+        self._running = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self._running >= self.limit:
+                self._condition.wait()
+            self._running += 1
+
+    def release(self, throttled=False):
+        with self._condition:
+            self._running -= 1
+            if throttled:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self._successes >= self.recover_after and self.limit < self.max_limit:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+
+def run_with_backoff(task, limiter, max_retries=5, base_delay=1.0, max_delay=60.0, throttled=is_throttled):
+    '''
+    Runs task() under limiter, retrying with exponential backoff and jitter
+    while throttled(exc) is True for the raised exception
+    '''
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        try:
+            result = task()
+        except Exception as exc:
+            if not throttled(exc) or attempt == max_retries:
+                limiter.release()
+                raise
+            limiter.release(throttled=True)
+            delay = min(max_delay, base_delay * 2 ** attempt) * (0.5 + random.random() / 2)
+            logger.warning('SDK throttled (%s), retrying in %.1fs with concurrency %d', exc, delay, limiter.limit)
+            time.sleep(delay)
+        else:
+            limiter.release()
+            return result
+
+
+def run_concurrently(tasks, max_workers=4, max_retries=5, base_delay=1.0, max_delay=60.0, throttled=is_throttled):
+    '''
+    Runs independent tasks on a thread pool with adaptive backoff
+
+    Parameters
+    ----------
+    tasks : list of functions
+        Each called without arguments. A task is re-run from the start when it
+        is throttled, so it must not have side effects that survive a failure
+    max_workers : int, optional
+        Maximum number of tasks running at once
+    max_retries : int, optional
+        Retries of a throttled task before its exception is raised
+    base_delay, max_delay : float, optional
+        Bounds in seconds of the exponential backoff
+    throttled : function, optional
+        Predicate deciding whether an exception is a throttling response
+
+    Returns
+    -------
+    list of task results in the order of tasks
+    '''
+    if max_workers <= 1 or len(tasks) <= 1:
+        limiter = AdaptiveLimiter(1)
+        return [run_with_backoff(task, limiter, max_retries, base_delay, max_delay, throttled) for task in tasks]
+    limiter = AdaptiveLimiter(max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run_with_backoff, task, limiter, max_retries, base_delay, max_delay, throttled) for task in tasks]
+        return [future.result() for future in futures]
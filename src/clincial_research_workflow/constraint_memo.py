@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+'''
+Memoization of evaluated constraints across cohorts.
+
+Protocol variants share most of their constraints (the same count of MDD codes,
+the same renal and hepatic exclusion lists), so the patient set of a constraint
+is stored under a canonical fingerprint of what determines it:
+
+    constraint type and parameters      gaps, intervals, threshold bounds
+    normalized code sets                canonical codes and stems of every code
+                                        list (see codesets), with their column
+    linked thresholds                   for time constraints
+    study window                        in unix
+    data version                        of the records (e.g. dataVersion of the
+                                        local backend)
+
+The variable name and the spelling or order of the code lists are not part of
+it, so any cohort evaluating the same constraint reads the stored set instead of
+fetching and evaluating again. Sets are stored as one zstd compressed parquet
+column of sorted patient ids in a DumpCache, which evicts least recently used
+entries beyond max_bytes and expires them after ttl.
+'''
+import json
+
+import pandas as pd
+
+from codesets import compile_code_set
+from dump_cache import DumpCache
+from event_frame import EVENT_TO_COL_HEAD
+
+MEMO_FORMAT_VERSION = 1
+
+
+def canonical_code_set(event, values):
+    '''
+    [column, codes, stems] of a code list, independent of spelling, duplicates
+    and order
+    '''
+    column = EVENT_TO_COL_HEAD[event]
+    code_set = compile_code_set(values, column)
+    return [column, sorted(code_set.exact), sorted(code_set.stems)]
+
+
+def constraint_fingerprint(fetch, links, study_window, data_version=None):
+    '''
+    Canonical description of a constraint evaluation, the key of its memo entry
+
+    Parameters
+    ----------
+    fetch : ConstraintFetch
+        Constraint to describe (see build_cohort_je.constraint_fetch)
+    links : list
+        (event, names, bounds) of the thresholds linked to a time constraint
+    study_window : list
+        Study window in unix
+    data_version : str, optional
+        Version of the records the constraint is evaluated over
+
+    Returns
+    -------
+    dict
+    '''
+    return {
+        'memo': MEMO_FORMAT_VERSION,
+        'type': fetch.constraint_type,
+        'parameters': fetch.constraint[0],
+        # the order of the code lists matters to time constraints
+        'code_sets': [canonical_code_set(event, criteria) for event, criteria in zip(fetch.events, fetch.event_criteria)],
+        'thresholds': sorted(([canonical_code_set(event, names), bounds] for event, names, bounds in links), key=json.dumps),
+        'study_window': [float(bound) for bound in study_window],
+        'data_version': data_version,
+    }
+
+
+class ConstraintMemo():
+    '''
+    Store of constraint patient sets keyed by constraint_fingerprint
+
+    Attributes
+    ----------
+    store : DumpCache
+        Entries, one parquet part of patient ids each
+    data_version : str or None
+        Version of the records; None asks the records backend (see
+        build_cohort_je.evaluate_criteria). Builds over records of unknown
+        version are not memoized
+    hits, misses : int
+        Lookups answered and not answered by the memo
+    '''
+
+    def __init__(self, memo_dir, data_version=None, max_bytes=1024 ** 3, ttl=30 * 24 * 60 * 60):
+        self.store = DumpCache(memo_dir, max_bytes=max_bytes, ttl=ttl)
+        self.data_version = data_version
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fingerprint):
+        '''
+        Dataframe of the patient ids of a constraint, None if it is not stored
+        '''
+        chunks = self.store.read(fingerprint)
+        if chunks is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if not chunks:
+            return pd.DataFrame({'patient_id': []})
+        return pd.concat(chunks, ignore_index=True)
+
+    def put(self, fingerprint, df):
+        '''
+        Stores the distinct patients of an evaluated constraint
+        '''
+        patients = sorted(set(df['patient_id'].astype(object))) if len(df) else []
+        self.store.write(fingerprint, [pd.DataFrame({'patient_id': pd.Series(patients, dtype=object)})])
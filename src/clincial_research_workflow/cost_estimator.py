@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+'''
+Dry-run cost estimates of cohort builds.
+
+Before a cohort is built over the whole population, every query it would send
+is compiled and its rows and patients estimated without pulling them (see
+build_cohort_je.estimate_cohort), from the cheapest source available:
+
+    cache       a DumpCache entry of the same dump: its row count, and the
+                patients and bytes per row of its parquet parts
+    count       a count-only call of the records backend (countCohort)
+    sample      a pull over sample_fraction of the study window, scaled up to
+                the whole window. Patients scale less than rows, so the
+                patients of a sample are an upper bound
+
+The estimates of the pulls the build issues are projected into fetch volume,
+peak memory and time, and checked against a CostBudget before anything is
+fetched: a build over budget is refused with BudgetExceeded, or, when only its
+memory is over and spilling is allowed, run through the streaming/spill path of
+ingest.evaluate_chunks with the budget's memory limit. Budget checks only use
+cache and count estimates unless CostBudget.method allows a sample pull.
+'''
+import pandas as pd
+
+# bytes of one value of a fetched column when no sample or cached dump is measured
+COLUMN_BYTES = 56
+# rows fetched and evaluated per second by one pull
+ROWS_PER_SECOND = 500000
+# a pull held in memory is sorted into a copy before it is evaluated
+MEMORY_FACTOR = 2
+
+
+class BudgetExceeded(RuntimeError):
+    '''
+    Raised when the estimate of a build exceeds its CostBudget
+
+    Attributes
+    ----------
+    estimate : CostEstimate
+    reasons : list of str
+    '''
+
+    def __init__(self, estimate, reasons):
+        super().__init__('cohort build over budget: ' + '; '.join(reasons))
+        self.estimate = estimate
+        self.reasons = reasons
+
+
+class CostBudget():
+    '''
+    Limits a build must fit in
+
+    Attributes
+    ----------
+    max_rows : int or None
+        Rows fetched over all pulls
+    max_bytes : int or None
+        Bytes fetched over all pulls
+    max_seconds : float or None
+        Projected wall time
+    memory_limit : int or None
+        Bytes a build may hold in memory
+    spill : boolean
+        True runs a build over memory_limit through the spill path with
+        memory_limit as its ceiling, False refuses it
+    method : str or tuple of str
+        Estimates the check may use, in order (see build_cohort_je.estimate_query).
+        The default never pulls rows; add 'sample' for backends without countCohort
+    '''
+
+    def __init__(self, max_rows=None, max_bytes=None, max_seconds=None, memory_limit=None, spill=True, method=('cache', 'count')):
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.memory_limit = memory_limit
+        self.spill = spill
+        self.method = method
+
+    def violations(self, estimate):
+        '''
+        Limits an estimate exceeds, memory included, as name -> (estimate, limit)
+        '''
+        values = {'rows': (estimate.rows, self.max_rows), 'bytes': (estimate.bytes, self.max_bytes), 'seconds': (estimate.seconds, self.max_seconds), 'memory': (estimate.memory, self.memory_limit)}
+        return {name: (value, limit) for name, (value, limit) in values.items() if limit is not None and value > limit}
+
+    def check(self, estimate, memory_limit=None):
+        '''
+        Memory limit to build with: memory_limit, lowered to the budget's when the
+        build would not fit in memory and may spill
+
+        Raises
+        ------
+        BudgetExceeded
+            If the estimate exceeds max_rows, max_bytes or max_seconds, or
+            memory_limit without spill
+        '''
+        violations = self.violations(estimate)
+        if self.spill and 'memory' in violations:
+            del violations['memory']
+            memory_limit = self.memory_limit if memory_limit is None else min(memory_limit, self.memory_limit)
+        if violations:
+            raise BudgetExceeded(estimate, [f'{name} {value:.0f} > {limit:.0f}' for name, (value, limit) in violations.items()])
+        return memory_limit
+
+
+def row_bytes(columns):
+    '''
+    Default bytes per fetched row of columns
+    '''
+    return COLUMN_BYTES * len(columns)
+
+
+def scale_sample(stats, fraction):
+    '''
+    Counts of a pull over fraction of the study window scaled to the whole window
+    '''
+    rows = stats['rows'] / fraction
+    return dict(stats, rows=rows, patients=min(stats['patients'] / fraction, rows))
+
+
+def calibrated_rate(summary, stage='fetch'):
+    '''
+    Rows per second of a stage in a stage_metrics summary of an earlier run, to
+    use as rows_per_second. None if the stage did not run
+    '''
+    totals = summary['stages'].get(stage)
+    if not totals or not totals.get('rows') or not totals['seconds']:
+        return None
+    return totals['rows'] / totals['seconds']
+
+
+class CostEstimate():
+    '''
+    Projected cost of a cohort build
+
+    Attributes
+    ----------
+    constraints : dataframe
+        One row per evaluated constraint: variable, constraint_type, constraint,
+        rows and patients of its own query, and the method they were estimated with
+    pulls : dataframe
+        One row per pull the build issues: group, columns pulled, rows,
+        patients, bytes, memory, seconds and method
+    max_workers : int
+        Pulls run concurrently
+    '''
+
+    def __init__(self, constraints, pulls, max_workers=4):
+        self.constraints = pd.DataFrame(constraints, columns=['variable', 'constraint_type', 'constraint', 'rows', 'patients', 'method'])
+        self.pulls = pd.DataFrame(pulls, columns=['group', 'columns', 'rows', 'patients', 'bytes', 'memory', 'seconds', 'method'])
+        self.max_workers = max_workers
+
+    @property
+    def rows(self):
+        return float(self.pulls['rows'].sum())
+
+    @property
+    def bytes(self):
+        return float(self.pulls['bytes'].sum())
+
+    @property
+    def memory(self):
+        '''
+        Peak bytes held in memory: the largest pulls that run at the same time
+        '''
+        return float(self.pulls['memory'].nlargest(max(self.max_workers, 1)).sum())
+
+    @property
+    def seconds(self):
+        '''
+        Wall time of the pulls spread over max_workers, no shorter than the longest pull
+        '''
+        if not len(self.pulls):
+            return 0.
+        workers = min(max(self.max_workers, 1), len(self.pulls))
+        return float(max(self.pulls['seconds'].sum() / workers, self.pulls['seconds'].max()))
+
+    def summary(self):
+        '''
+        Totals of the build
+
+        Returns
+        -------
+        dict with the number of constraints and pulls, rows, bytes, memory and seconds
+        '''
+        return {
+            'constraints': len(self.constraints),
+            'pulls': len(self.pulls),
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'memory': self.memory,
+            'seconds': self.seconds,
+        }
+
+    def __repr__(self):
+        totals = self.summary()
+        return (f"CostEstimate({totals['constraints']} constraints, {totals['pulls']} pulls, {totals['rows']:.0f} rows, "
+                f"{totals['bytes'] / 1024 ** 2:.1f} MiB fetched, {totals['memory'] / 1024 ** 2:.1f} MiB peak, {totals['seconds']:.1f} s)")
+
+
+def pull_cost(group, columns, stats, existence=False, rows_per_second=None):
+    '''
+    Row of CostEstimate.pulls for a pull of columns with estimated stats (rows,
+    patients, row_bytes, method). An existence-only pull holds just the distinct
+    patient ids of its rows
+    '''
+    rows_per_second = ROWS_PER_SECOND if rows_per_second is None else rows_per_second
+    nbytes = stats['rows'] * stats['row_bytes']
+    memory = stats['patients'] * COLUMN_BYTES if existence else nbytes * MEMORY_FACTOR
+    return {
+        'group': group,
+        'columns': list(columns),
+        'rows': stats['rows'],
+        'patients': stats['patients'],
+        'bytes': nbytes,
+        'memory': memory,
+        'seconds': stats['rows'] / rows_per_second,
+        'method': stats['method'],
+    }
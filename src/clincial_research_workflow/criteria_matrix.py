@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+'''
+Patient x criterion membership matrix for cohort attrition.
+
+Every inclusion/exclusion variable of a cohort contributes one bit per patient:
+set when the patient meets the variable. The matrix is stored criterion-major as
+one packed bitmap over the patients of a PatientIndex per variable, so the
+cohort for any combination of criteria is a bytewise AND / ANDNOT of a few rows
+and its size is a popcount. Funnels in any order and "what if this criterion
+is dropped" questions are answered without fetching or evaluating anything again.
+'''
+import numpy as np
+
+from patient_sets import PatientSet
+
+# number of set bits of every byte value
+POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+class CriteriaMatrix():
+    '''
+    Packed patient x criterion bitmask
+
+    Attributes
+    ----------
+    patient_index : PatientIndex
+        Index of the patients the bits refer to
+    names : list of str
+        Variable name of each criterion
+    categories : list of str
+        Variable category of each criterion ('inclusion', 'exclusion', ...)
+    bits : numpy array of uint8
+        (criteria, ceil(patients / 8)) packed bits; bit j of row i is set when
+        patient j meets criterion i
+    '''
+
+    def __init__(self, patient_index, names, categories, patient_sets):
+        self.patient_index = patient_index
+        self.names = list(names)
+        self.categories = list(categories)
+        self.n_patients = len(patient_index)
+        self.bits = np.zeros((len(self.names), (self.n_patients + 7) // 8), dtype=np.uint8)
+        for row, patient_set in zip(self.bits, patient_sets):
+            members = np.zeros(self.n_patients, dtype=bool)
+            members[patient_set.codes] = True
+            row[:] = np.packbits(members)
+        self._everyone = np.packbits(np.ones(self.n_patients, dtype=bool))
+
+    def criteria(self, category):
+        '''
+        Names of the criteria of a category, in definition order
+        '''
+        return [name for name, criterion_category in zip(self.names, self.categories) if criterion_category == category]
+
+    def _row(self, name):
+        return self.bits[self.names.index(name)]
+
+    def _mask(self, inclusion=None, exclusion=None):
+        inclusion = self.criteria('inclusion') if inclusion is None else inclusion
+        exclusion = self.criteria('exclusion') if exclusion is None else exclusion
+        mask = self._everyone.copy()
+        for name in inclusion:
+            mask &= self._row(name)
+        for name in exclusion:
+            mask &= ~self._row(name)
+        return mask
+
+    def count(self, inclusion=None, exclusion=None):
+        '''
+        Number of patients meeting every inclusion criterion and no exclusion
+        criterion given by name. Defaults to every criterion of each category.
+        Without inclusion criteria the base is every patient seen by any criterion
+        '''
+        return int(POPCOUNT[self._mask(inclusion, exclusion)].sum(dtype=np.int64))
+
+    def patients(self, inclusion=None, exclusion=None):
+        '''
+        Patient ids counted by count(inclusion, exclusion)
+        '''
+        if not (self.criteria('inclusion') if inclusion is None else inclusion):
+            return []
+        members = np.unpackbits(self._mask(inclusion, exclusion), count=self.n_patients).astype(bool)
+        return self.patient_index.decode(PatientSet(np.flatnonzero(members).astype(np.int32)))
+
+    def funnel(self, order=None):
+        '''
+        Cohort size after each criterion is applied in turn
+
+        Parameters
+        ----------
+        order : list of str, optional
+            Criterion names in the order they are applied. Defaults to the
+            inclusion criteria followed by the exclusion criteria
+
+        Returns
+        -------
+        list of (name, category, count) tuples
+        '''
+        order = self.criteria('inclusion') + self.criteria('exclusion') if order is None else order
+        steps = []
+        inclusion = []
+        exclusion = []
+        for name in order:
+            category = self.categories[self.names.index(name)]
+            (exclusion if category == 'exclusion' else inclusion).append(name)
+            steps.append((name, category, self.count(inclusion, exclusion)))
+        return steps
+
+    def without(self, name):
+        '''
+        Final cohort size if criterion name is dropped
+        '''
+        inclusion = [criterion for criterion in self.criteria('inclusion') if criterion != name]
+        exclusion = [criterion for criterion in self.criteria('exclusion') if criterion != name]
+        return self.count(inclusion, exclusion) if inclusion else 0
+
+    def drop_impact(self):
+        '''
+        Final cohort size when each inclusion/exclusion criterion is dropped on its own
+        '''
+        return {name: self.without(name) for name in self.criteria('inclusion') + self.criteria('exclusion')}
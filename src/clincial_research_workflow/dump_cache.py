@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+'''
+Persistent on-disk cache of RecordsAPIWrapper cohort dumps.
+
+A dump is identified by a canonical description of its query: the
+inQuery/andQuery/orQuery/rangeQuery tree (built with the *_spec helpers below,
+mirroring the SDK calls), the projector columns and the time window. Entries
+are stored as zstd compressed parquet parts under <cache_dir>/<sha256 of spec>,
+evicted least recently used first once the cache exceeds max_bytes, and
+expired after ttl seconds.
+
+Several analyst processes may share a cache directory: entries are written to
+a private temporary directory and renamed into place atomically, readers hold a
+shared lock on the entry, and eviction takes an exclusive cache-wide lock and
+skips entries that are being read.
+'''
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+import pandas as pd
+
+CACHE_FORMAT_VERSION = 1
+# yielded by DumpCache._iter_entry instead of chunks when the entry is missing or expired
+_MISSING = object()
+
+
+def in_spec(column, values):
+    '''
+    Canonical form of inQuery(column, values). Value order and duplicates do not
+    change the query, so they are normalised away
+    '''
+    columns = sorted(column) if isinstance(column, (list, tuple)) else column
+    return ['in', columns, sorted(set(str(value) for value in values))]
+
+
+def prefix_spec(column, prefixes):
+    '''
+    Canonical form of prefixQuery(column, prefixes)
+    '''
+    return ['prefix', column, sorted(set(str(prefix) for prefix in prefixes))]
+
+
+def and_spec(*children):
+    '''
+    Canonical form of andQuery(*children)
+    '''
+    return ['and'] + sorted(children, key=lambda child: json.dumps(child, sort_keys=True))
+
+
+def or_spec(*children):
+    '''
+    Canonical form of orQuery(*children)
+    '''
+    return ['or'] + sorted(children, key=lambda child: json.dumps(child, sort_keys=True))
+
+
+def range_spec(column, start, end):
+    '''
+    Canonical form of rangeQuery(column, start, end)
+    '''
+    return ['range', column, float(start), float(end)]
+
+
+def dump_spec(query, projector, time_window=None, unit=None):
+    '''
+    Full description of a dump: query tree, projected columns and time window
+    '''
+    return {
+        'format': CACHE_FORMAT_VERSION,
+        'query': query,
+        'projector': list(projector),
+        'time_window': time_window,
+        'unit': unit,
+    }
+
+
+def spec_key(spec):
+    '''
+    sha256 of the canonical JSON encoding of a dump spec
+    '''
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+@contextmanager
+def file_lock(path, shared=False, blocking=True):
+    '''
+    fcntl lock on path. Yields False instead of blocking if blocking=False and
+    the lock is held elsewhere. Lock files are deleted with their entry (see
+    DumpCache._remove), so a lock taken on a file that was unlinked in the
+    meantime is taken again on the current file
+    '''
+    flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    while True:
+        with open(path, 'a') as handle:
+            try:
+                fcntl.flock(handle, flags if blocking else flags | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                if not _is_current(handle, path):
+                    continue
+                yield True
+                return
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _is_current(handle, path):
+    try:
+        return os.stat(path).st_ino == os.fstat(handle.fileno()).st_ino
+    except FileNotFoundError:
+        return False
+
+
+class DumpCache():
+    '''
+    LRU, TTL-bounded cache of cohort dumps stored as compressed parquet parts
+
+    Attributes
+    ----------
+    cache_dir : str
+        Directory shared by every process using the cache
+    max_bytes : int
+        Size above which least recently used entries are evicted
+    ttl : float or None
+        Seconds after which an entry is considered stale. None never expires
+    compression : str
+        Parquet compression codec
+    '''
+
+    def __init__(self, cache_dir, max_bytes=20 * 1024 ** 3, ttl=7 * 24 * 60 * 60, compression='zstd'):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.compression = compression
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock_path = os.path.join(cache_dir, '.lock')
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _read_meta(self, key):
+        try:
+            with open(os.path.join(self._entry_dir(key), 'meta.json')) as handle:
+                return json.load(handle)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _is_expired(self, meta):
+        return self.ttl is not None and time.time() - meta['created'] > self.ttl
+
+    def __contains__(self, spec):
+        meta = self._read_meta(spec_key(spec))
+        return meta is not None and not self._is_expired(meta)
+
+    def _iter_entry(self, key):
+        '''
+        Yields the chunks of an entry while holding a shared lock on it. Yields
+        _MISSING once if the entry is missing or expired, and nothing for an
+        entry of an empty dump
+        '''
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            yield _MISSING
+            return
+        with file_lock(entry_dir + '.lock', shared=True):
+            meta = self._read_meta(key)
+            if meta is None or self._is_expired(meta):
+                yield _MISSING
+                return
+            os.utime(os.path.join(entry_dir, 'meta.json'))
+            for path in sorted(glob.glob(os.path.join(entry_dir, 'part-*.parquet'))):
+                yield pd.read_parquet(path)
+
+    def read(self, spec):
+        '''
+        Returns the cached chunks of a dump as a list of dataframes, or None on a
+        miss. Marks the entry as recently used
+        '''
+        chunks = list(self._iter_entry(spec_key(spec)))
+        if len(chunks) == 1 and chunks[0] is _MISSING:
+            return None
+        return chunks
+
+    def parts(self, spec):
+        '''
+        (meta, paths of the parquet parts) of a live entry, None on a miss. Does
+        not mark the entry as used; the parts may be evicted at any time
+        '''
+        key = spec_key(spec)
+        meta = self._read_meta(key)
+        if meta is None or self._is_expired(meta):
+            return None
+        return meta, sorted(glob.glob(os.path.join(self._entry_dir(key), 'part-*.parquet')))
+
+    def write(self, spec, chunks):
+        '''
+        Stores an iterable of chunks under spec, replacing any previous entry,
+        then evicts entries until the cache fits in max_bytes
+        '''
+        key = spec_key(spec)
+        tmp_dir = tempfile.mkdtemp(prefix=f'.tmp-{key}-', dir=self.cache_dir)
+        try:
+            n_rows = 0
+            n_parts = 0
+            for chunk in chunks:
+                if not len(chunk):
+                    continue
+                chunk.to_parquet(os.path.join(tmp_dir, f'part-{n_parts:05d}.parquet'), compression=self.compression)
+                n_rows += len(chunk)
+                n_parts += 1
+            nbytes = sum(os.path.getsize(path) for path in glob.glob(os.path.join(tmp_dir, 'part-*.parquet')))
+            with open(os.path.join(tmp_dir, 'meta.json'), 'w') as handle:
+                json.dump({'spec': spec, 'created': time.time(), 'n_rows': n_rows, 'n_parts': n_parts, 'bytes': nbytes}, handle)
+            with file_lock(self._lock_path):
+                # an entry that is being read is left in place; it holds the same rows
+                if self._remove(key):
+                    os.rename(tmp_dir, self._entry_dir(key))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict(keep=key)
+
+    def chunks(self, spec, fetch):
+        '''
+        Yields the chunks of the dump described by spec, one at a time. On a miss,
+        fetch() is called for an iterable of chunks from the SDK, which is written
+        to the cache before being read back
+
+        Parameters
+        ----------
+        spec : dict
+            Dump spec from dump_spec
+        fetch : function
+            Called without arguments on a miss; returns an iterable of dataframes
+        '''
+        key = spec_key(spec)
+        if spec not in self:
+            self.write(spec, fetch())
+        chunks = self._iter_entry(key)
+        first = next(chunks, None)
+        if first is _MISSING:
+            # evicted or expired by another process in the meantime
+            yield from fetch()
+            return
+        if first is None:
+            # a cached empty dump
+            return
+        yield first
+        yield from chunks
+
+    def _remove(self, key):
+        entry_dir = self._entry_dir(key)
+        if not os.path.isdir(entry_dir):
+            return True
+        with file_lock(entry_dir + '.lock', blocking=False) as locked:
+            if not locked:
+                return False
+            trash_dir = os.path.join(self.cache_dir, f'.trash-{key}-{uuid.uuid4().hex}')
+            os.rename(entry_dir, trash_dir)
+            os.remove(entry_dir + '.lock')
+        shutil.rmtree(trash_dir, ignore_errors=True)
+        return True
+
+    def entries(self):
+        '''
+        Metadata of every entry with its key, last access time and size
+        '''
+        entries = []
+        for meta_path in glob.glob(os.path.join(self.cache_dir, '*', 'meta.json')):
+            key = os.path.basename(os.path.dirname(meta_path))
+            meta = self._read_meta(key)
+            if meta is None:
+                continue
+            meta['key'] = key
+            meta['accessed'] = os.path.getmtime(meta_path)
+            entries.append(meta)
+        return entries
+
+    def evict(self, keep=None):
+        '''
+        Removes expired entries, then least recently used entries until the
+        cache is no larger than max_bytes. Entries being read and the entry
+        keyed keep are skipped
+        '''
+        with file_lock(self._lock_path):
+            entries = sorted(self.entries(), key=lambda meta: meta['accessed'])
+            total = sum(meta['bytes'] for meta in entries)
+            for meta in entries:
+                if meta['key'] == keep:
+                    continue
+                if self._is_expired(meta) or total > self.max_bytes:
+                    if self._remove(meta['key']):
+                        total -= meta['bytes']
+
+    def clear(self):
+        '''
+        Removes every entry that is not being read
+        '''
+        with file_lock(self._lock_path):
+            for meta in self.entries():
+                self._remove(meta['key'])
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+'''
+Compact columnar events for constraint evaluation.
+
+SDK chunks hold patient ids and codes as strings and timestamps as floats,
+which are the columns every evaluator sorts and matches over and over. An
+EventEncoder interns them once at ingest against dictionaries shared by every
+chunk of a stream:
+
+    patient_id, diagnosis_code, meds_drugs, ...  int16 / int32 ids
+    timestamp                                    int32 seconds from a base
+
+Buffered and spilled chunks are held in this form. Before evaluation the id
+columns are exposed as categoricals over the shared dictionaries, so isin,
+sort_values and factorize keep working on strings while operating on the
+small integer codes. Timestamps stay integer offsets during evaluation: gap
+tests compare differences, which offsets leave unchanged, and restore()
+returns evaluated rows to absolute timestamps.
+
+Timestamps are kept in seconds rather than days so that gap tests give the
+same answers as on the raw frames. Chunks spanning more than int32 seconds
+(about 68 years) from the base get int64 offsets, and fractional timestamps
+float offsets, so offsets are always exact.
+'''
+import numpy as np
+import pandas as pd
+
+# records columns of each event type; change these to match the records schema
+EVENT_TO_COL_HEAD = {"diagnosis": "diagnosis_code", "medication": "meds_drugs", "lab": "lab_test_name", "vital": "vital_name"}
+EVENT_TO_VALUE_COL = {"lab": "lab_value", "vital": "vital_value"}
+# event type of each ClinicalVariable subvariable category
+CATEGORY_TO_EVENT = {"dx": "diagnosis", "drug": "medication", "lab": "lab", "vital": "vital"}
+# columns interned against a shared dictionary
+CODE_COLUMNS = ['patient_id'] + list(EVENT_TO_COL_HEAD.values())
+INT16 = np.iinfo(np.int16)
+INT32 = np.iinfo(np.int32)
+
+
+class EventEncoder():
+    '''
+    Shared dictionaries of one stream of chunks
+
+    Attributes
+    ----------
+    codes : dict
+        Column -> {value: id}
+    values : dict
+        Column -> list of values, in id order
+    base : number or None
+        Timestamp subtracted from every timestamp of the stream, set by the
+        first chunk
+    timestamp_dtype : dtype or None
+        Dtype of the raw timestamps, restored by restore()
+    '''
+
+    def __init__(self):
+        self.codes = {}
+        self.values = {}
+        self.base = None
+        self.timestamp_dtype = None
+
+    def _intern(self, column, series):
+        local_codes, uniques = pd.factorize(series)
+        codes = self.codes.setdefault(column, {})
+        values = self.values.setdefault(column, [])
+        for value in uniques:
+            if value not in codes:
+                codes[value] = len(values)
+                values.append(value)
+        mapping = np.fromiter((codes[value] for value in uniques), dtype=np.int32, count=len(uniques))
+        ids = np.where(local_codes < 0, -1, mapping[np.maximum(local_codes, 0)] if len(mapping) else -1)
+        return ids.astype(np.int16 if len(values) <= INT16.max else np.int32)
+
+    def _offsets(self, timestamps):
+        timestamps = np.asarray(timestamps, dtype=float)
+        if self.base is None:
+            if not len(timestamps) or np.isnan(timestamps).all():
+                return timestamps
+            self.base = float(np.floor(np.nanmin(timestamps)))
+        offsets = timestamps - self.base
+        if not len(offsets):
+            return offsets.astype(np.int32)
+        if np.isnan(offsets).any() or (offsets != np.floor(offsets)).any():
+            return offsets
+        if offsets.min() < INT32.min or offsets.max() > INT32.max:
+            return offsets.astype(np.int64)
+        return offsets.astype(np.int32)
+
+    def encode(self, df):
+        '''
+        Compact copy of a chunk: code columns as ids, timestamps as int32 offsets.
+        Other columns are kept as they are
+        '''
+        compact = {}
+        for column in df.columns:
+            if column in CODE_COLUMNS:
+                compact[column] = self._intern(column, df[column])
+            elif column == 'timestamp':
+                if self.timestamp_dtype is None:
+                    self.timestamp_dtype = df[column].dtype
+                compact[column] = self._offsets(df[column])
+            else:
+                compact[column] = df[column].to_numpy()
+        return pd.DataFrame(compact)
+
+    def decode(self, compact):
+        '''
+        Evaluation view of compact rows: ids become categoricals over the shared
+        dictionaries. Timestamps stay offsets until restore()
+        '''
+        frame = {}
+        for column in compact.columns:
+            if column in CODE_COLUMNS and column in self.values:
+                frame[column] = pd.Categorical.from_codes(compact[column].to_numpy(), categories=pd.Index(self.values[column], dtype=object), validate=False)
+            else:
+                frame[column] = compact[column].to_numpy()
+        return pd.DataFrame(frame, index=compact.index)
+
+    def restore(self, df):
+        '''
+        Evaluated rows with absolute timestamps of the raw dtype
+        '''
+        if not len(df) or 'timestamp' not in df or self.base is None:
+            return df
+        return df.assign(timestamp=(df['timestamp'].to_numpy(dtype=float) + self.base).astype(self.timestamp_dtype))
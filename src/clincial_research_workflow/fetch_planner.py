@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+'''
+Fetch planning for cohort builds.
+
+Every constraint of a cohort needs the rows of the study window that match one
+or more code lists. Instead of one SDK query per constraint, the planner merges
+the code lists of all constraints in a group (a variable, or the whole cohort)
+into a single union query per group, then routes each fetched chunk to the
+constraints it is relevant for, so every evaluator sees exactly the rows its own
+query would have returned.
+'''
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from ingest import ChunkSpool, distinct_patients, sort_and_evaluate
+from codesets import code_mask
+from event_frame import EventEncoder, EVENT_TO_COL_HEAD, EVENT_TO_VALUE_COL, CATEGORY_TO_EVENT
+
+
+class ConstraintFetch():
+    '''
+    Data requirement of a single constraint
+
+    Attributes
+    ----------
+    variable_name : str
+        Name of the ClinicalVariable the constraint belongs to
+    constraint_type : str
+        "count", "time", "threshold", "only_one"
+    constraint : list
+        The constraint as stored on the variable
+    events : list of str
+        Event type of each code list ("diagnosis", "medication", "lab", "vital")
+    event_criteria : list of lists
+        Code lists the constraint's query selects on
+    evaluate : function
+        Takes a patient-complete dataframe sorted by ['patient_id','timestamp'] and
+        returns the rows of the patients that satisfy the constraint
+    existence : boolean
+        True if any matching event satisfies the constraint (a count of one).
+        Such constraints are answered with the distinct patient ids of their rows
+        and never evaluated
+    '''
+
+    def __init__(self, variable_name, constraint_type, constraint, events, event_criteria, evaluate, existence=False):
+        self.variable_name = variable_name
+        self.constraint_type = constraint_type
+        self.constraint = constraint
+        self.events = events
+        self.event_criteria = event_criteria
+        self.evaluate = evaluate
+        self.existence = existence
+
+    def row_mask(self, df):
+        '''
+        Rows of a fetched chunk that this constraint's own query would have returned
+        '''
+        mask = np.zeros(len(df), dtype=bool)
+        for event, criteria in zip(self.events, self.event_criteria):
+            mask |= code_mask(df, EVENT_TO_COL_HEAD[event], criteria)
+        return mask
+
+
+class FetchPlan():
+    '''
+    Groups the constraints of a cohort into union queries
+
+    Attributes
+    ----------
+    study_window : list
+        Study window in unix shared by every query of the plan
+    scope : str
+        'variable' to issue one query per ClinicalVariable, 'cohort' for a single
+        query covering every constraint
+    groups : OrderedDict
+        Group name -> list of ConstraintFetch
+    '''
+
+    def __init__(self, study_window, scope='variable'):
+        if scope not in ['variable', 'cohort']:
+            raise ValueError(f"scope must be 'variable' or 'cohort', got {scope}")
+        self.study_window = study_window
+        self.scope = scope
+        self.groups = OrderedDict()
+
+    def add(self, fetch):
+        '''
+        Adds a ConstraintFetch to the group it belongs to
+        '''
+        group = fetch.variable_name if self.scope == 'variable' else 'cohort'
+        self.groups.setdefault(group, []).append(fetch)
+
+    def union_query(self, group):
+        '''
+        Event types and deduplicated code lists of the union query of a group,
+        in the (events, event_criteria) form taken by query_sdk
+        '''
+        codes = OrderedDict()
+        for fetch in self.groups[group]:
+            for event, criteria in zip(fetch.events, fetch.event_criteria):
+                codes.setdefault(event, OrderedDict()).update((code, None) for code in criteria)
+        return list(codes.keys()), [list(criteria.keys()) for criteria in codes.values()]
+
+    def existence_only(self, group):
+        '''
+        True if every constraint of a group belongs to one variable and only
+        needs the distinct patients of its rows, so the group can be pulled in
+        the narrow columns of existence_columns
+        '''
+        fetches = self.groups[group]
+        return all(fetch.existence for fetch in fetches) and len(set(fetch.variable_name for fetch in fetches)) == 1
+
+    def existence_columns(self, group):
+        '''
+        Columns pulled for an existence-only group: patient ids alone for a
+        single constraint. Several constraints also need the code columns of
+        their events, to tell each constraint's own patients apart
+        '''
+        fetches = self.groups[group]
+        if len(fetches) == 1:
+            return ['patient_id']
+        events, event_criteria = self.union_query(group)
+        return ['patient_id'] + list(OrderedDict.fromkeys(EVENT_TO_COL_HEAD[event] for event in events))
+
+    @property
+    def n_constraints(self):
+        return sum(len(fetches) for fetches in self.groups.values())
+
+    @property
+    def n_queries(self):
+        return len(self.groups)
+
+    def summary(self):
+        '''
+        Inspectable description of the plan
+
+        Returns
+        -------
+        dict with the number of constraints, the number of queries issued, the
+        round trips saved compared to one query per constraint, and one entry per
+        group listing its constraints and union code counts
+        '''
+        groups = []
+        for group, fetches in self.groups.items():
+            events, event_criteria = self.union_query(group)
+            groups.append({
+                'group': group,
+                'constraints': [f'{fetch.variable_name}:{fetch.constraint_type}' for fetch in fetches],
+                'codes': {event: len(criteria) for event, criteria in zip(events, event_criteria)},
+                'codes_requested': sum(len(criteria) for fetch in fetches for criteria in fetch.event_criteria),
+                'existence_only': self.existence_only(group),
+            })
+        return {
+            'scope': self.scope,
+            'constraints': self.n_constraints,
+            'queries': self.n_queries,
+            'round_trips_saved': self.n_constraints - self.n_queries,
+            'groups': groups,
+        }
+
+
+def fan_out(chunks, fetches, memory_limit=None, spool_dir=None, compact=True):
+    '''
+    Routes the chunks of a union query to the constraints of its group and
+    evaluates each constraint on exactly its own rows. With compact, every chunk
+    is encoded once (see event_frame) and the constraints' rows are buffered
+    and evaluated in that form
+
+    Parameters
+    ----------
+    chunks : iterable of dataframes
+        Chunks of the group's union query
+    fetches : list of ConstraintFetch
+        Constraints of the group
+    memory_limit : int, optional
+        Memory ceiling in bytes shared by the per-constraint spools
+    spool_dir : str, optional
+        Parent directory for spilled chunks
+    compact : boolean, optional
+        Buffer and evaluate compact events
+
+    Returns
+    -------
+    list with the evaluated dataframe of each constraint, in the order of fetches.
+    Existence constraints get a dataframe of their distinct patient ids
+    '''
+    temporal = [fetch for fetch in fetches if not fetch.existence]
+    limit = None if memory_limit is None else memory_limit // max(len(temporal), 1)
+    spools = [None if fetch.existence else ChunkSpool(limit, spool_dir=spool_dir) for fetch in fetches]
+    patients = [{} for fetch in fetches]
+    encoder = EventEncoder() if compact and temporal else None
+    try:
+        for df in chunks:
+            events = df if encoder is None else encoder.encode(df)
+            for fetch, spool, seen in zip(fetches, spools, patients):
+                mask = fetch.row_mask(df)
+                if fetch.existence:
+                    seen.update(dict.fromkeys(df['patient_id'][mask].unique()))
+                else:
+                    spool.add(events[mask])
+        results = []
+        for fetch, spool, seen in zip(fetches, spools, patients):
+            if fetch.existence:
+                results.append(pd.DataFrame({'patient_id': list(seen)}))
+                continue
+            if encoder is None:
+                evaluated = [sort_and_evaluate(df, fetch.evaluate, variable=fetch.variable_name) for df in spool.partitions()]
+            else:
+                evaluated = [encoder.restore(sort_and_evaluate(encoder.decode(df), fetch.evaluate, variable=fetch.variable_name)) for df in spool.partitions()]
+            evaluated = [df for df in evaluated if len(df)]
+            results.append(pd.concat(evaluated) if evaluated else pd.DataFrame())
+        return results
+    finally:
+        for spool in spools:
+            if spool is not None:
+                spool.close()
+
+
+def existence_results(chunks, fetches):
+    '''
+    Results of an existence-only group (see FetchPlan.existence_only) from the
+    chunks of its pull in FetchPlan.existence_columns: a dataframe of the
+    distinct patient ids of each constraint's own rows
+    '''
+    if len(fetches) == 1:
+        return [distinct_patients(chunks)]
+    return fan_out(chunks, fetches)
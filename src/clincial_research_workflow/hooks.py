@@ -27,13 +27,24 @@
 # limitations under the License.
 
 """Project hooks."""
+import os
+import tempfile
+import time
 from typing import Any, Dict, Iterable, Optional
 
+import pandas as pd
+
 from kedro.config import ConfigLoader
+from kedro.extras.datasets.pandas import ParquetDataSet
 from kedro.framework.hooks import hook_impl
 from kedro.io import DataCatalog
+from kedro.pipeline import Pipeline
+from kedro.pipeline.node import Node
 from kedro.versioning import Journal
 
+from clincial_research_workflow.pipelines.cohort.pipeline import dataset_filepath
+from clincial_research_workflow.stage_metrics import METRICS_DIR_ENV, emit, summarize
+
 
 class ProjectHooks:
     @hook_impl
@@ -54,3 +65,83 @@ class ProjectHooks:
         return DataCatalog.from_config(
             catalog, credentials, load_versions, save_version, journal
         )
+
+    @hook_impl
+    def before_pipeline_run(
+        self, run_params: Dict[str, Any], pipeline: Pipeline, catalog: DataCatalog
+    ) -> None:
+        # intermediates of the cohort pipeline not declared in catalog.yml, named
+        # after the variables of the pipeline that is about to run
+        declared = set(catalog.list())
+        for name in pipeline.data_sets():
+            filepath = dataset_filepath(name)
+            if filepath is not None and name not in declared:
+                catalog.add(name, ParquetDataSet(filepath=filepath))
+
+
+class StageMetricsHooks:
+    """Stage metrics of cohort builds (see ``stage_metrics``), switched on with
+    ``kedro run --params stage_metrics:true``.
+
+    Events of every process are logged as JSON by the ``stage_metrics`` logger,
+    and totalled per stage, variable and node into
+    ``<summary_dir>/stage_metrics_<run_id>.json`` once the run ends.
+    """
+
+    def __init__(self, summary_dir: str = "data/08_reporting"):
+        self.summary_dir = summary_dir
+        self._metrics_dir = None
+        self._started = {}
+
+    @hook_impl
+    def before_pipeline_run(
+        self, run_params: Dict[str, Any], pipeline: Pipeline, catalog: DataCatalog
+    ) -> None:
+        switch = (run_params.get("extra_params") or {}).get("stage_metrics", False)
+        # --params values may arrive as strings
+        if str(switch).lower() not in ("true", "1", "yes"):
+            return
+        # set before any runner starts its workers, which inherit it
+        self._metrics_dir = tempfile.mkdtemp(prefix="stage_metrics-")
+        os.environ[METRICS_DIR_ENV] = self._metrics_dir
+
+    @hook_impl
+    def before_node_run(self, node: Node) -> None:
+        self._started[node.name] = time.perf_counter()
+
+    @hook_impl
+    def after_node_run(self, node: Node, outputs: Dict[str, Any]) -> None:
+        started = self._started.pop(node.name, None)
+        if started is None:
+            return
+        frames = [df for df in outputs.values() if isinstance(df, pd.DataFrame)]
+        patients = sum(df["patient_id"].nunique() for df in frames if "patient_id" in df)
+        emit(
+            "node",
+            time.perf_counter() - started,
+            node=node.name,
+            rows_out=sum(len(df) for df in frames),
+            patients=int(patients),
+        )
+
+    @hook_impl
+    def after_pipeline_run(self, run_params: Dict[str, Any]) -> None:
+        self._finish(run_params)
+
+    @hook_impl
+    def on_pipeline_error(self, run_params: Dict[str, Any]) -> None:
+        self._finish(run_params, failed=True)
+
+    def _finish(self, run_params: Dict[str, Any], failed: bool = False) -> None:
+        if self._metrics_dir is None:
+            return
+        os.environ.pop(METRICS_DIR_ENV, None)
+        run_id = run_params.get("run_id") or time.strftime("%Y%m%dT%H%M%S")
+        summarize(
+            self._metrics_dir,
+            os.path.join(self.summary_dir, f"stage_metrics_{run_id}.json"),
+            run_id=run_id,
+            pipeline=run_params.get("pipeline_name"),
+            failed=failed,
+        )
+        self._metrics_dir = None
@@ -0,0 +1,457 @@
+# -*- coding: utf-8 -*-
+'''
+Incremental refresh of cohort criteria.
+
+Every constraint is reduced to a per-patient witness: the latest timestamp
+from which the patient meets the constraint using events at or after it.
+
+    count (2+)      latest start of a pair of events in the gap interval
+    count (1)       latest event
+    time            latest anchor of a complete chain (chains look forward)
+    threshold       latest in-range result
+    only_one        latest event, and latest start of two adjacent different
+                    values within the interval ('violation')
+
+A patient meets a constraint over [start, end] exactly when its witness is
+>= start (and, for only_one, its violation is not). Extending the end of the
+window can only add matches, so the witnesses of two windows merge by taking
+the maximum, and moving the start later only filters them. A match containing a
+new event lies within the constraint's lookback (its longest match span) of
+that event, so the rows within lookback of the previous end are kept as the
+pending rows of the constraint (the anchors still waiting for a partner);
+a refresh evaluates them together with the rows of the new time range only.
+
+Records are assumed to arrive in time order: rows dated within an already
+evaluated window are not looked for again. Moving the start of the window
+earlier or its end earlier rebuilds the constraint.
+
+The state of a cohort lives in a directory:
+
+    <state_dir>/state.json                      format, study window, constraints
+    <state_dir>/<key>/<n>/witnesses.parquet     patient_id, witness[, violation]
+    <state_dir>/<key>/<n>/pending.parquet       rows within lookback of the end
+
+Each save writes generation n + 1 of the constraints it updates before
+state.json is replaced, so an interrupted refresh leaves the previous state intact.
+'''
+import itertools
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from codesets import code_mask
+from criteria_matrix import CriteriaMatrix
+from dump_cache import spec_key
+from event_frame import EVENT_TO_COL_HEAD
+from ingest import evaluate_chunks
+from patient_sets import PatientIndex
+from temporal_kernel import (
+    days_to_seconds,
+    event_arrays_of,
+    order_witness,
+    not_order_witness,
+)
+from thresholds import apply_thresholds, threshold_mask
+
+STATE_FORMAT_VERSION = 1
+
+
+def constraint_key(fetch, links):
+    '''
+    Key of the state of a constraint: its variable, type, values and the
+    thresholds linked to it
+    '''
+    return spec_key(
+        [
+            STATE_FORMAT_VERSION,
+            fetch.variable_name,
+            fetch.constraint_type,
+            fetch.constraint,
+            fetch.events,
+            links,
+        ]
+    )
+
+
+def lookback(fetch):
+    '''
+    Longest span of a match of a constraint in seconds; only rows within it of
+    the end of the window can match with later rows
+    '''
+    if fetch.existence or fetch.constraint_type == 'threshold':
+        return 0
+    if fetch.constraint_type == 'only_one':
+        return days_to_seconds(abs(fetch.constraint[0]))
+    if fetch.constraint_type == 'time':
+        return days_to_seconds(max(fetch.constraint[0][1], 0))
+    return days_to_seconds(abs(fetch.constraint[0][2]))
+
+
+def _latest(patient_ids, timestamps):
+    if not len(patient_ids):
+        return pd.DataFrame({'patient_id': [], 'witness': []})
+    latest = (
+        pd.Series(np.asarray(timestamps, dtype=float))
+        .groupby(np.asarray(patient_ids, dtype=object), sort=False)
+        .max()
+    )
+    return pd.DataFrame(
+        {
+            'patient_id': latest.index.to_numpy(dtype=object),
+            'witness': latest.to_numpy(),
+        }
+    )
+
+
+def witness_evaluator(fetch, links=()):
+    '''
+    Evaluator of the witnesses of a constraint (see constraint_fetch for the
+    evaluator of its rows)
+
+    Parameters
+    ----------
+    fetch : ConstraintFetch
+        Constraint to evaluate
+    links : list, optional
+        (event, names, bounds) of the thresholds linked to a time constraint
+
+    Returns
+    -------
+    function taking a dataframe sorted by ['patient_id','timestamp'] of complete
+    patient groups and returning a dataframe of patient_id and witness (and
+    violation for only_one), one row per patient with a match
+    '''
+    constraint = fetch.constraint
+    col_heads = [EVENT_TO_COL_HEAD[event] for event in fetch.events]
+
+    def evaluate(sorted_df):
+        if not len(sorted_df):
+            return pd.DataFrame()
+        if fetch.existence:
+            # every row of the query is an event of the constraint
+            return _latest(sorted_df['patient_id'], sorted_df['timestamp'])
+        if fetch.constraint_type == 'threshold':
+            rows = sorted_df[
+                threshold_mask(sorted_df, fetch.events[0], constraint[1], constraint[0])
+            ]
+            return _latest(rows['patient_id'], rows['timestamp'])
+        if fetch.constraint_type == 'only_one':
+            return only_one_witness(
+                sorted_df, col_heads[0], constraint[1], constraint[0]
+            )
+        if fetch.constraint_type == 'time':
+            sorted_df = apply_thresholds(sorted_df, list(links))
+            if not len(sorted_df):
+                return pd.DataFrame()
+            patient_codes, patient_ids, event_arrays = event_arrays_of(
+                sorted_df, col_heads, [constraint[1], constraint[2]]
+            )
+            witness = order_witness(event_arrays, constraint[0][0], constraint[0][1])
+        else:
+            n_events = constraint[0][0]
+            patient_codes, patient_ids, event_arrays = event_arrays_of(
+                sorted_df, col_heads * n_events, [constraint[1]] * n_events
+            )
+            witness = not_order_witness(
+                event_arrays, constraint[0][1], constraint[0][2]
+            )
+        found = np.isfinite(witness)
+        return pd.DataFrame(
+            {
+                'patient_id': np.asarray(patient_ids, dtype=object)[found],
+                'witness': witness[found],
+            }
+        )
+    return evaluate
+
+
+def only_one_witness(sorted_df, col_head, values, interval_days):
+    '''
+    Latest event of values of each patient, and the latest start of two adjacent
+    events of different values at most interval_days apart (see rolling_windows)
+    '''
+    events = sorted_df[code_mask(sorted_df, col_head, values)]
+    if not len(events):
+        return pd.DataFrame()
+    witnesses = _latest(events['patient_id'], events['timestamp'])
+    patient_ids = events['patient_id'].to_numpy(dtype=object)
+    timestamps = np.asarray(events['timestamp'], dtype=float)
+    value_codes, _ = pd.factorize(events[col_head])
+    adjacent = (
+        (patient_ids[1:] == patient_ids[:-1])
+        & (value_codes[1:] != value_codes[:-1])
+        & (timestamps[1:] - timestamps[:-1] <= days_to_seconds(interval_days))
+    )
+    violations = _latest(patient_ids[:-1][adjacent], timestamps[:-1][adjacent]).rename(
+        columns={'witness': 'violation'}
+    )
+    return witnesses.merge(violations, on='patient_id', how='left')
+
+
+def merge_witnesses(previous, current):
+    '''
+    Witnesses over the union of two windows: the latest of each patient's
+    witnesses (and violations)
+    '''
+    frames = [df for df in [previous, current] if len(df)]
+    if not frames:
+        return pd.DataFrame({'patient_id': [], 'witness': []})
+    merged = pd.concat(frames, ignore_index=True)
+    merged['patient_id'] = merged['patient_id'].astype(object)
+    return merged.groupby('patient_id', sort=False).max().reset_index()
+
+
+def met_by(witnesses, start):
+    '''
+    Patient ids meeting a constraint in a window starting at start
+    '''
+    if not len(witnesses):
+        return []
+    met = witnesses['witness'].to_numpy(dtype=float) >= start
+    if 'violation' in witnesses:
+        met &= ~(witnesses['violation'].to_numpy(dtype=float) >= start)
+    return witnesses['patient_id'][met].tolist()
+
+
+class CriteriaState():
+    '''
+    Persisted witnesses and pending rows of the constraints of one cohort
+
+    Attributes
+    ----------
+    state_dir : str
+        Directory of the state
+    study_window : list
+        [start, end] in unix of the window the state was evaluated over, None
+        for a new state
+    constraints : dict
+        Constraint key -> description of the constraint and generation of its files
+    '''
+
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self.study_window = None
+        self.constraints = {}
+        self._updates = {}
+        path = os.path.join(state_dir, 'state.json')
+        if os.path.exists(path):
+            with open(path) as handle:
+                state = json.load(handle)
+            if state['format'] == STATE_FORMAT_VERSION:
+                self.study_window = state['study_window']
+                self.constraints = state['constraints']
+
+    def _path(self, key, generation, name):
+        return os.path.join(self.state_dir, key, str(generation), f'{name}.parquet')
+
+    def read(self, key):
+        '''
+        (witnesses, pending rows) of a constraint, None if it has no state
+        '''
+        if key not in self.constraints:
+            return None
+        generation = self.constraints[key]['generation']
+        witnesses = pd.read_parquet(self._path(key, generation, 'witnesses'))
+        pending = pd.read_parquet(self._path(key, generation, 'pending'))
+        return witnesses, pending
+
+    def update(self, key, description, witnesses, pending):
+        '''
+        Sets the state of a constraint, written by the next save
+        '''
+        self._updates[key] = (description, witnesses, pending)
+
+    def save(self, study_window, keys):
+        '''
+        Writes the updated constraints, records the window the state now covers
+        and drops the constraints not in keys
+        '''
+        constraints = {
+            key: self.constraints[key] for key in keys if key in self.constraints
+        }
+        for key, (description, witnesses, pending) in self._updates.items():
+            generation = self.constraints.get(key, {}).get('generation', 0) + 1
+            os.makedirs(os.path.dirname(self._path(key, generation, '')), exist_ok=True)
+            witnesses.reset_index(drop=True).to_parquet(
+                self._path(key, generation, 'witnesses'), index=False
+            )
+            pending.reset_index(drop=True).to_parquet(
+                self._path(key, generation, 'pending'), index=False
+            )
+            constraints[key] = dict(description, generation=generation)
+        path = os.path.join(self.state_dir, 'state.json')
+        with open(path + '.tmp', 'w') as handle:
+            json.dump(
+                {
+                    'format': STATE_FORMAT_VERSION,
+                    'study_window': list(study_window),
+                    'constraints': constraints,
+                },
+                handle,
+            )
+        os.replace(path + '.tmp', path)
+        # files of older generations and dropped constraints
+        for key in os.listdir(self.state_dir):
+            if not os.path.isdir(os.path.join(self.state_dir, key)):
+                continue
+            kept = str(constraints[key]['generation']) if key in constraints else None
+            for generation in os.listdir(os.path.join(self.state_dir, key)):
+                if generation != kept:
+                    shutil.rmtree(
+                        os.path.join(self.state_dir, key, generation),
+                        ignore_errors=True,
+                    )
+            if key not in constraints:
+                shutil.rmtree(os.path.join(self.state_dir, key), ignore_errors=True)
+        self.study_window = list(study_window)
+        self.constraints = constraints
+        self._updates = {}
+
+
+def refresh_criteria(clinical_cohort, state_dir, memory_limit=None, cache=None):
+    '''
+    Evaluates the variables of a clinical cohort into a CriteriaMatrix like
+    build_cohort_je.evaluate_criteria, incrementally: the per-constraint state
+    saved in state_dir by the previous refresh is extended with the rows of the
+    new part of the study window only. The first refresh, and a refresh whose
+    window starts or ends earlier than the saved one, evaluates the whole window
+
+    Parameters
+    ----------
+    clinical_cohort : Clinical Cohort object
+    state_dir : str
+        Directory of the saved state, created if needed
+    memory_limit : int, optional
+        Memory ceiling in bytes for each constraint's SDK pull
+    cache : DumpCache, optional
+        On-disk cache of SDK dumps
+    Returns
+    -------
+    CriteriaMatrix with one criterion per variable, equal to the one of
+    evaluate_criteria
+
+    '''
+    # build_cohort_je connects to the records backend when imported
+    import build_cohort_je as bcj
+
+    study_window = [
+        bcj.convert_to_unix(element) for element in clinical_cohort.study_window
+    ]
+    state = CriteriaState(state_dir)
+    df_from_constraint = {}
+    keys = []
+    for variable in clinical_cohort.clinical_variable:
+        for constraint_type, constraint in bcj.evaluated_constraints(variable):
+            fetch = bcj.constraint_fetch(variable, constraint, constraint_type)
+            links = bcj.constraint_links(variable, fetch)
+            key = constraint_key(fetch, links)
+            keys.append(key)
+            saved = state.read(key)
+            witnesses, pending = refresh_constraint(
+                fetch,
+                links,
+                saved,
+                state.study_window,
+                study_window,
+                memory_limit,
+                cache,
+            )
+            description = {
+                'variable': variable.name,
+                'type': constraint_type,
+                'constraint': constraint,
+            }
+            state.update(key, description, witnesses, pending)
+            patients = pd.DataFrame({'patient_id': met_by(witnesses, study_window[0])})
+            df_from_constraint.setdefault(variable.name, []).append(patients)
+    state.save(study_window, keys)
+    patient_index = PatientIndex()
+    patients_from_variable = [
+        patient_index.encode_frames(df_from_constraint.get(variable.name, []))
+        for variable in clinical_cohort.clinical_variable
+    ]
+    names = [variable.name for variable in clinical_cohort.clinical_variable]
+    return CriteriaMatrix(
+        patient_index, names, clinical_cohort.variable_category, patients_from_variable
+    )
+
+
+def refresh_constraint(
+    fetch, links, saved, previous_window, study_window, memory_limit=None, cache=None
+):
+    '''
+    Witnesses and pending rows of one constraint over study_window, from its
+    saved state over previous_window when study_window extends it
+
+    Returns
+    -------
+    (witnesses, pending rows) dataframes
+    '''
+    import build_cohort_je as bcj
+
+    extends = (
+        saved is not None
+        and study_window[0] >= previous_window[0]
+        and study_window[1] >= previous_window[1]
+    )
+    if extends:
+        witnesses, pending = saved
+        witnesses = witnesses[witnesses['witness'] >= study_window[0]]
+        pending = pending[pending['timestamp'] >= study_window[0]]
+        if study_window[1] == previous_window[1]:
+            return witnesses, pending
+        delta_window = [previous_window[1], study_window[1]]
+    else:
+        witnesses, pending = pd.DataFrame(), pd.DataFrame()
+        delta_window = study_window
+    columns = ['patient_id', 'timestamp'] if fetch.existence else None
+    chunks = bcj.fetch_chunks(
+        fetch.variable_name,
+        fetch.events,
+        fetch.event_criteria,
+        delta_window,
+        cache,
+        columns=columns,
+    )
+    if extends:
+        # rows at the previous end are already pending
+        chunks = (df[df['timestamp'] > previous_window[1]] for df in chunks)
+    if len(pending):
+        chunks = itertools.chain([pending], chunks)
+    horizon = study_window[1] - lookback(fetch)
+    tail = []
+
+    def keep_tail(chunks):
+        for df in chunks:
+            if lookback(fetch):
+                tail.append(df[df['timestamp'] >= horizon])
+            yield df
+
+    evaluate = witness_evaluator(fetch, links)
+    delta = evaluate_chunks(
+        keep_tail(chunks), evaluate, memory_limit=memory_limit, compact=False
+    )
+    tail = [df for df in tail if len(df)]
+    if tail:
+        pending = pd.concat(tail, ignore_index=True)
+    else:
+        pending = pd.DataFrame({'patient_id': [], 'timestamp': []})
+    return merge_witnesses(witnesses, delta), pending
+
+
+def refresh_cohort(clinical_cohort, state_dir, memory_limit=None, cache=None):
+    '''
+    Creates cohort from clinical cohort object incrementally (see refresh_criteria)
+
+    Returns
+    -------
+    cohort: list of patients that belong to the cohort, as
+    build_cohort_je.create_cohort
+
+    '''
+    return refresh_criteria(
+        clinical_cohort, state_dir, memory_limit=memory_limit, cache=cache
+    ).patients()
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+'''
+Streaming ingestion of SDK cohort dumps.
+
+Chunks returned by cohort.getDF() are buffered in a list (no per-chunk copy of
+the accumulated frame) and, once a memory ceiling is reached, spooled to disk
+as parquet files partitioned by a hash of patient_id. Every partition then
+holds complete patient groups and can be sorted and evaluated on its own.
+Partitions that outgrow the ceiling are hashed again into smaller ones before
+they are read, so peak memory is bounded by the ceiling plus one partition
+(or one patient larger than the ceiling). Buffered chunks are
+held as compact events (see event_frame), so the ceiling covers several times
+more rows.
+'''
+import glob
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+from event_frame import EventEncoder
+from stage_metrics import stage, patient_count
+
+# most sub-partitions an oversized partition is split into at once
+MAX_SPLIT_PARTITIONS = 1024
+
+
+def iter_chunks(cohort):
+    '''
+    Yields the chunks of a cohort on which initDump has been called
+    '''
+    while cohort.advanceDF():
+        yield cohort.getDF()  # Gets a new chunk each time called
+
+
+def frame_nbytes(df):
+    '''
+    Memory footprint of a dataframe in bytes, object columns included
+    '''
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def distinct_patients(chunks, key='patient_id'):
+    '''
+    Dataframe of the distinct patient ids of a stream of chunks, deduplicated
+    chunk by chunk so only the ids seen so far are held in memory
+    '''
+    patients = {}
+    for df in chunks:
+        if len(df):
+            patients.update(dict.fromkeys(df[key].unique()))
+    return pd.DataFrame({key: list(patients)})
+
+
+class ChunkSpool():
+    '''
+    Collects dataframe chunks under a memory ceiling.
+
+    Attributes
+    ----------
+    memory_limit : int or None
+        Bytes of buffered chunks allowed in memory before spilling to disk. None
+        keeps everything in memory
+    n_partitions : int
+        Number of patient hash partitions used once spilling starts. Partitions
+        over memory_limit are split further when they are read
+    spool_dir : str or None
+        Parent directory of the private directory holding the spilled parquet
+        files, which is created on first spill. None uses the system temp directory
+    n_rows : int
+        Total number of rows added
+    encoder : EventEncoder or None
+        Encodes chunks as they are added and decodes partitions for evaluation.
+        None holds chunks as they are
+    '''
+
+    def __init__(self, memory_limit=None, n_partitions=64, spool_dir=None, key='patient_id', encoder=None):
+        self.memory_limit = memory_limit
+        self.encoder = encoder
+        self.n_partitions = n_partitions
+        self.key = key
+        self.spool_dir = spool_dir
+        self.spilled = False
+        self.n_rows = 0
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._n_flushes = 0
+        self._n_splits = 0
+        self._part_rows = {}
+        self._spilled_rows = 0
+        self._spilled_bytes = 0
+        self._dir = None
+
+    def add(self, df):
+        '''
+        Adds a chunk, spilling the buffer to disk if the memory ceiling is exceeded
+        '''
+        if not len(df):
+            return
+        if self.encoder is not None:
+            df = self.encoder.encode(df)
+        self._buffer.append(df)
+        self.n_rows += len(df)
+        if self.memory_limit is None:
+            return
+        self._buffer_bytes += frame_nbytes(df)
+        if self._buffer_bytes > self.memory_limit:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        if self._dir is None:
+            if self.spool_dir is not None:
+                os.makedirs(self.spool_dir, exist_ok=True)
+            self._dir = tempfile.mkdtemp(prefix='cohort_spool_', dir=self.spool_dir)
+        df = pd.concat(self._buffer, ignore_index=True)
+        for part, part_df in df.groupby(self._hash(df, 0) % self.n_partitions, sort=False):
+            part_df.to_parquet(os.path.join(self._dir, f'part-{part:05d}-{self._n_flushes:05d}.parquet'), index=False)
+            self._part_rows[part] = self._part_rows.get(part, 0) + len(part_df)
+        self._spilled_rows += len(df)
+        self._spilled_bytes += self._buffer_bytes
+        self._n_flushes += 1
+        self.spilled = True
+        self._buffer = []
+        self._buffer_bytes = 0
+
+    def partitions(self):
+        '''
+        Yields dataframes that each contain every row of the patients they hold.
+        Without a spill this is a single dataframe of everything added. With an
+        encoder they are its evaluation view (see EventEncoder.decode)
+        '''
+        for df in self._partitions():
+            yield df if self.encoder is None else self.encoder.decode(df)
+
+    def _partitions(self):
+        if not self.spilled:
+            if self._buffer:
+                yield pd.concat(self._buffer, ignore_index=True)
+            return
+        self._flush()
+        for part in range(self.n_partitions):
+            files = sorted(glob.glob(os.path.join(self._dir, f'part-{part:05d}-*.parquet')))
+            if files:
+                yield from self._read(files, self._part_rows[part], 0)
+
+    def _hash(self, df, level):
+        # each level of splitting hashes the previous level's hash again, so
+        # patients that shared a partition are spread over the sub-partitions
+        hashed = pd.util.hash_pandas_object(df[self.key], index=False).to_numpy()
+        for ii in range(level):
+            hashed = pd.util.hash_array(hashed)
+        return hashed
+
+    def _single_patient(self, files):
+        patients = set()
+        for path in files:
+            patients.update(pd.read_parquet(path, columns=[self.key])[self.key].unique())
+            if len(patients) > 1:
+                return False
+        return True
+
+    def _read(self, files, n_rows, level):
+        '''
+        Yields the rows of the spilled files of one partition. A partition over
+        memory_limit (at the average size of the spilled rows) is hashed again,
+        file by file, into enough sub-partitions to fit, which are read in turn
+        '''
+        max_rows = max(int(self.memory_limit * self._spilled_rows / max(self._spilled_bytes, 1)), 1)
+        if n_rows <= max_rows or self._single_patient(files):
+            # the rows of a single patient cannot be split
+            yield pd.concat([pd.read_parquet(path) for path in files], ignore_index=True)
+            return
+        level += 1
+        n_parts = min(2 * -(-n_rows // max_rows), MAX_SPLIT_PARTITIONS)
+        split = self._n_splits
+        self._n_splits += 1
+        sub_files = {}
+        sub_rows = {}
+        for path in files:
+            df = pd.read_parquet(path)
+            for part, part_df in df.groupby(self._hash(df, level) % n_parts, sort=False):
+                sub_path = os.path.join(self._dir, f'split-{split:05d}-{part:05d}-{len(sub_files.get(part, [])):05d}.parquet')
+                part_df.to_parquet(sub_path, index=False)
+                sub_files.setdefault(part, []).append(sub_path)
+                sub_rows[part] = sub_rows.get(part, 0) + len(part_df)
+            os.remove(path)
+        for part in sorted(sub_files):
+            yield from self._read(sub_files[part], sub_rows[part], level)
+
+    def close(self):
+        '''
+        Drops buffered chunks and removes spilled files
+        '''
+        self._buffer = []
+        if self._dir is not None:
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def complete_patient_groups(chunks, key='patient_id'):
+    '''
+    Re-chunks a stream that is already ordered by patient so that every yielded
+    dataframe holds complete patient groups. The rows of the last patient of a
+    chunk are carried over until a chunk starting with another patient arrives.
+    '''
+    carry = None
+    for df in chunks:
+        if not len(df):
+            continue
+        if carry is not None:
+            df = pd.concat([carry, df], ignore_index=True)
+        last_patient = df[key].iloc[-1]
+        tail = (df[key] == last_patient).to_numpy()
+        carry = df[tail]
+        if (~tail).any():
+            yield df[~tail]
+    if carry is not None:
+        yield carry
+
+
+def sort_and_evaluate(df, evaluate, **fields):
+    '''
+    Sorts a partition by patient and timestamp and evaluates it, reported as
+    the sort and evaluate stages (see stage_metrics)
+    '''
+    with stage('sort', **fields) as counts:
+        df = df.sort_values(by=['patient_id', 'timestamp'])
+        if counts is not None:
+            counts['rows'] = len(df)
+    with stage('evaluate', **fields) as counts:
+        result = evaluate(df)
+        if counts is not None:
+            counts.update(rows=len(df), rows_out=len(result), patients=patient_count(result))
+    return result
+
+
+def evaluate_chunks(chunks, evaluate, memory_limit=None, patient_sorted=False, spool_dir=None, n_partitions=64, compact=True, variable=None):
+    '''
+    Streams chunks through a constraint evaluator with bounded memory
+
+    Parameters
+    ----------
+    chunks : iterable of dataframes
+        Chunks as returned by iter_chunks
+    evaluate : function
+        Takes a dataframe sorted by ['patient_id','timestamp'] holding complete
+        patient groups and returns the rows of the patients that satisfy the constraint
+    memory_limit : int, optional
+        Ceiling in bytes for buffered chunks before spilling to disk
+    patient_sorted : boolean, optional
+        True if the chunks arrive ordered by patient_id. Groups are then evaluated
+        as soon as they are complete and nothing is spilled
+    spool_dir : str, optional
+        Parent directory to spill into. Spilled files are removed afterwards
+    n_partitions : int, optional
+        Number of patient hash partitions when spilling
+    compact : boolean, optional
+        True buffers and evaluates chunks as compact events (see event_frame).
+        Returned rows then have categorical id columns and absolute timestamps
+    variable : str, optional
+        Variable the stage metrics of the evaluation are reported under
+
+    Returns
+    -------
+    Dataframe of the rows returned by evaluate for every partition
+    '''
+    results = []
+    if patient_sorted:
+        for df in complete_patient_groups(chunks):
+            results.append(sort_and_evaluate(df, evaluate, variable=variable))
+    else:
+        encoder = EventEncoder() if compact else None
+        with ChunkSpool(memory_limit, n_partitions, spool_dir, encoder=encoder) as spool:
+            for df in chunks:
+                spool.add(df)
+            for df in spool.partitions():
+                result = sort_and_evaluate(df, evaluate, variable=variable)
+                results.append(result if encoder is None else encoder.restore(result))
+    results = [df for df in results if len(df)]
+    if not results:
+        return pd.DataFrame()
+    return pd.concat(results)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+'''
+Local stand-in for nferx_sdk's RecordsAPIWrapper backed by parquet files.
+
+Implements the part of the SDK used by the cohort builders (makeCohort,
+initDump, advanceDF, getDF and getDiagnosticCodesFromDisease) together with
+inQuery, andQuery, orQuery and rangeQuery (plus prefixQuery for code stems, see
+codesets, dataVersion for constraint_memo and countCohort for cost_estimator), so
+cohorts can be built, profiled and load tested offline. A records directory holds:
+
+    <records_dir>/events/*.parquet    one row per event (see synthetic_ehr)
+    <records_dir>/diseases.json       {disease name: [diagnosis codes]}
+
+build_cohort_je uses this backend instead of the SDK when the
+LOCAL_RECORDS_DIR environment variable points at such a directory.
+'''
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+__all__ = ['LocalRecordsAPIWrapper', 'LocalCohort', 'inQuery', 'prefixQuery', 'andQuery', 'orQuery', 'rangeQuery']
+
+
+class inQuery():
+    '''
+    Rows whose field (or any of a list of fields) is one of values
+    '''
+
+    def __init__(self, field, values):
+        self.fields = list(field) if isinstance(field, (list, tuple)) else [field]
+        self.values = list(values)
+
+    def columns(self):
+        return set(self.fields)
+
+    def mask(self, df):
+        mask = np.zeros(len(df), dtype=bool)
+        for field in self.fields:
+            if field in df:
+                mask |= np.asarray(df[field].isin(self.values))
+        return mask
+
+
+class prefixQuery():
+    '''
+    Rows whose field starts with one of prefixes
+    '''
+
+    def __init__(self, field, prefixes):
+        self.field = field
+        self.prefixes = tuple(prefixes)
+
+    def columns(self):
+        return {self.field}
+
+    def mask(self, df):
+        if self.field not in df:
+            return np.zeros(len(df), dtype=bool)
+        codes, uniques = pd.factorize(df[self.field])
+        hit = np.append(np.asarray(pd.Index(uniques, dtype=object).astype(str).str.startswith(self.prefixes), dtype=bool), False)
+        return hit[codes]
+
+
+class rangeQuery():
+    '''
+    Rows whose field lies in [start, end]
+    '''
+
+    def __init__(self, field, start, end):
+        self.field = field
+        self.start = start
+        self.end = end
+
+    def columns(self):
+        return {self.field}
+
+    def mask(self, df):
+        values = df[self.field]
+        return np.asarray((values >= self.start) & (values <= self.end))
+
+
+class andQuery():
+    '''
+    Rows matching every sub query
+    '''
+
+    def __init__(self, *queries):
+        self.queries = queries
+
+    def columns(self):
+        return set().union(*[query.columns() for query in self.queries])
+
+    def mask(self, df):
+        return np.logical_and.reduce([query.mask(df) for query in self.queries])
+
+
+class orQuery(andQuery):
+    '''
+    Rows matching any sub query
+    '''
+
+    def mask(self, df):
+        return np.logical_or.reduce([query.mask(df) for query in self.queries])
+
+
+class LocalCohort():
+    '''
+    Cohort returned by LocalRecordsAPIWrapper.makeCohort. Streams the matching
+    rows of the event files in chunks of at most chunk_size rows
+    '''
+
+    def __init__(self, name, files, query, chunk_size):
+        self.name = name
+        self.files = files
+        self.query = query
+        self.chunk_size = chunk_size
+        self.projector = None
+        self._batches = None
+        self._pending = []
+        self._df = None
+
+    def initDump(self, cohortProjector):
+        self.projector = list(cohortProjector)
+        self._batches = self._iter_batches()
+        self._pending = []
+        self._df = None
+
+    def _iter_batches(self):
+        for path in self.files:
+            parquet_file = pq.ParquetFile(path)
+            available = set(parquet_file.schema_arrow.names)
+            columns = [column for column in set(self.projector) | self.query.columns() if column in available]
+            for batch in parquet_file.iter_batches(batch_size=self.chunk_size, columns=columns):
+                df = batch.to_pandas()
+                df = df[self.query.mask(df)]
+                if len(df):
+                    yield df.reindex(columns=self.projector)
+
+    def advanceDF(self):
+        '''
+        Moves to the next chunk. Returns False once every row has been returned
+        '''
+        if self._batches is None:
+            raise RuntimeError('initDump must be called before advanceDF')
+        n_rows = sum(len(df) for df in self._pending)
+        for df in self._batches:
+            self._pending.append(df)
+            n_rows += len(df)
+            if n_rows >= self.chunk_size:
+                break
+        if not n_rows:
+            self._df = None
+            return False
+        df = pd.concat(self._pending, ignore_index=True)
+        self._df = df.iloc[:self.chunk_size]
+        self._pending = [df.iloc[self.chunk_size:]] if len(df) > self.chunk_size else []
+        return True
+
+    def getDF(self):
+        return self._df
+
+
+class LocalRecordsAPIWrapper():
+    '''
+    Parquet backed drop-in for RecordsAPIWrapper
+
+    Attributes
+    ----------
+    records_dir : str
+        Directory with events/*.parquet and diseases.json
+    chunk_size : int
+        Maximum number of rows returned by each getDF call
+    '''
+
+    def __init__(self, records_dir, chunk_size=100000):
+        self.records_dir = records_dir
+        self.chunk_size = chunk_size
+        self.files = sorted(glob.glob(os.path.join(records_dir, 'events', '*.parquet')))
+
+    def clone(self):
+        '''
+        New wrapper over the same records, for use by another thread
+        '''
+        return LocalRecordsAPIWrapper(self.records_dir, self.chunk_size)
+
+    def makeCohort(self, cohortName, cohortSpecifier=None, timeWindow=None, unit=None):
+        '''
+        Returns a LocalCohort over the rows matching cohortSpecifier. timeWindow and
+        unit are accepted for compatibility; restrict time with rangeQuery instead
+        '''
+        return LocalCohort(cohortName, self.files, cohortSpecifier, self.chunk_size)
+
+    def countCohort(self, cohortSpecifier):
+        '''
+        Rows and distinct patients matching cohortSpecifier, reading only the
+        columns of the query
+
+        Returns
+        -------
+        dict with rows and patients
+        '''
+        n_rows = 0
+        patients = set()
+        for path in self.files:
+            parquet_file = pq.ParquetFile(path)
+            available = set(parquet_file.schema_arrow.names)
+            columns = [column for column in cohortSpecifier.columns() | {'patient_id'} if column in available]
+            for batch in parquet_file.iter_batches(batch_size=self.chunk_size, columns=columns):
+                df = batch.to_pandas()
+                matched = df['patient_id'][cohortSpecifier.mask(df)]
+                n_rows += len(matched)
+                patients.update(matched.unique())
+        return {'rows': n_rows, 'patients': len(patients)}
+
+    def getDiagnosticCodesFromDisease(self, disease):
+        '''
+        Diagnosis codes of a disease listed in diseases.json
+        '''
+        path = os.path.join(self.records_dir, 'diseases.json')
+        if not os.path.exists(path):
+            return []
+        with open(path) as handle:
+            return list(json.load(handle).get(disease, []))
+
+    def dataVersion(self):
+        '''
+        Version of the records: a digest of the name, size and modification time
+        of every event file, which changes whenever the extract is rewritten
+        '''
+        digest = hashlib.sha256()
+        for path in sorted(glob.glob(os.path.join(self.records_dir, 'events', '*.parquet'))):
+            stat = os.stat(path)
+            digest.update(f'{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns};'.encode('utf-8'))
+        return digest.hexdigest()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+'''
+Patient set algebra for cohort building.
+
+Patient IDs are interned once into dense int32 codes by a PatientIndex, and
+cohort membership is held as a PatientSet of sorted unique codes. AND, OR and
+ANDNOT are merge operations on those arrays; unions and differences over many
+sets go through a boolean bitmap the size of the index. IDs are only
+materialised again by PatientIndex.decode at the end of a build.
+'''
+import numpy as np
+import pandas as pd
+
+
+class PatientSet():
+    '''
+    Sorted unique patient codes of one PatientIndex
+
+    Attributes
+    ----------
+    codes : numpy array of int32
+        Sorted unique codes
+    '''
+
+    def __init__(self, codes=None):
+        self.codes = np.empty(0, dtype=np.int32) if codes is None else codes
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __and__(self, other):
+        return PatientSet(np.intersect1d(self.codes, other.codes, assume_unique=True))
+
+    def __or__(self, other):
+        return PatientSet(np.union1d(self.codes, other.codes).astype(np.int32, copy=False))
+
+    def __sub__(self, other):
+        return PatientSet(self.codes[~np.isin(self.codes, other.codes, assume_unique=True)])
+
+    def __eq__(self, other):
+        return isinstance(other, PatientSet) and np.array_equal(self.codes, other.codes)
+
+    def __repr__(self):
+        return f'PatientSet({len(self)} patients)'
+
+
+class PatientIndex():
+    '''
+    Interns patient IDs into dense integer codes, in order of first appearance
+    '''
+
+    def __init__(self):
+        self._ids = pd.Index([], dtype=object)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def encode(self, ids):
+        '''
+        PatientSet of an iterable or series of patient IDs, interning unseen IDs
+        '''
+        ids = pd.unique(ids.to_numpy(dtype=object) if isinstance(ids, pd.Series) else np.asarray(list(ids), dtype=object))
+        codes = self._ids.get_indexer(ids)
+        new = codes < 0
+        if new.any():
+            start = len(self._ids)
+            self._ids = self._ids.append(pd.Index(ids[new], dtype=object))
+            codes[new] = np.arange(start, len(self._ids))
+        return PatientSet(np.sort(codes).astype(np.int32))
+
+    def encode_frames(self, dfs):
+        '''
+        PatientSet of the patients in any of a list of dataframes. Empty
+        dataframes (which may have no patient_id column) are skipped
+        '''
+        dfs = [df['patient_id'] for df in dfs if len(df)]
+        if not dfs:
+            return PatientSet()
+        return self.encode(pd.concat(dfs, ignore_index=True))
+
+    def decode(self, patient_set):
+        '''
+        Patient IDs of a PatientSet, in code order
+        '''
+        return self._ids.take(patient_set.codes).tolist()
+
+
+def union_all(patient_sets, universe):
+    '''
+    OR of many PatientSets through a bitmap of universe codes
+    '''
+    patient_sets = list(patient_sets)
+    if len(patient_sets) == 1:
+        return patient_sets[0]
+    bitmap = np.zeros(universe, dtype=bool)
+    for patient_set in patient_sets:
+        bitmap[patient_set.codes] = True
+    return PatientSet(np.flatnonzero(bitmap).astype(np.int32))
+
+
+def intersect_all(patient_sets, universe=None):
+    '''
+    AND of many PatientSets, smallest first so every step shrinks the result.
+    With universe, each step is a bitmap lookup instead of a merge
+    '''
+    patient_sets = sorted(patient_sets, key=len)
+    if not patient_sets:
+        return PatientSet()
+    result = patient_sets[0]
+    for patient_set in patient_sets[1:]:
+        if not len(result):
+            break
+        if universe is None:
+            result = result & patient_set
+        else:
+            bitmap = np.zeros(universe, dtype=bool)
+            bitmap[patient_set.codes] = True
+            result = PatientSet(result.codes[bitmap[result.codes]])
+    return result
+
+
+def combine(inclusion_or=(), inclusion_and=(), exclusion=(), universe=0):
+    '''
+    (OR of inclusion_or) AND (every inclusion_and) ANDNOT (OR of exclusion).
+    Without inclusion_or the cohort is seeded by the inclusion_and sets alone;
+    without any inclusion set it is empty.
+
+    Parameters
+    ----------
+    inclusion_or, inclusion_and, exclusion : lists of PatientSet
+    universe : int
+        Number of codes of the PatientIndex the sets belong to
+
+    Returns
+    -------
+    PatientSet
+    '''
+    inclusion_and = list(inclusion_and)
+    if inclusion_or:
+        inclusion_and = [union_all(inclusion_or, universe)] + inclusion_and
+    cohort = intersect_all(inclusion_and, universe)
+    exclusion = [patient_set for patient_set in exclusion if len(patient_set)]
+    if not len(cohort) or not exclusion:
+        return cohort
+    excluded = np.zeros(universe, dtype=bool)
+    for patient_set in exclusion:
+        excluded[patient_set.codes] = True
+    return PatientSet(cohort.codes[~excluded[cohort.codes]])
@@ -0,0 +1,2 @@
+"""Cohort building pipeline."""
+from .pipeline import create_pipeline  # NOQA
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+'''
+Nodes of the cohort pipeline.
+
+Each evaluated constraint of a variable is one node fetching and evaluating it
+over the study window of the cohort parameters and returning its distinct
+patients. The patients of a variable are the union of those of its constraints;
+inclusion is the intersection of the inclusion variables, exclusion the union of
+the exclusion variables and the cohort their difference (see
+patient_sets.combine). Every node returns a dataframe with a single patient_id
+column, so each output persists as a parquet dataset.
+
+The nodes take plain, picklable arguments (variables are bound with
+functools.partial by pipeline.create_pipeline) so they run in the worker
+processes of ParallelRunner as well as under ThreadRunner.
+'''
+import functools
+
+import pandas as pd
+
+from cohorts import ClinicalCohort
+from dump_cache import DumpCache
+
+# category of each seltorexant variable; the other variables are exclusions
+SELTOREXANT_INCLUSION = ['mdd inclusion', 'ssri_snri']
+
+
+def seltorexant_cohort(study_window=None):
+    '''
+    ClinicalCohort of the seltorexant diagnosis and medication variables
+    '''
+    from clincial_research_workflow.seltorexant_variables.diagnosis_variables import diagnosis_variables
+    from clincial_research_workflow.seltorexant_variables.medication_variables import meds_variables
+    cohort = ClinicalCohort('seltorexant', study_window)
+    for variable in diagnosis_variables + meds_variables:
+        cohort.add_clinical_variable(variable, 'inclusion' if variable.name in SELTOREXANT_INCLUSION else 'exclusion')
+    return cohort
+
+
+def patient_frame(patient_ids):
+    '''
+    Dataframe of sorted distinct patient ids
+    '''
+    return pd.DataFrame({'patient_id': pd.Series(sorted(set(patient_ids)), dtype=object)})
+
+
+def evaluate_constraint(variable, constraint_type, constraint, cohort):
+    '''
+    Distinct patients meeting one constraint of a variable
+
+    Parameters
+    ----------
+    variable : ClinicalVariable
+        Variable of the constraint
+    constraint_type : str
+        'count', 'time', 'threshold' or 'only_one'
+    constraint : list
+        Constraint as held in variable.constraint
+    cohort : dict
+        Cohort parameters: study_window as [YYYYMMDD,YYYYMMDD], and optionally
+        memory_limit in bytes and cache_dir of a DumpCache
+    Returns
+    -------
+    dataframe of patient_id
+    '''
+    import build_cohort_je as bcj
+    study_window = [bcj.convert_to_unix(element) for element in cohort['study_window']]
+    cache = DumpCache(cohort['cache_dir']) if cohort.get('cache_dir') else None
+    df = bcj.create_query_from_constraint(variable.name, variable, constraint, constraint_type, study_window, memory_limit=cohort.get('memory_limit'), cache=cache)
+    return patient_frame(df['patient_id'] if len(df) else [])
+
+
+def union_patients(*dfs):
+    '''
+    Patients in any of the dataframes
+    '''
+    return patient_frame(patient_id for df in dfs for patient_id in df['patient_id'])
+
+
+def intersect_patients(*dfs):
+    '''
+    Patients in all of the dataframes, none without dataframes
+    '''
+    if not dfs:
+        return patient_frame([])
+    return patient_frame(functools.reduce(set.intersection, (set(df['patient_id']) for df in dfs)))
+
+
+def subtract_patients(inclusion, exclusion):
+    '''
+    Patients of inclusion not in exclusion
+    '''
+    return patient_frame(set(inclusion['patient_id']) - set(exclusion['patient_id']))
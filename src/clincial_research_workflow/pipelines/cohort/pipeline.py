@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+'''
+Cohort pipeline: one node per evaluated constraint, one per variable and the set
+algebra of inclusion, exclusion and the cohort.
+
+    <variable>_constraint_<n>   data/02_intermediate  patients of a constraint
+    <variable>_patients         data/02_intermediate  union over its constraints
+    inclusion_patients          data/03_primary       intersection of inclusions
+    exclusion_patients          data/03_primary       union of exclusions
+    cohort_patients             data/03_primary       inclusion - exclusion
+
+Constraint nodes only depend on the cohort parameters, so all of them run
+concurrently under ParallelRunner or ThreadRunner:
+
+    kedro run --pipeline cohort --runner ParallelRunner
+'''
+import re
+from functools import partial
+
+from kedro.pipeline import Pipeline, node
+
+from .nodes import evaluate_constraint, intersect_patients, seltorexant_cohort, subtract_patients, union_patients
+
+INTERMEDIATE_DIR = 'data/02_intermediate'
+PRIMARY_DIR = 'data/03_primary'
+PRIMARY_DATASETS = ['inclusion_patients', 'exclusion_patients', 'cohort_patients']
+
+
+def dataset_slug(name):
+    '''
+    Dataset name prefix of a variable name, e.g. 'mdd_inclusion'
+    '''
+    return re.sub(r'[^0-9a-z]+', '_', name.lower()).strip('_')
+
+
+def dataset_filepath(name):
+    '''
+    Parquet filepath of an output of the cohort pipeline, None for any other
+    dataset name
+    '''
+    if name in PRIMARY_DATASETS:
+        return f'{PRIMARY_DIR}/{name}.parquet'
+    if re.fullmatch(r'[0-9a-z_]+_(constraint_[0-9]+|patients)', name):
+        return f'{INTERMEDIATE_DIR}/{name}.parquet'
+    return None
+
+
+def cohort_datasets(clinical_cohort=None):
+    '''
+    Dataset name -> parquet filepath of every output of the cohort pipeline
+    '''
+    import build_cohort_je as bcj
+    clinical_cohort = seltorexant_cohort() if clinical_cohort is None else clinical_cohort
+    names = []
+    for variable in clinical_cohort.clinical_variable:
+        slug = dataset_slug(variable.name)
+        names += [f'{slug}_constraint_{ii}' for ii, _ in enumerate(bcj.evaluated_constraints(variable))]
+        names.append(f'{slug}_patients')
+    return {name: dataset_filepath(name) for name in names + PRIMARY_DATASETS}
+
+
+def create_pipeline(clinical_cohort=None, **kwargs):
+    '''
+    Pipeline building a clinical cohort, the seltorexant cohort by default.
+    The study window and fetch options are read from the cohort parameters
+    '''
+    import build_cohort_je as bcj
+    clinical_cohort = seltorexant_cohort() if clinical_cohort is None else clinical_cohort
+    nodes = []
+    patients = {'inclusion': [], 'exclusion': []}
+    for variable, category in zip(clinical_cohort.clinical_variable, clinical_cohort.variable_category):
+        slug = dataset_slug(variable.name)
+        constraint_outputs = []
+        for ii, (constraint_type, constraint) in enumerate(bcj.evaluated_constraints(variable)):
+            constraint_outputs.append(f'{slug}_constraint_{ii}')
+            nodes.append(node(
+                partial(evaluate_constraint, variable, constraint_type, constraint),
+                'params:cohort',
+                constraint_outputs[-1],
+                name=f'evaluate_{slug}_constraint_{ii}',
+            ))
+        nodes.append(node(union_patients, constraint_outputs, f'{slug}_patients', name=f'{slug}_patients'))
+        if category in patients:
+            patients[category].append(f'{slug}_patients')
+    nodes += [
+        node(intersect_patients, patients['inclusion'] or None, 'inclusion_patients', name='inclusion_patients'),
+        node(union_patients, patients['exclusion'] or None, 'exclusion_patients', name='exclusion_patients'),
+        node(subtract_patients, ['inclusion_patients', 'exclusion_patients'], 'cohort_patients', name='cohort_patients'),
+    ]
+    return Pipeline(nodes)
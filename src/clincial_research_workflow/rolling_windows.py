@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+'''
+Rolling-window evaluation of 'only_one' constraints.
+
+An only_one constraint [interval_days, values] (e.g. [30, ssri_snri]) is met by
+a patient with at least one event of values in the study window who never has
+two different values within interval_days of each other, i.e. every window of
+interval_days holds at most one distinct value.
+
+Events are held as flat arrays sorted by (patient, timestamp). The bounds of the
+trailing window of every event are found with searchsorted probes, and both
+bounds only move forward, so the distinct values of each window are counted by
+a two-pointer scan keeping the count of every value in the window and the
+number of values with a non-zero count, O(n + d) for n events and d distinct
+values. The patient-level test only needs adjacent events: the
+closest pair of different values within the interval is always adjacent in
+the sorted stream, so a patient violates the constraint exactly when two
+adjacent events of different values are at most interval_days apart, O(n).
+'''
+import numpy as np
+import pandas as pd
+
+from codesets import code_mask
+from temporal_kernel import days_to_seconds
+
+
+def window_bounds(patient_codes, timestamps, interval):
+    '''
+    [start, stop) indices of the events of the same patient within
+    [timestamp - interval, timestamp] of every event of arrays sorted by
+    (patient, timestamp). Events sharing the timestamp are in the window
+    '''
+    grid = np.unique(timestamps)
+    stride = len(grid) + 1
+    patient = patient_codes.astype(np.int64) * stride
+    key = patient + np.searchsorted(grid, timestamps, side='left')
+    starts = np.searchsorted(key, patient + np.searchsorted(grid, timestamps - interval, side='left'), side='left')
+    stops = np.searchsorted(key, key, side='right')
+    return starts, stops
+
+
+def distinct_in_window(patient_codes, timestamps, value_codes, interval):
+    '''
+    Number of distinct values among the events of the same patient within
+    [timestamp - interval, timestamp] of every event
+
+    Parameters
+    ----------
+    patient_codes, timestamps : numpy arrays
+        Patient code and timestamp of every event, sorted by (patient, timestamp)
+    value_codes : numpy array of int
+        Dense code of the value of every event
+    interval : number
+        Window length in the unit of timestamps
+
+    Returns
+    -------
+    numpy array of int
+    '''
+    starts, stops = window_bounds(patient_codes, timestamps, interval)
+    values = value_codes.tolist()
+    in_window = [0] * (max(values) + 1 if values else 0)
+    counts = np.zeros(len(values), dtype=np.int64)
+    distinct = 0
+    start = stop = 0
+    for ii, (window_start, window_stop) in enumerate(zip(starts.tolist(), stops.tolist())):
+        while stop < window_stop:
+            distinct += in_window[values[stop]] == 0
+            in_window[values[stop]] += 1
+            stop += 1
+        while start < window_start:
+            in_window[values[start]] -= 1
+            distinct -= in_window[values[start]] == 0
+            start += 1
+        counts[ii] = distinct
+    return counts
+
+
+def violating_patients(patient_codes, timestamps, value_codes, interval):
+    '''
+    Boolean array over the events marking the patients (on every one of their
+    events) with two different values at most interval apart
+    '''
+    adjacent = (
+        (patient_codes[1:] == patient_codes[:-1])
+        & (value_codes[1:] != value_codes[:-1])
+        & (timestamps[1:] - timestamps[:-1] <= interval)
+    )
+    violating = np.zeros(patient_codes.max() + 1 if len(patient_codes) else 0, dtype=bool)
+    violating[patient_codes[1:][adjacent]] = True
+    return violating[patient_codes]
+
+
+def evaluate_only_one(sorted_df, col_head, values, interval_days, event_level=False):
+    '''
+    Evaluates an only_one constraint over every patient at once
+
+    Parameters
+    ----------
+    sorted_df : dataframe
+        Rows sorted by ['patient_id','timestamp']
+    col_head : str
+        Column holding the values ("meds_drugs", "diagnosis_code", ...)
+    values : list
+        Values of the subvariable, at most one of which may occur per interval
+    interval_days : int
+        Interval in days
+    event_level : boolean, optional
+        False returns the rows of the patients meeting the constraint. True
+        returns every event of values with the number of distinct values in its
+        trailing interval as the column 'distinct_in_window'
+
+    Returns
+    -------
+    Dataframe
+    '''
+    if not len(sorted_df):
+        return pd.DataFrame()
+    events = sorted_df[code_mask(sorted_df, col_head, values)]
+    if not len(events):
+        return pd.DataFrame()
+    patient_codes, _ = pd.factorize(events['patient_id'])
+    timestamps = np.asarray(events['timestamp'])
+    timestamps = timestamps.astype(np.promote_types(timestamps.dtype, np.int64), copy=False)
+    value_codes, _ = pd.factorize(events[col_head])
+    interval = days_to_seconds(interval_days)
+    if event_level:
+        return events.assign(distinct_in_window=distinct_in_window(patient_codes, timestamps, value_codes, interval))
+    violating = violating_patients(patient_codes, timestamps, value_codes, interval)
+    included = events['patient_id'][~violating].unique()
+    if not len(included):
+        return pd.DataFrame()
+    return sorted_df[sorted_df['patient_id'].isin(included)]
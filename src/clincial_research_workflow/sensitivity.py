@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+'''
+Sensitivity sweeps over the gap parameters of a constraint.
+
+For a fixed min_gap, whether an anchor event t of a patient matches reduces to
+one distance in seconds (see temporal_kernel):
+
+    count       distance to the nearest event further than min_gap from t,
+                0 (the anchor itself) when min_gap <= 0
+    time        distance to the first dependee event after t + min_gap, or
+                at or after t when min_gap <= 0
+
+and the anchor matches every max_gap != 0 at least that distance. The smallest
+distance of each patient is therefore the smallest max_gap the patient is
+included at, so the patients of every max_gap follow from one sort of the
+distances and a searchsorted of the max_gaps. Each min_gap is one vectorized
+pass over the anchors of all patients.
+
+As in is_included_not_order, the further occurrences of a count may all be the
+same event, so every count of two or more includes the same patients. A count
+of one or less includes every patient with an event, whatever the gaps.
+'''
+import numpy as np
+import pandas as pd
+
+from temporal_kernel import days_to_seconds
+
+
+def match_distances(event_arrays, constraint_type, min_gap):
+    '''
+    Smallest match distance in seconds of every patient for min_gap
+
+    Parameters
+    ----------
+    event_arrays : list of EventArrays
+        The codes of a count constraint, or the dependent and dependee codes of
+        a time constraint (see temporal_kernel.event_arrays_of)
+    constraint_type : str
+        'count' or 'time'
+    min_gap : int
+        Minimum gap in days
+
+    Returns
+    -------
+    numpy float array with one entry per patient code, inf for none
+    '''
+    anchors = event_arrays[0]
+    distances = np.full(len(anchors.n_rows), np.inf)
+    patient, timestamp = anchors.patient, anchors.timestamp
+    if constraint_type == 'time':
+        dependee = event_arrays[1]
+        if not len(patient) or not len(dependee.timestamp):
+            return distances
+        if min_gap > 0:
+            idx = dependee.first_at_or_after(patient, timestamp + days_to_seconds(min_gap), True)
+        else:
+            idx = dependee.first_at_or_after(patient, timestamp, False)
+        found = idx < dependee.offsets[patient + 1]
+        distance = dependee.timestamp[np.minimum(idx, len(dependee.timestamp) - 1)] - timestamp
+    elif min_gap <= 0:
+        found = np.ones(len(patient), dtype=bool)
+        distance = np.zeros(len(patient))
+    else:
+        gap = days_to_seconds(min_gap)
+        after = anchors.first_at_or_after(patient, timestamp + gap, True)
+        before = anchors.first_at_or_after(patient, timestamp - gap, False) - 1
+        last = max(len(timestamp) - 1, 0)
+        distance = np.minimum(
+            np.where(after < anchors.offsets[patient + 1], anchors.timestamp[np.minimum(after, last)] - timestamp, np.inf),
+            np.where(before >= anchors.offsets[patient], timestamp - anchors.timestamp[np.maximum(before, 0)], np.inf),
+        )
+        found = np.isfinite(distance)
+    np.minimum.at(distances, patient[found], distance[found].astype(float))
+    return distances
+
+
+def existence_distances(event_arrays):
+    '''
+    Distances of a count of one or less: -inf (any max_gap) for every patient
+    with an event, inf for the others
+    '''
+    return np.where(event_arrays[0].n_rows > 0, -np.inf, np.inf)
+
+
+def count_within(distances, max_gaps):
+    '''
+    Number of distances included by each max_gap in days: those of at most
+    max_gap, and only gapless ones (-inf) for a max_gap of 0
+    '''
+    bounds = np.array([days_to_seconds(max_gap) if max_gap != 0 else -np.inf for max_gap in max_gaps], dtype=float)
+    return np.searchsorted(np.sort(np.asarray(distances, dtype=float)), bounds, side='right')
+
+
+def sweep_distances(event_arrays, constraint_type, counts, min_gaps):
+    '''
+    Distances of every patient for each (count, min_gap), computed once per
+    distinct min_gap. counts is ignored for time constraints
+
+    Returns
+    -------
+    dict of (count, min_gap) -> numpy float array, count None for time constraints
+    '''
+    counts = [None] if constraint_type == 'time' else counts
+    by_min_gap = {}
+    distances = {}
+    for count in counts:
+        for min_gap in min_gaps:
+            if count is not None and count <= 1:
+                distances[count, min_gap] = existence_distances(event_arrays)
+                continue
+            if min_gap not in by_min_gap:
+                by_min_gap[min_gap] = match_distances(event_arrays, constraint_type, min_gap)
+            distances[count, min_gap] = by_min_gap[min_gap]
+    return distances
+
+
+def sweep_table(distances, max_gaps, base=0, sign=1):
+    '''
+    Table of the cohort size for every (count, min_gap, max_gap)
+
+    Parameters
+    ----------
+    distances : dict
+        (count, min_gap) -> distances of the patients whose membership depends
+        on the constraint (see sweep_distances)
+    max_gaps : list of int
+        Maximum gaps in days
+    base : int, optional
+        Size of the cohort without any of those patients
+    sign : int, optional
+        1 when the patients within max_gap join the cohort (inclusion), -1 when
+        they leave it (exclusion)
+
+    Returns
+    -------
+    dataframe of count (count constraints only), min_gap, max_gap and n
+    '''
+    rows = []
+    for (count, min_gap), patient_distances in distances.items():
+        for max_gap, within in zip(max_gaps, count_within(patient_distances, max_gaps)):
+            rows.append({'count': count, 'min_gap': min_gap, 'max_gap': max_gap, 'n': base + sign * int(within)})
+    table = pd.DataFrame(rows, columns=['count', 'min_gap', 'max_gap', 'n'])
+    if table['count'].isna().all():
+        table = table.drop(columns='count')
+    return table
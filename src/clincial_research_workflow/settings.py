@@ -27,10 +27,10 @@
 # limitations under the License.
 
 """Project settings."""
-from clincial_research_workflow.hooks import ProjectHooks
+from clincial_research_workflow.hooks import ProjectHooks, StageMetricsHooks
 
 # Instantiate and list your project hooks here
-HOOKS = (ProjectHooks(),)
+HOOKS = (ProjectHooks(), StageMetricsHooks())
 
 # List the installed plugins for which to disable auto-registry
 # DISABLE_HOOKS_FOR_PLUGINS = ("kedro-viz",)
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+'''
+Patient-sharded evaluation of temporal constraints over a process pool.
+
+The events of a constraint are laid out once in the parent as flat arrays
+grouped by shard, each patient's rows contiguous and in time order: patient
+code, timestamp and one match mask per distinct code list. Every patient
+belongs to one of n_shards shards chosen by a hash of its id, so shards stay
+balanced whatever the order or format of the ids. The arrays are copied into
+shared memory blocks; a worker attaches to them by name, evaluates the
+contiguous rows of its shard with the temporal_kernel evaluators and returns
+the codes of the included patients, which the parent merges. Only block names
+and row bounds are pickled.
+
+    evaluator = ShardedEvaluator(n_workers=32)
+    create_cohort(clinical_cohort, evaluator=evaluator)
+    evaluator.close()
+'''
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from codesets import code_mask
+from temporal_kernel import (
+    build_event_arrays,
+    evaluate_order,
+    evaluate_not_order,
+    events_occur_multiple_vectorized,
+)
+
+
+class SharedArrays():
+    '''
+    Numpy arrays copied into shared memory blocks, unlinked on exit
+
+    Attributes
+    ----------
+    spec : dict
+        Array name -> (block name, shape, dtype), all a worker needs to attach
+        (see attached_arrays)
+    '''
+
+    def __init__(self, arrays):
+        self._blocks = []
+        self.spec = {}
+        try:
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                block = shared_memory.SharedMemory(
+                    create=True, size=max(array.nbytes, 1)
+                )
+                self._blocks.append(block)
+                view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+                view[...] = array
+                self.spec[name] = (block.name, array.shape, array.dtype.str)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+
+def attached_arrays(spec):
+    '''
+    (blocks, arrays) attached to the blocks of SharedArrays.spec. The arrays are
+    views of the blocks and must be released before the blocks are closed
+    '''
+    blocks = {
+        name: shared_memory.SharedMemory(name=block_name)
+        for name, (block_name, shape, dtype) in spec.items()
+    }
+    arrays = {
+        name: np.ndarray(shape, dtype=dtype, buffer=blocks[name].buf)
+        for name, (block_name, shape, dtype) in spec.items()
+    }
+    return blocks, arrays
+
+
+def evaluate_shard(spec, start, stop, criteria, order_matters, minimum_gap, max_gap):
+    '''
+    Codes of the patients included among rows [start, stop) of shared arrays
+
+    Parameters
+    ----------
+    spec : dict
+        SharedArrays.spec of the patient, timestamp and masks arrays
+    start, stop : int
+        Rows of one shard, complete patients in (patient, timestamp) order
+    criteria : list of int
+        Row of masks of each criterion
+    order_matters, minimum_gap, max_gap
+        As for events_occur_multiple_vectorized
+
+    Returns
+    -------
+    numpy array of int64 patient codes
+    '''
+    blocks, arrays = attached_arrays(spec)
+    try:
+        return _evaluate_rows(
+            arrays, start, stop, criteria, order_matters, minimum_gap, max_gap
+        )
+    finally:
+        # the views go before the blocks they point into
+        del arrays
+        for block in blocks.values():
+            block.close()
+
+
+def _evaluate_rows(arrays, start, stop, criteria, order_matters, minimum_gap, max_gap):
+    patient = arrays['patient'][start:stop]
+    if not len(patient):
+        return np.empty(0, dtype=np.int64)
+    # dense codes within the shard keep the offset arrays shard-sized
+    is_first = np.ones(len(patient), dtype=bool)
+    is_first[1:] = patient[1:] != patient[:-1]
+    local = np.cumsum(is_first) - 1
+    masks = [arrays['masks'][row, start:stop] for row in criteria]
+    event_arrays = build_event_arrays(
+        local, arrays['timestamp'][start:stop], masks, int(local[-1]) + 1
+    )
+    if order_matters:
+        included = evaluate_order(event_arrays, minimum_gap, max_gap)
+    else:
+        included = evaluate_not_order(event_arrays, minimum_gap, max_gap)
+    return patient[is_first][included].astype(np.int64)
+
+
+def is_grouped(patient_codes, timestamps, n_patients):
+    '''
+    True if the rows of every patient are contiguous and in time order
+    '''
+    changes = patient_codes[1:] != patient_codes[:-1]
+    return (
+        int(changes.sum()) + 1 == n_patients
+        and not (~changes & (timestamps[1:] < timestamps[:-1])).any()
+    )
+
+
+class ShardedEvaluator():
+    '''
+    Evaluator with the signature of events_occur_multiple_vectorized that runs
+    patient shards in a process pool. Pass it as the evaluator of
+    create_cohort, evaluate_criteria or create_query_from_constraint
+
+    Attributes
+    ----------
+    n_workers : int
+        Processes of the pool. Defaults to the number of CPUs
+    n_shards : int
+        Patient shards of each evaluation. Defaults to n_workers
+    min_rows : int
+        Inputs with fewer rows are evaluated in the calling process
+    '''
+
+    def __init__(self, n_workers=None, n_shards=None, min_rows=100000, mp_context=None):
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.n_shards = n_shards or self.n_workers
+        self.min_rows = min_rows
+        self._mp_context = mp_context
+        self._pool = None
+        # evaluations of concurrent fetch threads share one pool
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def close(self):
+        '''
+        Shuts the process pool down; it is started again by the next evaluation
+        '''
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    self.n_workers, mp_context=self._mp_context
+                )
+            return self._pool
+
+    def __call__(
+        self,
+        sorted_df_pre_filt,
+        event_col_head,
+        event_criteria,
+        order_matters,
+        minimum_gap,
+        max_gap,
+    ):
+        if len(sorted_df_pre_filt) < max(self.min_rows, 1) or self.n_workers <= 1:
+            return events_occur_multiple_vectorized(
+                sorted_df_pre_filt,
+                event_col_head,
+                event_criteria,
+                order_matters,
+                minimum_gap,
+                max_gap,
+            )
+        # factorize codes a missing id -1, which would index the last patient
+        sorted_df_pre_filt = sorted_df_pre_filt[
+            sorted_df_pre_filt['patient_id'].notna()
+        ]
+        patient_codes, patient_ids = pd.factorize(sorted_df_pre_filt['patient_id'])
+        timestamps = np.asarray(sorted_df_pre_filt['timestamp'])
+        timestamps = timestamps.astype(
+            np.promote_types(timestamps.dtype, np.int64), copy=False
+        )
+        # one mask per distinct code list: count constraints repeat theirs n times
+        keys = [
+            (col, tuple(criteria))
+            for col, criteria in zip(event_col_head, event_criteria)
+        ]
+        distinct = list(dict.fromkeys(keys))
+        hashes = pd.util.hash_array(np.asarray(patient_ids, dtype=object))
+        patient_shard = hashes % np.uint64(self.n_shards)
+        # a small integer key lets the stable sort below run as a radix sort
+        shard_dtype = np.min_scalar_type(self.n_shards)
+        row_shard = patient_shard.astype(shard_dtype)[patient_codes]
+        if is_grouped(patient_codes, timestamps, len(patient_ids)):
+            # rows already follow (patient, timestamp), a stable sort keeps them
+            # in shards
+            order = np.argsort(row_shard, kind='stable')
+        else:
+            order = np.lexsort((timestamps, patient_codes, row_shard))
+        masks = np.vstack(
+            [
+                code_mask(sorted_df_pre_filt, col, list(criteria))[order]
+                for col, criteria in distinct
+            ]
+        )
+        bounds = np.concatenate(
+            [[0], np.cumsum(np.bincount(row_shard, minlength=self.n_shards))]
+        )
+        criteria = [distinct.index(key) for key in keys]
+        arrays = {
+            'patient': patient_codes[order],
+            'timestamp': timestamps[order],
+            'masks': masks,
+        }
+        with SharedArrays(arrays) as shared:
+            futures = [
+                self.pool().submit(
+                    evaluate_shard,
+                    shared.spec,
+                    bounds[shard],
+                    bounds[shard + 1],
+                    criteria,
+                    order_matters,
+                    minimum_gap,
+                    max_gap,
+                )
+                for shard in range(self.n_shards)
+                if bounds[shard] < bounds[shard + 1]
+            ]
+            included = np.zeros(len(patient_ids), dtype=bool)
+            for future in futures:
+                included[future.result()] = True
+        occurs_multiple = sorted_df_pre_filt[included[patient_codes]]
+        if not len(occurs_multiple):
+            return pd.DataFrame()
+        return occurs_multiple
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+'''
+Stage-level metrics of cohort builds.
+
+Each stage of a build reports one event per call with its wall time and the
+counts it knows of:
+
+    query_build     building the SDK query of a pull
+    fetch           pulling chunks: chunks, rows, bytes
+    sort            sorting a partition by patient and timestamp: rows
+    evaluate        evaluating a constraint on a partition: rows, rows_out
+                    (rows after filtering), patients (surviving)
+    set_algebra     combining constraint and variable patient sets: patients
+    node            a Kedro node, timed by StageMetricsHooks
+
+Metrics are off unless STAGE_METRICS_DIR names a directory (see collecting,
+or kedro run --params stage_metrics:true). Events are then logged as
+structured records by the stage_metrics logger (see conf/base/logging.yml)
+and appended as JSON lines to one file per process in that directory, so
+builds split over threads, process pools or Kedro's ParallelRunner are all
+counted; summarize totals them per stage and per variable.
+'''
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+# named explicitly: the module is imported both on its own and from the package
+logger = logging.getLogger('stage_metrics')
+
+METRICS_DIR_ENV = 'STAGE_METRICS_DIR'
+COUNTS = ['chunks', 'rows', 'bytes', 'rows_out', 'patients']
+_lock = threading.Lock()
+
+
+def metrics_dir():
+    '''
+    Directory events are written to, None when metrics are off
+    '''
+    return os.environ.get(METRICS_DIR_ENV) or None
+
+
+def emit(name, seconds, **fields):
+    '''
+    Records one event of stage name
+    '''
+    directory = metrics_dir()
+    if directory is None:
+        return
+    event = dict(fields, stage=name, seconds=seconds, pid=os.getpid(), time=time.time())
+    logger.info('stage %s', name, extra=event)
+    line = json.dumps(event, default=str)
+    with _lock, open(os.path.join(directory, f'events-{os.getpid()}.jsonl'), 'a') as handle:
+        handle.write(line + '\n')
+
+
+@contextmanager
+def stage(name, **fields):
+    '''
+    Times a stage. Yields a dict the caller fills with counts, or None when
+    metrics are off so that counts are only computed when they are recorded
+
+        with stage('evaluate', variable=name) as counts:
+            result = evaluate(df)
+            if counts is not None:
+                counts.update(rows=len(df), rows_out=len(result))
+    '''
+    if metrics_dir() is None:
+        yield None
+        return
+    counts = dict(fields)
+    start = time.perf_counter()
+    try:
+        yield counts
+    finally:
+        emit(name, time.perf_counter() - start, **counts)
+
+
+def metered_chunks(chunks, name='fetch', **fields):
+    '''
+    Passes chunks through, reporting the time spent waiting for them and their
+    number, rows and bytes as one event once the stream ends
+    '''
+    if metrics_dir() is None:
+        yield from chunks
+        return
+    counts = dict(fields, chunks=0, rows=0, bytes=0)
+    seconds = 0.
+    iterator = iter(chunks)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                df = next(iterator)
+            except StopIteration:
+                seconds += time.perf_counter() - start
+                break
+            seconds += time.perf_counter() - start
+            counts['chunks'] += 1
+            counts['rows'] += len(df)
+            counts['bytes'] += int(df.memory_usage(index=True, deep=True).sum())
+            yield df
+    finally:
+        emit(name, seconds, **counts)
+
+
+def patient_count(df):
+    '''
+    Distinct patients of an evaluated dataframe
+    '''
+    return int(df['patient_id'].nunique()) if len(df) else 0
+
+
+@contextmanager
+def collecting(directory):
+    '''
+    Switches metrics on for the duration of a block, writing events to directory
+    '''
+    os.makedirs(directory, exist_ok=True)
+    previous = os.environ.get(METRICS_DIR_ENV)
+    os.environ[METRICS_DIR_ENV] = directory
+    try:
+        yield directory
+    finally:
+        if previous is None:
+            os.environ.pop(METRICS_DIR_ENV, None)
+        else:
+            os.environ[METRICS_DIR_ENV] = previous
+
+
+def read_events(directory):
+    '''
+    Dataframe of every event written to directory
+    '''
+    events = []
+    for path in sorted(glob.glob(os.path.join(directory, 'events-*.jsonl'))):
+        with open(path) as handle:
+            events += [json.loads(line) for line in handle if line.strip()]
+    return pd.DataFrame(events)
+
+
+def _totals(events):
+    totals = {'calls': len(events), 'seconds': float(events['seconds'].sum())}
+    for count in COUNTS:
+        if count in events and events[count].notna().any():
+            totals[count] = int(events[count].sum())
+    return totals
+
+
+def summarize(directory, path=None, **fields):
+    '''
+    Totals of the events of directory per stage, per variable and per node,
+    written as JSON to path if given
+
+    Returns
+    -------
+    dict
+    '''
+    events = read_events(directory)
+    summary = dict(fields, stages={}, variables={}, nodes={})
+    if len(events):
+        for name, group in events.groupby('stage', sort=False):
+            summary['stages'][name] = _totals(group)
+        if 'variable' in events:
+            for (variable, name), group in events.dropna(subset=['variable']).groupby(['variable', 'stage'], sort=False):
+                summary['variables'].setdefault(variable, {})[name] = _totals(group)
+        if 'node' in events:
+            for node, group in events.dropna(subset=['node']).groupby('node', sort=False):
+                summary['nodes'][node] = _totals(group)
+    if path is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as handle:
+            json.dump(summary, handle, indent=2)
+    return summary
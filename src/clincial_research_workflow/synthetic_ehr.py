@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+'''
+Synthetic EHR records for offline profiling and load testing.
+
+Writes a records directory readable by local_records.LocalRecordsAPIWrapper:
+events/part-*.parquet with one diagnosis, medication, lab or vital event per
+row (patient_id, timestamp, diagnosis_code, meds_drugs, lab_test_name,
+lab_value, vital_name, vital_value) and diseases.json.
+Events are generated and written one partition at a time, so memory stays
+bounded by the partition size from 10k up to 100M+ events.
+
+Patients have a heavy tailed number of encounters spread over a personal
+follow-up span inside the record window, and a small share of patients carry
+each code list of the seltorexant variables repeatedly, so temporal
+constraints have realistic hit rates. Lab and vital results are drawn from
+normal reference distributions, so threshold constraints select a tail.
+
+    python synthetic_ehr.py --events 1000000 --out data/01_raw/synthetic_ehr
+'''
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+RECORD_WINDOW = ['2000-01-01', '2022-01-01']
+FILLER_DIAGNOSES = ['I10', 'E119', 'E785', 'J069', 'M545', 'Z0000', 'K219', 'R079', 'N390', 'J449', 'E039', 'R51']
+FILLER_DRUGS = ['metformin', 'lisinopril', 'atorvastatin', 'amlodipine', 'omeprazole', 'levothyroxine', 'albuterol', 'gabapentin']
+# name -> (mean, standard deviation) of results
+FILLER_LABS = {'hba1c': (5.8, 0.9), 'ldl': (110, 35), 'tsh': (2.0, 1.2), 'sodium': (139, 3), 'creatinine': (0.9, 0.25)}
+FILLER_VITALS = {'bmi': (28, 6), 'systolic_bp': (125, 17), 'heart_rate': (75, 12)}
+
+
+def default_code_lists():
+    '''
+    Code lists of the seltorexant variables, keyed by subvariable name, for the
+    'dx' and 'drug' categories
+    '''
+    from variable_registry import registry
+    code_lists = {'dx': {}, 'drug': {}}
+    # read from the catalog definitions without building the variables
+    for definition in registry().definitions().values():
+        for name, category, value in definition['subvariables']:
+            if category in code_lists:
+                code_lists[category][name] = list(value)
+    return code_lists
+
+
+class SyntheticEHR():
+    '''
+    Generator of synthetic patient events
+
+    Attributes
+    ----------
+    n_patients : int
+        Number of patients
+    seed : int
+        Seed of the random generator; the same seed gives the same records
+    dx_lists, rx_lists : dict
+        Code list name -> diagnosis codes / drug names planted in patients
+    carrier_rate : float
+        Share of patients carrying each code list
+    dx_share, lab_share, vital_share : float
+        Share of events that are diagnoses, lab results and vitals; the rest
+        are medications
+    '''
+
+    def __init__(self, n_patients, seed=0, code_lists=None, carrier_rate=0.05, dx_share=0.6, lab_share=0.15, vital_share=0.05):
+        code_lists = default_code_lists() if code_lists is None else code_lists
+        self.n_patients = n_patients
+        self.seed = seed
+        self.dx_lists = code_lists.get('dx', {})
+        self.rx_lists = code_lists.get('drug', {})
+        self.carrier_rate = carrier_rate
+        self.dx_share = dx_share
+        self.lab_share = lab_share
+        self.vital_share = vital_share
+        rng = np.random.default_rng(seed)
+        start, end = [pd.Timestamp(element).timestamp() for element in RECORD_WINDOW]
+        # heavy tailed encounter rate and personal follow-up span per patient
+        self.weight = rng.lognormal(0, 1.2, n_patients)
+        self.weight /= self.weight.sum()
+        span = np.minimum(rng.exponential(6 * 365 * 86400, n_patients) + 30 * 86400, end - start)
+        self.first_seen = start + rng.random(n_patients) * (end - start - span)
+        self.span = span
+        self.dx_carriers = {name: rng.random(n_patients) < carrier_rate for name in self.dx_lists}
+        self.rx_carriers = {name: rng.random(n_patients) < carrier_rate for name in self.rx_lists}
+
+    def _codes(self, rng, patients, code_lists, carriers, filler):
+        codes = np.asarray(filler, dtype=object)[rng.integers(0, len(filler), len(patients))]
+        for name, codes_of_list in code_lists.items():
+            # carriers draw from their list on roughly a third of their events
+            planted = carriers[name][patients] & (rng.random(len(patients)) < 0.3)
+            codes[planted] = np.asarray(codes_of_list, dtype=object)[rng.integers(0, len(codes_of_list), planted.sum())]
+        return codes
+
+    def _results(self, rng, n_events, reference):
+        names = np.asarray(list(reference), dtype=object)
+        drawn = rng.integers(0, len(names), n_events)
+        mean, std = np.array(list(reference.values()), dtype=float).T
+        return names[drawn], np.round(rng.normal(mean[drawn], std[drawn]), 1)
+
+    def partition(self, index, n_events):
+        '''
+        Dataframe of n_events events of partition index. Partitions are
+        independent, so they can be generated in any order or in parallel
+        '''
+        rng = np.random.default_rng([self.seed, index])
+        patients = rng.choice(self.n_patients, size=n_events, p=self.weight)
+        timestamps = np.floor(self.first_seen[patients] + rng.random(n_events) * self.span[patients])
+        kind = np.searchsorted(np.cumsum([self.dx_share, self.lab_share, self.vital_share]), rng.random(n_events), side='right')
+        is_dx, is_lab, is_vital, is_rx = [kind == value for value in range(4)]
+        diagnosis_code = np.full(n_events, None, dtype=object)
+        meds_drugs = np.full(n_events, None, dtype=object)
+        lab_test_name = np.full(n_events, None, dtype=object)
+        lab_value = np.full(n_events, np.nan)
+        vital_name = np.full(n_events, None, dtype=object)
+        vital_value = np.full(n_events, np.nan)
+        diagnosis_code[is_dx] = self._codes(rng, patients[is_dx], self.dx_lists, self.dx_carriers, FILLER_DIAGNOSES)
+        meds_drugs[is_rx] = self._codes(rng, patients[is_rx], self.rx_lists, self.rx_carriers, FILLER_DRUGS)
+        lab_test_name[is_lab], lab_value[is_lab] = self._results(rng, is_lab.sum(), FILLER_LABS)
+        vital_name[is_vital], vital_value[is_vital] = self._results(rng, is_vital.sum(), FILLER_VITALS)
+        return pd.DataFrame({
+            'patient_id': np.char.add('SYN', patients.astype(str)).astype(object),
+            'timestamp': timestamps,
+            'diagnosis_code': diagnosis_code,
+            'meds_drugs': meds_drugs,
+            'lab_test_name': lab_test_name,
+            'lab_value': lab_value,
+            'vital_name': vital_name,
+            'vital_value': vital_value,
+        })
+
+    def diseases(self):
+        '''
+        Disease name -> diagnosis codes, as returned by getDiagnosticCodesFromDisease
+        '''
+        return {name: codes for name, codes in self.dx_lists.items()}
+
+
+def write_synthetic_records(out_dir, n_events, n_patients=None, partition_size=1000000, seed=0, code_lists=None):
+    '''
+    Writes a synthetic records directory
+
+    Parameters
+    ----------
+    out_dir : str
+        Records directory to create; point LOCAL_RECORDS_DIR at it. Events
+        already written there are replaced
+    n_events : int
+        Total number of events
+    n_patients : int, optional
+        Number of patients, by default one per 50 events
+    partition_size : int, optional
+        Events per parquet file, which bounds memory while writing
+    seed : int, optional
+        Seed of the random generator
+
+    Returns
+    -------
+    list of the parquet files written
+    '''
+    n_patients = n_patients or max(1, n_events // 50)
+    ehr = SyntheticEHR(n_patients, seed, code_lists)
+    events_dir = os.path.join(out_dir, 'events')
+    # parts of an earlier, larger extract would otherwise be read with the new ones
+    shutil.rmtree(events_dir, ignore_errors=True)
+    os.makedirs(events_dir)
+    paths = []
+    for index, offset in enumerate(range(0, n_events, partition_size)):
+        path = os.path.join(events_dir, f'part-{index:05d}.parquet')
+        ehr.partition(index, min(partition_size, n_events - offset)).to_parquet(path, index=False)
+        paths.append(path)
+    with open(os.path.join(out_dir, 'diseases.json'), 'w') as handle:
+        json.dump(ehr.diseases(), handle)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic EHR records for LOCAL_RECORDS_DIR')
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--patients', type=int, default=None)
+    parser.add_argument('--partition-size', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='data/01_raw/synthetic_ehr')
+    args = parser.parse_args()
+    paths = write_synthetic_records(args.out, args.events, args.patients, args.partition_size, args.seed)
+    print(f'Wrote {args.events} events in {len(paths)} files to {args.out}')
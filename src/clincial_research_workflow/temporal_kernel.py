@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+'''
+Group-aware temporal constraint kernel.
+
+Evaluates the 'time' and 'count' constraints of build_cohort_je for every
+patient at once. Events are held as flat arrays sorted by (patient, timestamp)
+with a patient offset array, and the interval tests of is_included_order and
+is_included_not_order are answered with searchsorted probes instead of a
+per-patient DataFrame loop.
+'''
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import pandas as pd
+
+from codesets import code_mask
+
+
+def sorted_timestamps(df):
+    '''
+    Sorted unique timestamps of a dataframe, computed once per patient and
+    subvariable so that interval probes can binary search them
+    '''
+    return sorted(set(df['timestamp'].tolist()))
+
+
+def first_in_interval(timestamps, time_int):
+    '''
+    Binary search equivalent of scanning sorted timestamps for the first one that
+    lies in the outer interval time_int[1] but not in the inner interval time_int[0].
+    Degenerate intervals ([x, x]) contain nothing, as in is_between.
+
+    Parameters
+    ----------
+    timestamps : list
+        Sorted unique timestamps (see sorted_timestamps)
+    time_int : list
+        [[inner start, inner end], [outer start, outer end]]
+
+    Returns
+    -------
+    [True, timestamp] for the first matching timestamp, [False, None] otherwise
+    '''
+    inner, outer = time_int
+    if outer[0] == outer[1]:
+        return [False, None]
+    idx = bisect_left(timestamps, outer[0])
+    if idx == len(timestamps) or timestamps[idx] > outer[1]:
+        return [False, None]
+    if inner[0] != inner[1] and inner[0] <= timestamps[idx] <= inner[1]:
+        idx = bisect_right(timestamps, inner[1], idx)
+        if idx == len(timestamps) or timestamps[idx] > outer[1]:
+            return [False, None]
+    return [True, timestamps[idx]]
+
+
+def days_to_seconds(days):
+    '''
+    Converts a gap in days to seconds the same way is_included_order does
+    '''
+    return days * 24 * 60 * 60
+
+
+def patient_offsets(patient_codes, n_patients):
+    '''
+    Returns the offset array of a patient-sorted code array so that the rows of
+    patient p are patient_codes[offsets[p]:offsets[p + 1]]
+    '''
+    return np.searchsorted(patient_codes, np.arange(n_patients + 1), side='left')
+
+
+class EventArrays():
+    '''
+    Flat, patient-major view of the events of one criterion.
+
+    Holds the sorted unique timestamps of every patient for a single criterion
+    (one column head / code list pair) together with a composite integer key
+    that allows a single searchsorted call to probe every patient's timeline.
+
+    Attributes
+    ----------
+    patient : numpy array of int
+        Patient code of each (patient, timestamp) pair
+    timestamp : numpy array
+        Timestamp of each (patient, timestamp) pair, sorted within patient
+    key : numpy array of int64
+        patient * stride + rank of timestamp in the shared timestamp grid
+    offsets : numpy array of int
+        Patient offset array into the three arrays above
+    n_rows : numpy array of int
+        Number of matching rows (duplicates included) of each patient
+    '''
+
+    def __init__(self, patient, timestamp, grid, n_patients, n_rows):
+        self.patient = patient
+        self.timestamp = timestamp
+        self.stride = len(grid) + 1
+        self.key = patient.astype(np.int64) * self.stride + np.searchsorted(grid, timestamp, side='left')
+        self.offsets = patient_offsets(patient, n_patients)
+        self.n_rows = n_rows
+        self.grid = grid
+
+    def first_at_or_after(self, patient, bound, strict):
+        '''
+        Index of the first timestamp of each patient that is >= bound (or > bound
+        if strict). Returns the end offset of the patient when there is none.
+        '''
+        side = 'right' if strict else 'left'
+        rank = np.searchsorted(self.grid, bound, side=side)
+        return np.searchsorted(self.key, patient.astype(np.int64) * self.stride + rank, side='left')
+
+    def count_between(self, patient, low, high):
+        '''
+        Number of timestamps of each patient within [low, high]
+        '''
+        start = self.first_at_or_after(patient, low, False)
+        stop = self.first_at_or_after(patient, high, True)
+        return np.maximum(stop - start, 0)
+
+
+def build_event_arrays(patient_codes, timestamps, masks, n_patients):
+    '''
+    Builds one EventArrays per criterion mask from patient-sorted event arrays
+
+    Parameters
+    ----------
+    patient_codes : numpy array of int
+        Dense patient code of every event, sorted by (patient, timestamp)
+    timestamps : numpy array
+        Timestamp of every event
+    masks : list of numpy boolean arrays
+        One mask per criterion selecting the events that match it
+    n_patients : int
+        Number of distinct patient codes
+
+    Returns
+    -------
+    list of EventArrays
+    '''
+    grid = np.unique(timestamps)
+    event_arrays = []
+    for mask in masks:
+        patient = patient_codes[mask]
+        timestamp = timestamps[mask]
+        n_rows = np.bincount(patient, minlength=n_patients)
+        if len(patient):
+            keep = np.ones(len(patient), dtype=bool)
+            keep[1:] = (patient[1:] != patient[:-1]) | (timestamp[1:] != timestamp[:-1])
+            patient = patient[keep]
+            timestamp = timestamp[keep]
+        event_arrays.append(EventArrays(patient, timestamp, grid, n_patients, n_rows))
+    return event_arrays
+
+
+def evaluate_order(event_arrays, min_gap, max_gap):
+    '''
+    Vectorized equivalent of build_cohort_je.is_included_order over all patients.
+
+    Every unique timestamp t of the first criterion is an anchor with an inner
+    interval [t, t + min_gap] and an outer interval [t, t + max_gap]. Each later
+    criterion must have a timestamp in the outer but not the inner interval; the
+    first such timestamp becomes the new start of both intervals.
+
+    Returns
+    -------
+    numpy boolean array with one entry per patient code
+    '''
+    n_patients = len(event_arrays[0].n_rows)
+    patient, anchor_time, found_all = order_anchors(event_arrays, min_gap, max_gap)
+    included = np.zeros(n_patients, dtype=bool)
+    included[patient[found_all]] = True
+    return included
+
+
+def order_anchors(event_arrays, min_gap, max_gap):
+    '''
+    Anchors of evaluate_order and whether the chain of each one is complete
+
+    Returns
+    -------
+    (patient, anchor timestamp, found) arrays with one entry per anchor
+    '''
+    anchors = event_arrays[0]
+    patient = anchors.patient
+    inner_end = anchors.timestamp + days_to_seconds(min_gap)
+    outer_end = anchors.timestamp + days_to_seconds(max_gap)
+    start = anchors.timestamp.copy()
+    found_all = np.ones(len(patient), dtype=bool)
+    for arrays in event_arrays[1:]:
+        if not len(arrays.timestamp):
+            return patient, anchors.timestamp, np.zeros(len(patient), dtype=bool)
+        outer_active = start != outer_end
+        inner_active = (start != inner_end) & (inner_end >= start)
+        bound = np.where(inner_active, inner_end, start)
+        idx = np.where(
+            inner_active,
+            arrays.first_at_or_after(patient, bound, True),
+            arrays.first_at_or_after(patient, bound, False),
+        )
+        in_patient = idx < arrays.offsets[patient + 1]
+        candidate = arrays.timestamp[np.minimum(idx, len(arrays.timestamp) - 1)]
+        found = outer_active & in_patient & (candidate <= outer_end)
+        start = np.where(found, candidate, start)
+        found_all &= found
+    return patient, anchors.timestamp, found_all
+
+
+def evaluate_not_order(event_arrays, min_gap, max_gap):
+    '''
+    Vectorized equivalent of build_cohort_je.is_included_not_order over all patients.
+
+    The criterion with the fewest rows for a patient provides the anchors t; every
+    other criterion must have a timestamp in [t - max_gap, t + max_gap] that is not
+    in [t - min_gap, t + min_gap].
+
+    Returns
+    -------
+    numpy boolean array with one entry per patient code
+    '''
+    n_patients = len(event_arrays[0].n_rows)
+    included = np.zeros(n_patients, dtype=bool)
+    for start_idx, patient, anchor_time, inner, outer, found_all in not_order_anchors(event_arrays, min_gap, max_gap):
+        included[patient[found_all]] = True
+    return included
+
+
+def not_order_anchors(event_arrays, min_gap, max_gap):
+    '''
+    Anchors of evaluate_not_order, one criterion at a time
+
+    Yields
+    ------
+    (criterion index, patient, anchor timestamp, inner interval, outer interval,
+    found) with one array entry per anchor
+    '''
+    start_criterion = np.argmin(np.vstack([arrays.n_rows for arrays in event_arrays]), axis=0)
+    for start_idx, anchors in enumerate(event_arrays):
+        selected = start_criterion[anchors.patient] == start_idx
+        patient = anchors.patient[selected]
+        anchor_time = anchors.timestamp[selected]
+        inner = [anchor_time - days_to_seconds(min_gap), anchor_time + days_to_seconds(min_gap)]
+        outer = [anchor_time - days_to_seconds(max_gap), anchor_time + days_to_seconds(max_gap)]
+        inner_active = inner[0] != inner[1]
+        outer_active = outer[0] != outer[1]
+        found_all = np.ones(len(patient), dtype=bool)
+        for counter, arrays in enumerate(event_arrays):
+            if counter == start_idx:
+                continue
+            n_outer = arrays.count_between(patient, outer[0], outer[1])
+            n_both = arrays.count_between(patient, np.maximum(outer[0], inner[0]), np.minimum(outer[1], inner[1]))
+            n_outer_only = n_outer - np.where(inner_active, n_both, 0)
+            found_all &= outer_active & (n_outer_only > 0)
+        yield start_idx, patient, anchor_time, inner, outer, found_all
+
+
+def order_witness(event_arrays, min_gap, max_gap):
+    '''
+    Latest timestamp of each patient from which evaluate_order finds a complete
+    chain. Chains only look forward, so a patient still meets the constraint in
+    any window starting at or before its witness
+
+    Returns
+    -------
+    numpy float array with one entry per patient code, -inf for none
+    '''
+    witness = np.full(len(event_arrays[0].n_rows), -np.inf)
+    patient, anchor_time, found_all = order_anchors(event_arrays, min_gap, max_gap)
+    np.maximum.at(witness, patient[found_all], anchor_time[found_all])
+    return witness
+
+
+def not_order_witness(event_arrays, min_gap, max_gap):
+    '''
+    Latest start of a match of evaluate_not_order for each patient: the anchor
+    and the latest timestamp of every other criterion in its outer but not its
+    inner interval. A patient still meets the constraint in any window starting
+    at or before its witness
+
+    Returns
+    -------
+    numpy float array with one entry per patient code, -inf for none
+    '''
+    witness = np.full(len(event_arrays[0].n_rows), -np.inf)
+    for start_idx, patient, anchor_time, inner, outer, found_all in not_order_anchors(event_arrays, min_gap, max_gap):
+        patient, anchor_time = patient[found_all], anchor_time[found_all]
+        inner, outer = [bound[found_all] for bound in inner], [bound[found_all] for bound in outer]
+        match_start = anchor_time.astype(float)
+        for counter, arrays in enumerate(event_arrays):
+            if counter == start_idx or not len(patient):
+                continue
+            latest = arrays.timestamp[np.maximum(arrays.first_at_or_after(patient, outer[1], True) - 1, 0)]
+            in_inner = (inner[0] != inner[1]) & (latest >= inner[0]) & (latest <= inner[1])
+            before_inner = arrays.timestamp[np.maximum(arrays.first_at_or_after(patient, inner[0], False) - 1, 0)]
+            match_start = np.minimum(match_start, np.where(in_inner, before_inner, latest))
+        np.maximum.at(witness, patient, match_start)
+    return witness
+
+
+def event_arrays_of(sorted_df_pre_filt, event_col_head, event_criteria):
+    '''
+    Patient codes of the rows of a dataframe, the patient id of each code and
+    one EventArrays per criterion (see build_event_arrays)
+    '''
+    patient_codes, patient_ids = pd.factorize(sorted_df_pre_filt['patient_id'], sort=True)
+    timestamps = np.asarray(sorted_df_pre_filt['timestamp'])
+    # compact int32 offsets (see event_frame) are widened before gaps are added
+    timestamps = timestamps.astype(np.promote_types(timestamps.dtype, np.int64), copy=False)
+    order = np.lexsort((timestamps, patient_codes))
+    n_patients = patient_codes.max() + 1
+    masks = [code_mask(sorted_df_pre_filt, col, criteria)[order] for col, criteria in zip(event_col_head, event_criteria)]
+    return patient_codes, patient_ids, build_event_arrays(patient_codes[order], timestamps[order], masks, n_patients)
+
+
+def events_occur_multiple_vectorized(sorted_df_pre_filt, event_col_head, event_criteria, order_matters, minimum_gap, max_gap):
+    """
+    Drop-in replacement for build_cohort_je.events_occur_multiple that evaluates
+    all patients in one pass.
+    Inputs:
+    sorted_df_pre_filt (df): Dataframe of patients queried for either of the criteria sorted by timestamp and patient id
+    event_col_head (lst): list of column headers that the function should use to filter
+    event_criteria (lst of lst): list of criterial for each column header. (ie. list of diagnosis codes and a list of medications)
+    order_matters (bool): True to evaluate with is_included_order semantics, False for is_included_not_order
+    minimum_gap (int): minimum gap in days
+    max_gap (int): maximum gap in days
+    Outputs:
+    occurs_multiple (df): rows of sorted_df_pre_filt belonging to patients that fulfill the criteria
+    """
+    if not len(sorted_df_pre_filt):
+        return pd.DataFrame()
+    patient_codes, _, event_arrays = event_arrays_of(sorted_df_pre_filt, event_col_head, event_criteria)
+    if order_matters:
+        included = evaluate_order(event_arrays, minimum_gap, max_gap)
+    else:
+        included = evaluate_not_order(event_arrays, minimum_gap, max_gap)
+    occurs_multiple = sorted_df_pre_filt[included[patient_codes]]
+    if not len(occurs_multiple):
+        return pd.DataFrame()
+    return occurs_multiple
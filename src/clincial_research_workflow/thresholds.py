@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+'''
+Evaluation of 'threshold' constraints on lab and vital results.
+
+A threshold constraint ['threshold', [min, max], subvariable] is met by a
+patient with at least one result of one of the subvariable's lab or vital
+names whose numeric value lies in [min, max] within the study window. Either
+bound may be None for an open interval. Results that do not parse as numbers
+never meet a threshold.
+
+When the same lab or vital subvariable is used by a 'time' constraint of the
+variable, the threshold is linked to it: only in-range results count as events
+of the time constraint (e.g. HbA1c >= 6.5 within 30 to 90 days of a diabetes
+code), and the threshold is not evaluated on its own.
+
+Everything is evaluated with column operations over the whole chunk, whatever
+the length of each patient's history.
+'''
+import numpy as np
+import pandas as pd
+
+from codesets import code_mask
+from fetch_planner import CATEGORY_TO_EVENT, EVENT_TO_COL_HEAD, EVENT_TO_VALUE_COL
+
+
+def in_threshold(values, bounds):
+    '''
+    Boolean array of the values within [min, max]. Values are coerced to
+    numbers; anything that does not parse is outside every threshold
+    '''
+    values = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=float)
+    low = -np.inf if bounds[0] is None else bounds[0]
+    high = np.inf if bounds[1] is None else bounds[1]
+    return (values >= low) & (values <= high)
+
+
+def threshold_mask(df, event, names, bounds):
+    '''
+    Rows of df that are results of names with a value in bounds
+    '''
+    return code_mask(df, EVENT_TO_COL_HEAD[event], names) & in_threshold(df[EVENT_TO_VALUE_COL[event]], bounds)
+
+
+def evaluate_threshold(sorted_df, event, names, bounds):
+    '''
+    Rows of the patients with at least one in-range result
+
+    Parameters
+    ----------
+    sorted_df : dataframe
+        Patient-complete rows sorted by ['patient_id','timestamp']
+    event : str
+        "lab" or "vital"
+    names : list of str
+        Lab or vital names of the subvariable
+    bounds : list
+        [min, max], either of which may be None
+
+    Returns
+    -------
+    Dataframe of the rows of the included patients
+    '''
+    if not len(sorted_df):
+        return pd.DataFrame()
+    patients = sorted_df['patient_id'].to_numpy()[threshold_mask(sorted_df, event, names, bounds)]
+    if not len(patients):
+        return pd.DataFrame()
+    return sorted_df[sorted_df['patient_id'].isin(pd.unique(patients))]
+
+
+def linked_thresholds(variable):
+    '''
+    Threshold constraints of a variable whose lab or vital values are also a
+    side of one of its time constraints, as a list of (event, names, bounds)
+    '''
+    time_values = [values for constraint in variable.constraint.get('time', []) for values in constraint[1:]]
+    links = []
+    for bounds, names in variable.constraint.get('threshold', []):
+        if names in time_values:
+            links.append((threshold_event(variable, names), names, bounds))
+    return links
+
+
+def threshold_event(variable, names):
+    '''
+    "lab" or "vital", from the category of the subvariable holding names
+    '''
+    return CATEGORY_TO_EVENT[variable.get_subvariable_dict_from_list(names)['category']]
+
+
+def apply_thresholds(df, links):
+    '''
+    Drops the results of linked lab or vital names whose value is out of range;
+    every other row is kept in order
+    '''
+    if not links or not len(df):
+        return df
+    keep = np.ones(len(df), dtype=bool)
+    for event, names, bounds in links:
+        is_result = code_mask(df, EVENT_TO_COL_HEAD[event], names)
+        keep &= ~is_result | in_threshold(df[EVENT_TO_VALUE_COL[event]], bounds)
+    return df[keep]
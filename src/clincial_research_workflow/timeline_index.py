@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+'''
+Patient-major timeline index over a local records extract.
+
+build_timeline_index is a one-off step over a records directory (see
+local_records) that writes every event sorted by (patient_id, timestamp) as
+plain .npy column arrays, plus an offsets array such that the events of
+patient p are rows offsets[p]:offsets[p + 1]:
+
+    <index_dir>/meta.json             format, columns and code dictionaries
+    <index_dir>/patient_id.npy        sorted patient ids, in their dtype in the records
+    <index_dir>/offsets.npy           int64, one more than the number of patients
+    <index_dir>/timestamp.npy         float64 timestamps
+    <index_dir>/<code column>.npy     int32 ids into the column's dictionary, -1 if missing
+    <index_dir>/<value column>.npy    float64 lab and vital results
+
+TimelineIndex opens the arrays memory-mapped read-only, so one patient's
+timeline is a zero-copy view, and any number of worker processes can share
+the same pages through the OS page cache (a pickled TimelineIndex reopens the
+mapping instead of copying it). Evaluators get patient-complete frames that
+are already in (patient_id, timestamp) order and never re-sort.
+
+The build is a counting sort with bounded memory: one pass counts the events
+of each patient, a second scatters every batch into its patients' slots of the
+output files, and a last pass sorts each block of patients by time.
+
+    python timeline_index.py <records_dir> <index_dir>
+'''
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from codesets import compile_code_set
+from event_frame import EVENT_TO_COL_HEAD, EVENT_TO_VALUE_COL
+
+INDEX_FORMAT_VERSION = 1
+CODE_COLUMNS = list(EVENT_TO_COL_HEAD.values())
+VALUE_COLUMNS = list(EVENT_TO_VALUE_COL.values())
+
+
+def _batches(files, columns, batch_size):
+    for path in files:
+        parquet_file = pq.ParquetFile(path)
+        available = [column for column in columns if column in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=available):
+            df = batch.to_pandas().reindex(columns=columns)
+            # events without a patient belong to no timeline
+            yield df[df['patient_id'].notna()]
+
+
+def build_timeline_index(records_dir, index_dir, batch_size=1000000):
+    '''
+    Writes the timeline index of a records directory. Events without a patient
+    id are left out
+
+    Parameters
+    ----------
+    records_dir : str
+        Directory with events/*.parquet
+    index_dir : str
+        Directory to write the index to
+    batch_size : int, optional
+        Events read, scattered and sorted at a time, which bounds memory
+
+    Returns
+    -------
+    TimelineIndex of the new index
+    '''
+    files = sorted(glob.glob(os.path.join(records_dir, 'events', '*.parquet')))
+    columns = ['patient_id', 'timestamp'] + CODE_COLUMNS + VALUE_COLUMNS
+
+    # pass 1: patients, events per patient and code dictionaries
+    counts = {}
+    dictionaries = {column: {} for column in CODE_COLUMNS}
+    for df in _batches(files, columns, batch_size):
+        for patient_id, count in df['patient_id'].value_counts(sort=False).items():
+            counts[patient_id] = counts.get(patient_id, 0) + count
+        for column in CODE_COLUMNS:
+            dictionaries[column].update(dict.fromkeys(df[column].dropna().unique()))
+    patient_ids = np.array(sorted(counts))
+    offsets = np.zeros(len(patient_ids) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([counts[patient_id] for patient_id in patient_ids.tolist()])
+    n_events = int(offsets[-1])
+    dictionaries = {column: sorted(values) for column, values in dictionaries.items()}
+
+    os.makedirs(index_dir, exist_ok=True)
+    np.save(os.path.join(index_dir, 'patient_id.npy'), patient_ids)
+    np.save(os.path.join(index_dir, 'offsets.npy'), offsets)
+    dtypes = dict([('timestamp', np.float64)] + [(column, np.int32) for column in CODE_COLUMNS] + [(column, np.float64) for column in VALUE_COLUMNS])
+    arrays = {
+        column: np.lib.format.open_memmap(os.path.join(index_dir, f'{column}.npy'), mode='w+', dtype=dtype, shape=(n_events,))
+        for column, dtype in dtypes.items()
+    }
+
+    # pass 2: scatter every batch into the slots of its patients
+    patient_index = pd.Index(patient_ids)
+    code_index = {column: pd.Index(values, dtype=object) for column, values in dictionaries.items()}
+    cursor = offsets[:-1].copy()
+    for df in _batches(files, columns, batch_size):
+        patients = patient_index.get_indexer(df['patient_id'])
+        if (patients < 0).any():
+            raise ValueError(f'events of patients not seen in the first pass, {records_dir} changed during the build')
+        order = np.argsort(patients, kind='stable')
+        patients = patients[order]
+        starts = np.flatnonzero(np.r_[True, patients[1:] != patients[:-1]])
+        sizes = np.diff(np.r_[starts, len(patients)])
+        rank = np.arange(len(patients)) - np.repeat(starts, sizes)
+        positions = cursor[patients] + rank
+        cursor[patients[starts]] += sizes
+        for column in dtypes:
+            if column in CODE_COLUMNS:
+                values = code_index[column].get_indexer(df[column]).astype(np.int32)
+            else:
+                values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64)
+            arrays[column][positions] = values[order]
+
+    # pass 3: order every block of patients by time
+    for start, stop in patient_blocks(offsets, batch_size):
+        order = np.argsort(arrays['timestamp'][start:stop], kind='stable')
+        # a stable sort by patient keeps the time order within each patient
+        block_patients = np.searchsorted(offsets, np.arange(start, stop), side='right')[order]
+        order = order[np.argsort(block_patients, kind='stable')]
+        for column, array in arrays.items():
+            array[start:stop] = array[start:stop][order]
+    for array in arrays.values():
+        array.flush()
+    del arrays
+
+    with open(os.path.join(index_dir, 'meta.json'), 'w') as handle:
+        json.dump({
+            'format': INDEX_FORMAT_VERSION,
+            'n_events': n_events,
+            'n_patients': len(patient_ids),
+            'columns': list(dtypes),
+            'dictionaries': dictionaries,
+        }, handle)
+    return TimelineIndex(index_dir)
+
+
+def patient_blocks(offsets, block_size):
+    '''
+    [start, stop) event ranges of consecutive patients holding about
+    block_size events each; a patient is never split
+    '''
+    n_events = int(offsets[-1])
+    start = 0
+    while start < n_events:
+        # first patient boundary at or after start + block_size
+        boundary = np.searchsorted(offsets, start + block_size, side='left')
+        stop = int(offsets[min(boundary, len(offsets) - 1)])
+        yield start, stop
+        start = stop
+
+
+class TimelineIndex():
+    '''
+    Read-only memory-mapped view of a timeline index
+
+    Attributes
+    ----------
+    index_dir : str
+        Directory of the index
+    patient_ids : numpy array of str
+        Sorted patient ids; patient code p is patient_ids[p]
+    offsets : numpy array of int64
+        Events of patient code p are rows offsets[p]:offsets[p + 1]
+    arrays : dict
+        Column -> memory-mapped array over every event
+    dictionaries : dict
+        Code column -> list of codes, in id order
+    '''
+
+    def __init__(self, index_dir, mmap_mode='r'):
+        self.index_dir = index_dir
+        self.mmap_mode = mmap_mode
+        with open(os.path.join(index_dir, 'meta.json')) as handle:
+            meta = json.load(handle)
+        if meta['format'] != INDEX_FORMAT_VERSION:
+            raise ValueError(f"timeline index format {meta['format']} is not supported, rebuild {index_dir}")
+        self.dictionaries = meta['dictionaries']
+        self.patient_ids = np.load(os.path.join(index_dir, 'patient_id.npy'), mmap_mode=mmap_mode)
+        self.offsets = np.load(os.path.join(index_dir, 'offsets.npy'), mmap_mode=mmap_mode)
+        self.arrays = {column: np.load(os.path.join(index_dir, f'{column}.npy'), mmap_mode=mmap_mode) for column in meta['columns']}
+        self._categories = {}
+
+    def __getstate__(self):
+        # worker processes reopen the mapping rather than receive a copy
+        return {'index_dir': self.index_dir, 'mmap_mode': self.mmap_mode}
+
+    def __setstate__(self, state):
+        self.__init__(state['index_dir'], state['mmap_mode'])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    @property
+    def n_patients(self):
+        return len(self.patient_ids)
+
+    def patient_code(self, patient_id):
+        '''
+        Code of a patient id, None if the patient has no events
+        '''
+        code = int(np.searchsorted(self.patient_ids, patient_id))
+        if code < self.n_patients and self.patient_ids[code] == patient_id:
+            return code
+        return None
+
+    def timeline(self, patient_id):
+        '''
+        Column -> zero-copy view of the events of one patient, in time order
+        '''
+        code = self.patient_code(patient_id)
+        start, stop = (0, 0) if code is None else (int(self.offsets[code]), int(self.offsets[code + 1]))
+        return {column: array[start:stop] for column, array in self.arrays.items()}
+
+    def code_mask(self, column, values):
+        '''
+        Boolean array over every event whose column matches a code list. The
+        code list is matched once against the column's dictionary (see codesets)
+        '''
+        dictionary = self.dictionaries[column]
+        lookup = np.append(compile_code_set(values, column).match_unique(dictionary), False) if dictionary else np.zeros(1, dtype=bool)
+        # missing codes are -1, which picks the trailing False
+        return lookup[self.arrays[column]]
+
+    def _category(self, column):
+        if column not in self._categories:
+            values = self.patient_ids if column == 'patient_id' else self.dictionaries[column]
+            self._categories[column] = pd.Index(values, dtype=object)
+        return self._categories[column]
+
+    def frame(self, rows):
+        '''
+        Dataframe of the events at rows (sorted positions), with categorical
+        patient and code columns. Rows in order give a frame sorted by
+        ['patient_id','timestamp']
+        '''
+        patients = np.searchsorted(self.offsets, rows, side='right') - 1
+        columns = {'patient_id': pd.Categorical.from_codes(patients, categories=self._category('patient_id'), validate=False)}
+        for column, array in self.arrays.items():
+            if column in CODE_COLUMNS:
+                columns[column] = pd.Categorical.from_codes(array[rows], categories=self._category(column), validate=False)
+            else:
+                columns[column] = array[rows]
+        return pd.DataFrame(columns)
+
+    def evaluate(self, evaluate, mask=None, block_size=1000000):
+        '''
+        Runs a constraint evaluator over the events selected by mask, one block
+        of complete patients at a time, without sorting
+
+        Parameters
+        ----------
+        evaluate : function
+            Takes a dataframe sorted by ['patient_id','timestamp'] holding complete
+            patient groups and returns the rows of the patients that satisfy the constraint
+        mask : numpy boolean array, optional
+            Events to evaluate, by default every event
+        block_size : int, optional
+            Events per block
+
+        Returns
+        -------
+        Dataframe of the rows returned by evaluate for every block
+        '''
+        results = []
+        for start, stop in patient_blocks(self.offsets, block_size):
+            rows = np.arange(start, stop) if mask is None else start + np.flatnonzero(mask[start:stop])
+            if len(rows):
+                results.append(evaluate(self.frame(rows)))
+        results = [df for df in results if len(df)]
+        if not results:
+            return pd.DataFrame()
+        return pd.concat(results, ignore_index=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the timeline index of a local records directory')
+    parser.add_argument('records_dir')
+    parser.add_argument('index_dir')
+    parser.add_argument('--batch-size', type=int, default=1000000)
+    args = parser.parse_args()
+    index = build_timeline_index(args.records_dir, args.index_dir, args.batch_size)
+    print(f'Indexed {len(index)} events of {index.n_patients} patients in {args.index_dir}')
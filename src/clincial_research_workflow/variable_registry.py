@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+'''
+Lazy registry of ClinicalVariable definitions.
+
+A variable library is stored as a serialized catalog instead of code that
+builds every variable on import. Each definition holds what the variable was
+built from, replayed through add_subvariable and add_constraint:
+
+    {"name": "mdd inclusion", "library": "diagnosis_variables", "attribute": "mdd_var",
+     "subvariables": [["mdd_codes", "dx", ["F32", ...]]],
+     "constraints": [["count", [2, 30, 365], "mdd_codes"]]}
+
+The catalog is read on the first lookup, and a variable is only built and
+finalized the first time it is asked for by name, then shared by every later
+lookup of the process. The seltorexant libraries (seltorexant_variables) are
+thin modules over the registry of seltorexant_variables/catalog.json.
+'''
+import json
+import os
+import threading
+
+try:
+    from .variables import ClinicalVariable
+except ImportError:
+    # imported as a top level module, next to variables
+    from variables import ClinicalVariable
+
+CATALOG_FORMAT_VERSION = 1
+SELTOREXANT_CATALOG = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'seltorexant_variables', 'catalog.json')
+
+
+def variable_definition(variable, **fields):
+    '''
+    Catalog definition of a ClinicalVariable, finalized or not, with extra fields
+    such as library and attribute. Code lists of constraints are written as the
+    names of their subvariables
+    '''
+    subvariable_of = lambda codes: variable.subvariable_name[variable.value.index(codes)]
+    constraints = []
+    for constraint_type, type_constraints in variable.constraint.items():
+        for constraint in type_constraints:
+            constraints.append([constraint_type, constraint[0]] + [subvariable_of(codes) for codes in constraint[1:]])
+    subvariables = [[name, category, list(value)] for name, category, value in zip(variable.subvariable_name or [], variable.category or [], variable.value or [])]
+    return dict({'name': variable.name}, **fields, subvariables=subvariables, constraints=constraints)
+
+
+def build_variable(definition):
+    '''
+    Finalized ClinicalVariable of a catalog definition
+    '''
+    variable = ClinicalVariable(definition['name'])
+    for name, category, value in definition['subvariables']:
+        variable.add_subvariable(subvariable_name=name, category=category, value=list(value))
+    for constraint in definition['constraints']:
+        # add_constraint replaces the names in the list it is given by code lists
+        variable.add_constraint(list(constraint))
+    variable.finalize_variable()
+    return variable
+
+
+def write_catalog(definitions, path):
+    '''
+    Writes definitions as a catalog, one definition per line
+    '''
+    lines = ',\n'.join(json.dumps(definition, separators=(',', ':')) for definition in definitions)
+    with open(path, 'w') as handle:
+        handle.write(f'{{"format":{CATALOG_FORMAT_VERSION},"variables":[\n{lines}\n]}}\n')
+
+
+class VariableRegistry():
+    '''
+    Variables of a catalog, built on first use
+
+    Attributes
+    ----------
+    catalog_path : str
+        Catalog written by write_catalog
+    '''
+
+    def __init__(self, catalog_path):
+        self.catalog_path = catalog_path
+        self._definitions = None
+        self._variables = {}
+        self._lock = threading.RLock()
+
+    def definitions(self):
+        '''
+        Variable name -> definition, in catalog order
+        '''
+        with self._lock:
+            if self._definitions is None:
+                with open(self.catalog_path) as handle:
+                    catalog = json.load(handle)
+                if catalog['format'] != CATALOG_FORMAT_VERSION:
+                    raise ValueError(f"variable catalog format {catalog['format']} is not supported, rewrite {self.catalog_path}")
+                self._definitions = {definition['name']: definition for definition in catalog['variables']}
+            return self._definitions
+
+    def names(self, library=None):
+        '''
+        Names of the variables of a library, or of every variable
+        '''
+        return [name for name, definition in self.definitions().items() if library is None or definition.get('library') == library]
+
+    def get(self, name):
+        '''
+        Finalized ClinicalVariable of a name, built once
+
+        Raises
+        ------
+        KeyError
+            If the catalog has no variable of that name
+        '''
+        with self._lock:
+            if name not in self._variables:
+                self._variables[name] = build_variable(self.definitions()[name])
+            return self._variables[name]
+
+    def variables(self, library=None):
+        '''
+        Finalized ClinicalVariables of a library, or of every variable
+        '''
+        return [self.get(name) for name in self.names(library)]
+
+    def attribute(self, library, attribute):
+        '''
+        Variable of a library stored under a module attribute name (e.g. mdd_var),
+        or else the code list of a subvariable of that name (e.g. mdd_codes).
+        None if the library has neither
+        '''
+        definitions = [definition for definition in self.definitions().values() if definition.get('library') == library]
+        for definition in definitions:
+            if definition.get('attribute') == attribute:
+                return self.get(definition['name'])
+        for definition in definitions:
+            for name, category, value in definition['subvariables']:
+                if name == attribute:
+                    return list(value)
+        return None
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def registry(catalog_path=SELTOREXANT_CATALOG):
+    '''
+    VariableRegistry of a catalog, one per catalog and process
+    '''
+    with _registries_lock:
+        if catalog_path not in _registries:
+            _registries[catalog_path] = VariableRegistry(catalog_path)
+        return _registries[catalog_path]
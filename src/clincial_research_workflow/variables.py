@@ -147,7 +147,7 @@ class ClinicalVariable():
             if 'count' in self.constraint.keys():
                 self.constraint['count'].append([[1, 0, 0], value])
             else:
-                self.constraint['count'] = [[1, 0, 0], value]
+                self.constraint['count'] = [[[1, 0, 0], value]]
                 # default is a single variable count if not otherswise stated
         for value in unconstrained_values:
             self.constraint
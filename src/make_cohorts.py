@@ -1,14 +1,22 @@
+import os
 import pandas as pd
 from datetime import datetime
 
-from nferx_sdk.data_sources import RecordsAPIWrapper, ClinicalTrialsAPIWrapper
-from nferx_sdk.utils.query import inQuery, andQuery
+from clincial_research_workflow.dump_cache import DumpCache, and_spec, dump_spec, in_spec
 
+LOCAL_RECORDS_DIR = os.environ.get("LOCAL_RECORDS_DIR")
 
-# Set the NFERENCE_USER and NFERENCE_TOKEN access keys
-from utils.util import initialize_credentials
+if LOCAL_RECORDS_DIR:
+    # offline backend over parquet files, e.g. written by synthetic_ehr
+    from clincial_research_workflow.local_records import LocalRecordsAPIWrapper, inQuery, andQuery
+else:
+    from nferx_sdk.data_sources import RecordsAPIWrapper, ClinicalTrialsAPIWrapper
+    from nferx_sdk.utils.query import inQuery, andQuery
 
-initialize_credentials()
+    # Set the NFERENCE_USER and NFERENCE_TOKEN access keys
+    from utils.util import initialize_credentials
+
+    initialize_credentials()
 
 # initialize_credentials()
 
@@ -32,7 +40,7 @@ drugs = [
     "Citalopram",
 ]
 
-rec = RecordsAPIWrapper()
+rec = LocalRecordsAPIWrapper(LOCAL_RECORDS_DIR) if LOCAL_RECORDS_DIR else RecordsAPIWrapper()
 cml_codes_list = rec.getDiagnosticCodesFromDisease(DISEASE_NAME)
 
 
@@ -41,6 +49,7 @@ def get_filtered_patients(
     num_months: int = NUM_MONTHS,
     occurrence_count: int = 2,
     medication_query: str = None,
+    cache: DumpCache = None,
 ) -> pd.DataFrame:
     """Given a list of ICD codes, a temporal window (start and end timestamps), an occurrence count,
     return list of patient_IDs and timestamps
@@ -51,48 +60,62 @@ def get_filtered_patients(
         end_timestamp (datetime): [description]
         occurrence_count (int): Minimum numnber of occurrences for one of the ICD codes to occur.  Default is 2.
         medication_query (str): (optional): default None
+        cache (DumpCache): (optional): on-disk cache of SDK dumps; the SDK is only queried on a miss. default None
 
     Returns:
         df: Cohort list of Patient IDs matching the filtering criteria specified via arguments.
     """
 
-    # (Optional) get the medications query
-    meds_query = inQuery(
-        [
-            "medication_generic_name",
-            "order_description",
-            "med_generic",
-            "order_drugs",
-            "meds_drugs",
-            "med_generic",
-            "med_name_description",
-            "med_generic_name_description",
-        ],
-        drugs,
-    )
-    codes_query = inQuery("diagnosis_code", icd_code_list)
-    query = andQuery(meds_query, codes_query)
-
-    cohort1 = rec.makeCohort(
-        cohortName="cohort_name_here",
-        cohortSpecifier=query,
-        timeWindow=num_months,
-        unit=UNIT_NAME,
-    )
-
-    cohort1.initDump(
-        cohortProjector=[
-            "patient_id",
-            "timestamp",
-            "diagnosis_code",
-            "meds_drugs",
-            "disease",
-        ]
-    )
-
-    if cohort1.advanceDF():
-        df = cohort1.getDF()
-        # display(df)
+    meds_columns = [
+        "medication_generic_name",
+        "order_description",
+        "med_generic",
+        "order_drugs",
+        "meds_drugs",
+        "med_generic",
+        "med_name_description",
+        "med_generic_name_description",
+    ]
+    projector = [
+        "patient_id",
+        "timestamp",
+        "diagnosis_code",
+        "meds_drugs",
+        "disease",
+    ]
+
+    def fetch():
+        # (Optional) get the medications query
+        meds_query = inQuery(meds_columns, drugs)
+        codes_query = inQuery("diagnosis_code", icd_code_list)
+        query = andQuery(meds_query, codes_query)
+
+        cohort1 = rec.makeCohort(
+            cohortName="cohort_name_here",
+            cohortSpecifier=query,
+            timeWindow=num_months,
+            unit=UNIT_NAME,
+        )
+
+        cohort1.initDump(cohortProjector=projector)
+
+        while cohort1.advanceDF():
+            yield cohort1.getDF()
+
+    if cache is None:
+        chunks = fetch()
+    else:
+        spec = dump_spec(
+            and_spec(in_spec(meds_columns, drugs), in_spec("diagnosis_code", icd_code_list)),
+            projector,
+            time_window=num_months,
+            unit=UNIT_NAME,
+        )
+        chunks = cache.chunks(spec, fetch)
+
+    chunks = list(chunks)
+    df = pd.concat(chunks, ignore_index=True) if chunks else None
+    # display(df)
 
     return df
 
@@ -0,0 +1,70 @@
+import copy
+import importlib.util
+import os
+import sys
+import tempfile
+
+import pytest
+
+# build_cohort_je and its helpers import each other as top level modules
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "clincial_research_workflow"))
+
+from cohorts import ClinicalCohort  # noqa: E402
+from local_records import LocalRecordsAPIWrapper  # noqa: E402
+from synthetic_ehr import write_synthetic_records  # noqa: E402
+from variables import ClinicalVariable  # noqa: E402
+
+# without the SDK, build_cohort_je runs on the local parquet backend; tests point
+# build_cohort_je.rec at their own records
+if importlib.util.find_spec("nferx_sdk") is None:
+    os.environ.setdefault("LOCAL_RECORDS_DIR", tempfile.mkdtemp(prefix="records_"))
+
+# code lists of the synthetic records shared by the cohort tests
+CODE_LISTS = {
+    "dx": {"depression": ["F32", "F33.0"], "renal": ["N18.3", "N184"], "hepatic": ["K70", "K72.1"], "diabetes_codes": ["E119"]},
+    "drug": {"ssri": ["sertraline", "fluoxetine"], "metformin": ["metformin"]},
+}
+STUDY_WINDOW = [20000101, 20220101]
+
+
+def write_records(out_dir, seed=0):
+    return write_synthetic_records(out_dir, 30000, n_patients=300, seed=seed, code_lists=CODE_LISTS)
+
+
+@pytest.fixture
+def records_dir(tmp_path, monkeypatch):
+    '''
+    Synthetic records of CODE_LISTS, served to build_cohort_je by the local backend
+    '''
+    bcj = pytest.importorskip("build_cohort_je")
+    out_dir = str(tmp_path / "records")
+    write_records(out_dir)
+    monkeypatch.setattr(bcj, "rec", LocalRecordsAPIWrapper(out_dir))
+    return out_dir
+
+
+def variable_of(name, subvariables, constraints=()):
+    '''
+    ClinicalVariable of subvariables named in CODE_LISTS or given as
+    (name, category, codes), with constraints as passed to add_constraint
+    '''
+    variable = ClinicalVariable(name)
+    for subvariable in subvariables:
+        if isinstance(subvariable, str):
+            category = next(category for category, code_lists in CODE_LISTS.items() if subvariable in code_lists)
+            subvariable = (subvariable, category, CODE_LISTS[category][subvariable])
+        subvariable_name, category, codes = subvariable
+        variable.add_subvariable(subvariable_name=subvariable_name, category=category, value=codes)
+    for constraint in constraints:
+        # add_constraint replaces the subvariable names by their values
+        variable.add_constraint(copy.deepcopy(constraint))
+    variable.finalize_variable()
+    return variable
+
+
+def protocol(inclusion=(), exclusion=(), study_window=STUDY_WINDOW):
+    cohort = ClinicalCohort("protocol", study_window)
+    for category, variables in [("inclusion", inclusion), ("exclusion", exclusion)]:
+        for variable in variables:
+            cohort.add_clinical_variable(variable, category)
+    return cohort
@@ -0,0 +1,56 @@
+import importlib.util
+import os
+
+import pytest
+
+from ..conftest import STUDY_WINDOW, protocol, variable_of
+
+bcj = pytest.importorskip("build_cohort_je")
+
+# the nodes do not depend on kedro, unlike the package of the pipeline
+NODES_PATH = os.path.join(os.path.dirname(bcj.__file__), "pipelines", "cohort", "nodes.py")
+spec = importlib.util.spec_from_file_location("cohort_nodes", NODES_PATH)
+nodes = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(nodes)
+
+
+def cohort_protocol():
+    depression = variable_of("mdd inclusion", ["depression"], [["count", [2, 30, 365], "depression"]])
+    ssri = variable_of("ssri", ["ssri"], [["count", [2, 0, 730], "ssri"], ["only_one", 30, "ssri"]])
+    return protocol([depression], [variable_of("renal", ["renal"]), ssri])
+
+
+class TestCohortNodes:
+    def test_nodes_build_the_cohort(self, records_dir, tmp_path):
+        cohort = cohort_protocol()
+        params = {"study_window": STUDY_WINDOW, "cache_dir": str(tmp_path / "cache")}
+        patients = {"inclusion": [], "exclusion": []}
+        for variable, category in zip(cohort.clinical_variable, cohort.variable_category):
+            dfs = [nodes.evaluate_constraint(variable, constraint_type, constraint, params) for constraint_type, constraint in bcj.evaluated_constraints(variable)]
+            assert all(list(df.columns) == ["patient_id"] and df["patient_id"].is_unique for df in dfs)
+            patients[category].append(nodes.union_patients(*dfs))
+        result = nodes.subtract_patients(nodes.intersect_patients(*patients["inclusion"]), nodes.union_patients(*patients["exclusion"]))
+        expected = sorted(bcj.create_cohort(cohort, max_workers=1))
+        assert len(expected) and result["patient_id"].tolist() == expected
+
+    def test_set_nodes_without_variables(self):
+        assert len(nodes.intersect_patients()) == 0 and len(nodes.union_patients()) == 0
+
+    def test_pipeline_has_a_node_per_constraint(self):
+        pytest.importorskip("kedro")
+        from clincial_research_workflow.pipelines.cohort.pipeline import cohort_datasets, create_pipeline
+        cohort = cohort_protocol()
+        pipeline = create_pipeline(cohort)
+        assert len(pipeline.nodes) == 4 + 3 + 3
+        assert set(pipeline.inputs()) == {"params:cohort"}
+        assert set(pipeline.outputs()) == {"cohort_patients"}
+        assert set(pipeline.data_sets()) - {"params:cohort"} == set(cohort_datasets(cohort))
+
+    def test_only_pipeline_outputs_get_a_filepath(self):
+        pytest.importorskip("kedro")
+        from clincial_research_workflow.pipelines.cohort.pipeline import dataset_filepath
+        assert dataset_filepath("cohort_patients") == "data/03_primary/cohort_patients.parquet"
+        assert dataset_filepath("age_constraint_0") == "data/02_intermediate/age_constraint_0.parquet"
+        assert dataset_filepath("age_patients") == "data/02_intermediate/age_patients.parquet"
+        assert dataset_filepath("params:cohort") is None
+        assert dataset_filepath("patients") is None
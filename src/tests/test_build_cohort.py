@@ -0,0 +1,159 @@
+import pytest
+
+from cohorts import ClinicalCohort
+from local_records import LocalCohort, LocalRecordsAPIWrapper
+from synthetic_ehr import write_synthetic_records
+from variables import ClinicalVariable
+
+bcj = pytest.importorskip("build_cohort_je")
+
+CODE_LISTS = {
+    "dx": {"mdd_codes": ["F32", "F329"], "bipolar_codes": ["F31"], "sleep_codes": ["G4733"]},
+    "drug": {"ssri_snri": ["sertraline", "fluoxetine"]},
+}
+
+
+@pytest.fixture(scope="module")
+def records_dir(tmp_path_factory):
+    out_dir = str(tmp_path_factory.mktemp("records"))
+    write_synthetic_records(out_dir, 60000, n_patients=600, code_lists=CODE_LISTS)
+    return out_dir
+
+
+@pytest.fixture
+def rec(records_dir, monkeypatch):
+    rec = LocalRecordsAPIWrapper(records_dir, chunk_size=2000)
+    monkeypatch.setattr(bcj, "rec", rec)
+    return rec
+
+
+def make_cohort():
+    mdd = ClinicalVariable("mdd")
+    mdd.add_subvariable(subvariable_name="mdd_codes", category="dx", value=CODE_LISTS["dx"]["mdd_codes"])
+    mdd.add_constraint(["count", [2, 30, 365], "mdd_codes"])
+    ssri = ClinicalVariable("ssri")
+    ssri.add_subvariable(subvariable_name="ssri_snri", category="drug", value=CODE_LISTS["drug"]["ssri_snri"])
+    ssri.add_constraint(["count", [1, 0, 0], "ssri_snri"])
+    exclusions = []
+    for name in ["bipolar_codes", "sleep_codes"]:
+        variable = ClinicalVariable(name)
+        variable.add_subvariable(subvariable_name=name, category="dx", value=CODE_LISTS["dx"][name])
+        variable.finalize_variable()
+        exclusions.append(variable)
+    cohort = ClinicalCohort("test", [20000101, 20220101])
+    cohort.add_clinical_variable(ssri, "inclusion")
+    cohort.add_clinical_variable(mdd, "inclusion")
+    for variable in exclusions:
+        cohort.add_clinical_variable(variable, "exclusion")
+    return cohort
+
+
+class TestBuildCohort:
+    def test_matches_create_cohort(self, rec):
+        cohort = make_cohort()
+        expected = bcj.create_cohort(cohort, max_workers=1)
+        assert len(expected)
+        assert sorted(cohort.build_cohort(max_workers=1)) == sorted(expected)
+
+    def test_most_selective_inclusion_first_and_pushdown(self, rec, monkeypatch):
+        cohort = make_cohort()
+        expected = bcj.create_cohort(cohort, max_workers=1)
+        pulls = []
+        make = rec.makeCohort
+        monkeypatch.setattr(rec, "makeCohort", lambda name, cohortSpecifier=None, **kwargs: pulls.append(name) or make(name, cohortSpecifier, **kwargs))
+        monkeypatch.setattr(bcj, "PUSHDOWN_BATCH_SIZE", 25)
+        result = cohort.build_cohort(max_workers=1, selectivity={"ssri": 500, "mdd": 10})
+        assert sorted(result) == sorted(expected)
+        # mdd is evaluated first in one pull, later variables in batches of pushed down patients
+        assert pulls[0] == "mdd" and pulls.count("mdd") == 1
+        assert pulls.count("ssri") > 1
+
+    def test_selectivity_is_counted_without_pulling(self, rec, monkeypatch):
+        cohort = make_cohort()
+        # mdd is defined first, ssri includes fewer patients
+        cohort.clinical_variable[:2] = cohort.clinical_variable[1::-1]
+        expected = bcj.create_cohort(cohort, max_workers=1)
+        study_window = [bcj.convert_to_unix(element) for element in cohort.study_window]
+        estimates = {variable.name: bcj.estimate_selectivity(variable, study_window) for variable in cohort.clinical_variable[:2]}
+        assert 0 < estimates["ssri"] < estimates["mdd"]
+        pulls = []
+        make = rec.makeCohort
+        monkeypatch.setattr(rec, "makeCohort", lambda name, cohortSpecifier=None, **kwargs: pulls.append(name) or make(name, cohortSpecifier, **kwargs))
+        assert sorted(cohort.build_cohort(max_workers=1)) == sorted(expected)
+        assert pulls[0] == "ssri" and pulls.count("ssri") == 1
+
+        # without counts or a cached dump, inclusions keep their definition order
+        monkeypatch.delattr(type(rec), "countCohort")
+        assert bcj.estimate_selectivity(cohort.clinical_variable[0], study_window) is None
+        pulls.clear()
+        assert sorted(cohort.build_cohort(max_workers=1)) == sorted(expected)
+        assert pulls[0] == "mdd" and pulls.count("mdd") == 1
+
+    def test_empty_cohort_stops_the_build(self, rec, monkeypatch):
+        cohort = make_cohort()
+        cohort.study_window = [20300101, 20310101]
+        pulls = []
+        make = rec.makeCohort
+        monkeypatch.setattr(rec, "makeCohort", lambda name, cohortSpecifier=None, **kwargs: pulls.append(name) or make(name, cohortSpecifier, **kwargs))
+        assert cohort.build_cohort(max_workers=1, selectivity={"ssri": 1, "mdd": 2}) == []
+        assert pulls == ["ssri"]
+
+    def test_funnel_is_read_from_the_criteria_matrix(self, rec, monkeypatch):
+        cohort = make_cohort()
+        funnel = cohort.build_cohort_funnel(max_workers=1)
+        assert list(funnel) == ["inclusion", "exclusion"]
+        assert list(funnel["inclusion"]) == ["ssri", "mdd"]
+        assert funnel["exclusion"]["sleep_codes"] == len(bcj.create_cohort(cohort, max_workers=1))
+
+        pulls = []
+        monkeypatch.setattr(rec, "makeCohort", lambda *args, **kwargs: pulls.append(args))
+        reordered = cohort.build_cohort_funnel(order=["mdd", "sleep_codes", "ssri", "bipolar_codes"])
+        assert pulls == []
+        assert reordered["inclusion"]["ssri"] >= funnel["exclusion"]["sleep_codes"]
+        assert cohort.criteria_matrix.without("sleep_codes") >= funnel["exclusion"]["sleep_codes"]
+
+    def test_funnel_is_evaluated_again_after_changes(self, rec, monkeypatch):
+        cohort = make_cohort()
+        funnel = cohort.build_cohort_funnel(max_workers=1)
+        evaluated = []
+        evaluate = bcj.evaluate_criteria
+        monkeypatch.setattr(bcj, "evaluate_criteria", lambda *args, **kwargs: evaluated.append(kwargs) or evaluate(*args, **kwargs))
+        assert cohort.build_cohort_funnel(max_workers=2) == funnel and evaluated == []
+        cohort.build_cohort_funnel(max_workers=1, memory_limit=10 ** 6)
+        assert evaluated[-1]["memory_limit"] == 10 ** 6
+        cohort.study_window = [20300101, 20310101]
+        assert cohort.build_cohort_funnel(max_workers=1, memory_limit=10 ** 6)["inclusion"] == {"ssri": 0, "mdd": 0}
+        cohort.study_window = [20000101, 20220101]
+        cohort.variable_category[1] = "exclusion"
+        assert list(cohort.build_cohort_funnel(max_workers=1, memory_limit=10 ** 6)["exclusion"]) == ["mdd", "bipolar_codes", "sleep_codes"]
+        assert len(evaluated) == 3
+
+    @pytest.mark.parametrize("fetch_scope", [None, "variable", "cohort"])
+    def test_existence_constraints_pull_patient_ids_only(self, rec, monkeypatch, fetch_scope):
+        cohort = make_cohort()
+        projectors = []
+        init_dump = LocalCohort.initDump
+        monkeypatch.setattr(LocalCohort, "initDump", lambda self, cohortProjector: projectors.append(list(cohortProjector)) or init_dump(self, cohortProjector))
+        fast = bcj.evaluate_criteria(cohort, fetch_scope=fetch_scope, max_workers=1)
+        if fetch_scope != "cohort":
+            assert ["patient_id"] in projectors
+
+        monkeypatch.setattr(bcj, "is_existence_constraint", lambda *args: False)
+        slow = bcj.evaluate_criteria(cohort, fetch_scope=fetch_scope, max_workers=1)
+        assert [fast.count([name], []) for name in fast.names] == [slow.count([name], []) for name in slow.names]
+
+    def test_existence_constraints_of_one_pull_keep_their_own_patients(self, rec):
+        mood = ClinicalVariable("mood")
+        for name in ["mdd_codes", "bipolar_codes"]:
+            mood.add_subvariable(subvariable_name=name, category="dx", value=CODE_LISTS["dx"][name])
+        mood.finalize_variable()
+        study_window = [bcj.convert_to_unix(element) for element in [20000101, 20220101]]
+        fetches = [bcj.constraint_fetch(mood, constraint, "count") for constraint in mood.constraint["count"]]
+        plan = bcj.FetchPlan(study_window)
+        for fetch in fetches:
+            plan.add(fetch)
+        assert plan.existence_only("mood")
+        for fetch, result in zip(fetches, bcj.execute_plan(plan, max_workers=1)["mood"]):
+            expected = bcj.create_query_from_constraint("mood", mood, fetch.constraint, "count", study_window)
+            assert len(expected) > 0
+            assert set(result["patient_id"]) == set(expected["patient_id"])
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from codesets import compile_code_set, dotted_codes, normalize_code
+from local_records import LocalRecordsAPIWrapper
+from variables import ClinicalVariable
+
+bcj = pytest.importorskip("build_cohort_je")
+
+
+def reference_match(code, values):
+    canonical = [normalize_code(value) for value in values]
+    stems = [value[:-1] for value in canonical if value.endswith("*")]
+    code = normalize_code(code)
+    return code in canonical or any(code.startswith(stem) for stem in stems)
+
+
+class TestCodeSets:
+    def test_normalizes_deduplicates_and_folds_children_into_stems(self):
+        code_set = compile_code_set(["F15.15", "F1515", "292.89", "29289", " f32 ", "F32.9", "F3289", "F3*", "G47.33"])
+        assert code_set.stems == ["F3"]
+        assert code_set.codes == ["F1515", "29289", "F32", "F329", "F3289", "G4733"]
+        assert code_set.exact == ["F1515", "29289", "G4733"]
+        assert {"F15.15", "F1515", "292.89", "29289", "G47.33", "G4733"} <= set(code_set.query_values())
+
+    def test_category_codes_are_matched_exactly_unless_starred(self):
+        series = pd.Series(["F32", "F32.1", "F329", "290", "290.1"])
+        code_set = compile_code_set(["F32", "290"])
+        assert code_set.stems == [] and code_set.exact == ["F32", "290"]
+        assert code_set.mask(series).tolist() == [True, False, False, True, False]
+        code_set = compile_code_set(["F32*", "290"])
+        assert code_set.stems == ["F32"] and code_set.exact == ["290"]
+        assert code_set.mask(series).tolist() == [True, True, True, True, False]
+
+    def test_icd9_external_cause_and_icd10_e_codes(self):
+        assert dotted_codes("E1165") == ["E11.65"]
+        assert dotted_codes("E119") == ["E11.9"]
+        assert dotted_codes("E9500") == ["E950.0"]
+        assert dotted_codes("E8889") == ["E888.9", "E88.89"]
+        assert dotted_codes("E950") == [] and dotted_codes("E11") == []
+        code_set = compile_code_set(["E950*", "E11*", "E1165", "E9889"])
+        assert code_set.stems == ["E11", "E950"]
+        assert code_set.exact == ["E9889"]
+        assert code_set.mask(pd.Series(["E950.4", "E11.65", "E11.9", "E988.9", "E951.0", "E1"])).tolist() == [True, True, True, True, False, False]
+        assert {"E11.65", "E988.9"} <= set(code_set.query_values())
+        assert "E116.5" not in code_set.query_values()
+
+    def test_drug_names_are_matched_exactly(self):
+        code_set = compile_code_set(["sertraline", "sertraline", "Fluoxetine"], "meds_drugs")
+        assert code_set.mask(pd.Series(["sertraline", "fluoxetine", "Fluoxetine", None])).tolist() == [True, False, True, False]
+        assert code_set.query_values() == ["sertraline", "Fluoxetine"]
+
+    @pytest.mark.parametrize("seed", range(5))
+    def test_mask_matches_reference_on_object_and_categorical_columns(self, seed):
+        rng = np.random.default_rng(seed)
+        vocabulary = ["F32", "F32.1", "F329", "f3289", "F33.0", "292.89", "29289", "2928", "311", "3110", "E119", "E11.9", None]
+        values = list(rng.choice([code for code in vocabulary if code is not None] + ["F32*", "292*", "E11*"], rng.integers(1, 6)))
+        series = pd.Series(rng.choice(np.array(vocabulary, dtype=object), 500))
+        expected = [code is not None and reference_match(code, values) for code in series]
+        assert compile_code_set(values, "diagnosis_code").mask(series).tolist() == expected
+        assert compile_code_set(values, "diagnosis_code").mask(series.astype("category")).tolist() == expected
+
+    def test_stems_fetch_children_through_prefix_queries(self, tmp_path, monkeypatch):
+        events = pd.DataFrame({
+            "patient_id": ["a", "a", "b", "c", "d"],
+            "timestamp": [1.6e9, 1.6e9 + 86400 * 40, 1.6e9, 1.6e9, 1.6e9],
+            "diagnosis_code": ["F32.1", "F329", "F33.0", "F32", "E11.9"],
+            "meds_drugs": [None] * 5,
+        })
+        (tmp_path / "events").mkdir()
+        events.to_parquet(tmp_path / "events" / "part-00000.parquet", index=False)
+        monkeypatch.setattr(bcj, "rec", LocalRecordsAPIWrapper(str(tmp_path)))
+
+        variable = ClinicalVariable("depression")
+        variable.add_subvariable(subvariable_name="depression", category="dx", value=["F32*", "F33.0"])
+        variable.add_constraint(["count", [1, 0, 0], "depression"])
+        study_window = [bcj.convert_to_unix(element) for element in [20000101, 20220101]]
+        result = bcj.create_query_from_constraint(variable.name, variable, variable.constraint["count"][0], "count", study_window)
+        assert sorted(result["patient_id"]) == ["a", "b", "c"]
+
+        variable.constraint["count"] = [[[2, 30, 365], ["F32*"]]]
+        variable.value = [["F32*"]]
+        result = bcj.create_query_from_constraint(variable.name, variable, variable.constraint["count"][0], "count", study_window)
+        assert sorted(result["patient_id"].unique()) == ["a"]
+
+        # without the star, F32 is a code like any other
+        variable.constraint["count"] = [[[1, 0, 0], ["F32"]]]
+        variable.value = [["F32"]]
+        result = bcj.create_query_from_constraint(variable.name, variable, variable.constraint["count"][0], "count", study_window)
+        assert sorted(result["patient_id"]) == ["c"]
+
+        # a backend without prefix queries cannot fetch the children of a stem
+        monkeypatch.setattr(bcj, "prefixQuery", None)
+        with pytest.raises(ValueError):
+            bcj.create_query("diagnosis", ["F32*"])
+        assert bcj.create_query_spec("diagnosis", ["F32"])
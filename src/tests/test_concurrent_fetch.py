@@ -0,0 +1,129 @@
+import threading
+
+import pytest
+
+import concurrent_fetch
+from concurrent_fetch import AdaptiveLimiter, is_throttled, run_concurrently, run_with_backoff
+from local_records import LocalRecordsAPIWrapper
+
+
+class Throttled(Exception):
+    status_code = 429
+
+
+class Flaky():
+    '''
+    Task throttled on its first n_throttles calls
+    '''
+
+    def __init__(self, value, n_throttles=0, error=Throttled):
+        self.value = value
+        self.n_throttles = n_throttles
+        self.error = error
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.n_throttles:
+            raise self.error()
+        return self.value
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    delays = []
+    monkeypatch.setattr(concurrent_fetch.time, "sleep", delays.append)
+    monkeypatch.setattr(concurrent_fetch.random, "random", lambda: 1.0)
+    return delays
+
+
+class TestConcurrentFetch:
+    def test_throttling_is_recognized(self):
+        assert is_throttled(Throttled())
+        assert is_throttled(RuntimeError("Service Unavailable"))
+        assert not is_throttled(ValueError("bad query"))
+
+    def test_limiter_backs_off_and_recovers(self):
+        limiter = AdaptiveLimiter(8, recover_after=2)
+        for limit in [4, 2, 1, 1]:
+            limiter.acquire()
+            limiter.release(throttled=True)
+            assert limiter.limit == limit
+        for _ in range(2 * 10):
+            limiter.acquire()
+            limiter.release()
+        assert limiter.limit == 8
+
+    def test_limiter_blocks_beyond_its_limit(self):
+        limiter = AdaptiveLimiter(1)
+        limiter.acquire()
+        acquired = threading.Event()
+        waiter = threading.Thread(target=lambda: limiter.acquire() or acquired.set())
+        waiter.start()
+        assert not acquired.wait(0.1)
+        limiter.release()
+        assert acquired.wait(5)
+        waiter.join()
+
+    def test_backoff_retries_throttled_tasks(self, delays):
+        limiter = AdaptiveLimiter(4)
+        task = Flaky("rows", n_throttles=3)
+        assert run_with_backoff(task, limiter, base_delay=1.0, max_delay=3.0) == "rows"
+        assert task.calls == 4
+        assert delays == [1.0, 2.0, 3.0]
+        assert limiter.limit == 1
+
+    def test_errors_propagate(self, delays):
+        limiter = AdaptiveLimiter(2)
+        task = Flaky("rows", n_throttles=1, error=ValueError)
+        with pytest.raises(ValueError):
+            run_with_backoff(task, limiter)
+        assert (task.calls, delays, limiter.limit) == (1, [], 2)
+        task = Flaky("rows", n_throttles=10)
+        with pytest.raises(Throttled):
+            run_with_backoff(task, limiter, max_retries=2)
+        assert task.calls == 3
+        # a failed task releases its slot
+        assert limiter._running == 0
+
+    def test_results_keep_task_order_under_the_limit(self, delays):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def task(value):
+            with lock:
+                running.append(value)
+                peak.append(len(running))
+            # time.sleep is patched by the delays fixture
+            threading.Event().wait(0.01)
+            with lock:
+                running.remove(value)
+            return value
+
+        tasks = [lambda value=value: task(value) for value in range(20)]
+        assert run_concurrently(tasks, max_workers=3) == list(range(20))
+        assert max(peak) <= 3
+        flaky = [Flaky(value, n_throttles=value % 2) for value in range(6)]
+        assert run_concurrently(flaky, max_workers=3) == list(range(6))
+        assert len(delays) == 3
+        with pytest.raises(ValueError):
+            run_concurrently([Flaky(0), Flaky(1, n_throttles=1, error=ValueError)], max_workers=2)
+
+    def test_threads_get_their_own_records_client(self, tmp_path, monkeypatch):
+        bcj = pytest.importorskip("build_cohort_je")
+        rec = LocalRecordsAPIWrapper(str(tmp_path), chunk_size=10)
+        monkeypatch.setattr(bcj, "rec", rec)
+
+        def task():
+            # keeps the worker busy so that every task gets a thread of its own
+            threading.Event().wait(0.05)
+            return threading.get_ident(), bcj.records_client(), bcj.records_client()
+
+        clients = run_concurrently([task for _ in range(4)], max_workers=4)
+        assert bcj.records_client() is rec
+        for ident, first, second in clients:
+            assert first is second and first is not rec
+            assert (first.records_dir, first.chunk_size) == (rec.records_dir, 10)
+        client_of = {ident: id(first) for ident, first, second in clients}
+        assert len(client_of) > 1 and len(set(client_of.values())) == len(client_of)
@@ -0,0 +1,86 @@
+import pytest
+
+from constraint_memo import ConstraintMemo, constraint_fingerprint
+from local_records import LocalRecordsAPIWrapper
+
+from .conftest import protocol, variable_of, write_records
+
+bcj = pytest.importorskip("build_cohort_je")
+
+
+def mdd_protocol(gaps):
+    mdd = variable_of("mdd", ["depression"], [["count", gaps, "depression"]])
+    return protocol([mdd], [variable_of("renal", ["renal"]), variable_of("hepatic", ["hepatic"])])
+
+
+def mdd_variable(name, codes, gaps):
+    return variable_of(name, [(name, "dx", codes)], [["count", gaps, name]])
+
+
+def fingerprint(variable, study_window=(0, 1), data_version="v1"):
+    constraint_type, constraint = next(bcj.evaluated_constraints(variable))
+    fetch = bcj.constraint_fetch(variable, constraint, constraint_type)
+    return constraint_fingerprint(fetch, bcj.constraint_links(variable, fetch), list(study_window), data_version)
+
+
+class TestConstraintMemo:
+    def test_fingerprint_ignores_names_spelling_and_order(self):
+        reference = fingerprint(mdd_variable("mdd_var", ["F32*", "F33.0", "F33.1"], [2, 30, 365]))
+        assert fingerprint(mdd_variable("depression", ["F331", "f33.0", "F32*", "F32.9"], [2, 30, 365])) == reference
+        assert fingerprint(mdd_variable("mdd_var", ["F32*", "F33.0"], [2, 30, 365])) != reference
+        assert fingerprint(mdd_variable("mdd_var", ["F32*", "F33.0", "F33.1"], [2, 30, 180])) != reference
+        assert fingerprint(mdd_variable("mdd_var", ["F32*", "F33.0", "F33.1"], [2, 30, 365]), study_window=(0, 2)) != reference
+        assert fingerprint(mdd_variable("mdd_var", ["F32*", "F33.0", "F33.1"], [2, 30, 365]), data_version="v2") != reference
+
+    @pytest.mark.parametrize("fetch_scope", [None, "variable", "cohort"])
+    def test_variants_share_memoized_constraints(self, records_dir, tmp_path, monkeypatch, fetch_scope):
+        memo = ConstraintMemo(str(tmp_path / "memo"))
+        fetch_chunks = bcj.fetch_chunks
+        fetched = []
+        monkeypatch.setattr(bcj, "fetch_chunks", lambda *args, **kwargs: fetched.append(args[0]) or fetch_chunks(*args, **kwargs))
+
+        first = bcj.create_cohort(mdd_protocol([2, 30, 365]), fetch_scope=fetch_scope, max_workers=1, memo=memo)
+        assert (memo.hits, memo.misses) == (0, 3)
+        fetched.clear()
+        # a variant with another inclusion shares both exclusions
+        variant = bcj.create_cohort(mdd_protocol([2, 0, 180]), fetch_scope=fetch_scope, max_workers=1, memo=memo)
+        assert (memo.hits, memo.misses) == (2, 4)
+        assert fetched == ["cohort" if fetch_scope == "cohort" else "mdd"]
+        assert sorted(variant) == sorted(bcj.create_cohort(mdd_protocol([2, 0, 180]), fetch_scope=fetch_scope, max_workers=1))
+        assert sorted(bcj.create_cohort(mdd_protocol([2, 30, 365]), fetch_scope=fetch_scope, max_workers=1, memo=memo)) == sorted(first)
+        assert memo.hits == 5
+
+    def test_new_records_miss_and_entries_are_evicted(self, records_dir, tmp_path):
+        memo = ConstraintMemo(str(tmp_path / "memo"), max_bytes=1)
+        bcj.create_cohort(mdd_protocol([2, 30, 365]), max_workers=1, memo=memo)
+        # only the entry written last is kept within max_bytes
+        assert len(memo.store.entries()) == 1
+        write_records(records_dir, seed=1)
+        misses = memo.misses
+        bcj.create_cohort(mdd_protocol([2, 30, 365]), max_workers=1, memo=memo)
+        assert memo.misses == misses + 3
+
+    def test_records_without_a_version_are_not_memoized(self, records_dir, tmp_path, monkeypatch):
+        monkeypatch.delattr(LocalRecordsAPIWrapper, "dataVersion")
+        memo = ConstraintMemo(str(tmp_path / "memo"))
+        expected = bcj.create_cohort(mdd_protocol([2, 30, 365]), max_workers=1)
+        assert sorted(bcj.create_cohort(mdd_protocol([2, 30, 365]), max_workers=1, memo=memo)) == sorted(expected)
+        assert (memo.hits, memo.misses, memo.store.entries()) == (0, 0, [])
+        # an explicit version turns memoization back on
+        memo = ConstraintMemo(str(tmp_path / "memo"), data_version="2026-10")
+        bcj.create_cohort(mdd_protocol([2, 30, 365]), max_workers=1, memo=memo)
+        assert sorted(bcj.create_cohort(mdd_protocol([2, 30, 365]), max_workers=1, memo=memo)) == sorted(expected)
+        assert (memo.hits, memo.misses) == (3, 3)
+
+    @pytest.mark.parametrize("fetch_scope", [None, "variable", "cohort"])
+    def test_existence_constraints_sharing_a_pull_are_memoized_apart(self, records_dir, tmp_path, fetch_scope):
+        memo = ConstraintMemo(str(tmp_path / "memo"))
+        subvariables = [("ckd3", "dx", ["N18.3"]), ("ckd4", "dx", ["N184"])]
+        first = protocol([variable_of("renal", subvariables, [["count", [1, 0, 0], "ckd3"], ["count", [1, 0, 0], "ckd4"]])])
+        assert sorted(bcj.create_cohort(first, fetch_scope=fetch_scope, max_workers=1, memo=memo)) == sorted(bcj.create_cohort(first, fetch_scope=fetch_scope, max_workers=1))
+
+        second = protocol([variable_of("ckd4", [("ckd4", "dx", ["N184"])])])
+        expected = bcj.create_cohort(second, fetch_scope=fetch_scope, max_workers=1)
+        assert len(expected)
+        assert sorted(bcj.create_cohort(second, fetch_scope=fetch_scope, max_workers=1, memo=memo)) == sorted(expected)
+        assert memo.hits == 1
@@ -0,0 +1,92 @@
+import pandas as pd
+import pytest
+
+from constraint_memo import ConstraintMemo
+from cost_estimator import BudgetExceeded, CostBudget
+from dump_cache import DumpCache
+from local_records import LocalRecordsAPIWrapper
+
+from .conftest import STUDY_WINDOW, protocol, variable_of
+
+bcj = pytest.importorskip("build_cohort_je")
+
+
+def mdd_protocol():
+    mdd = variable_of("mdd", ["depression"], [["count", [2, 30, 365], "depression"]])
+    return protocol([mdd], [variable_of("renal", ["renal"])])
+
+
+def pulled(variable_name):
+    study_window = [bcj.convert_to_unix(element) for element in STUDY_WINDOW]
+    variable = next(variable for variable in mdd_protocol().clinical_variable if variable.name == variable_name)
+    events, criteria = bcj.variable_plan(variable, study_window).union_query(variable_name)
+    return pd.concat(list(bcj.fetch_chunks(variable_name, events, criteria, study_window)))
+
+
+class TestCostEstimator:
+    @pytest.mark.parametrize("method", ["count", "sample", "cache"])
+    def test_estimates_match_the_pulls(self, records_dir, tmp_path, method):
+        cache = DumpCache(str(tmp_path / "cache"))
+        if method == "cache":
+            bcj.create_cohort(mdd_protocol(), cache=cache, max_workers=1)
+        # a sample of the whole window is the pull itself
+        estimate = bcj.estimate_cohort(mdd_protocol(), cache=cache, method=method, sample_fraction=1)
+        assert list(estimate.constraints["method"]) == [method] * 2
+        assert list(estimate.pulls["group"]) == ["mdd", "renal"]
+        assert list(estimate.pulls["columns"])[1] == ["patient_id"]
+        for name, rows, patients in estimate.pulls[["group", "rows", "patients"]].itertuples(index=False):
+            df = pulled(name)
+            assert (rows, patients) == (len(df), df["patient_id"].nunique())
+        assert estimate.rows == estimate.pulls["rows"].sum()
+
+    def test_over_budget_builds_are_refused_before_fetching(self, records_dir, monkeypatch):
+        fetched = []
+        fetch_chunks = bcj.fetch_chunks
+        monkeypatch.setattr(bcj, "fetch_chunks", lambda *args, **kwargs: fetched.append(args[0]) or fetch_chunks(*args, **kwargs))
+        estimate = mdd_protocol().dry_run(method="count")
+        with pytest.raises(BudgetExceeded) as raised:
+            bcj.create_cohort(mdd_protocol(), max_workers=1, budget=CostBudget(max_rows=estimate.rows - 1))
+        assert raised.value.reasons[0].startswith("rows")
+        with pytest.raises(BudgetExceeded):
+            mdd_protocol().build_cohort(budget=CostBudget(memory_limit=1, spill=False))
+        assert fetched == []
+
+    def test_builds_over_memory_spill(self, records_dir, monkeypatch):
+        expected = sorted(bcj.create_cohort(mdd_protocol(), max_workers=1))
+        limits = []
+        execute_plan = bcj.execute_plan
+        monkeypatch.setattr(bcj, "execute_plan", lambda *args, **kwargs: limits.append(kwargs["memory_limit"]) or execute_plan(*args, **kwargs))
+        budget = CostBudget(max_rows=10 ** 9, memory_limit=1024)
+        assert sorted(bcj.create_cohort(mdd_protocol(), max_workers=1, budget=budget)) == expected
+        assert limits == [1024]
+        limits.clear()
+        # a build that fits keeps the memory limit it was given
+        assert sorted(bcj.create_cohort(mdd_protocol(), max_workers=1, budget=CostBudget(memory_limit=10 ** 12))) == expected
+        assert limits == [None]
+
+    def test_budget_checks_estimate_only_what_memo_misses_without_pulling(self, records_dir, tmp_path, monkeypatch):
+        memo = ConstraintMemo(str(tmp_path / "memo"))
+        bcj.create_cohort(mdd_protocol(), max_workers=1, memo=memo)
+        estimated = []
+        estimate_query = bcj.estimate_query
+        monkeypatch.setattr(bcj, "estimate_query", lambda *args, **kwargs: estimated.append(args[0]) or estimate_query(*args, **kwargs))
+        bcj.create_cohort(mdd_protocol(), max_workers=1, memo=memo, budget=CostBudget(max_rows=1))
+        assert estimated == []
+
+        cohort = mdd_protocol()
+        cohort.clinical_variable[0].constraint["count"][0][0] = [2, 0, 180]
+        with pytest.raises(BudgetExceeded) as raised:
+            bcj.create_cohort(cohort, max_workers=1, memo=memo, budget=CostBudget(max_rows=1))
+        assert estimated == ["mdd"] and list(raised.value.estimate.constraints["variable"]) == ["mdd"]
+
+        # without countCohort or a cached dump, the check refuses to pull a sample
+        expected = sorted(bcj.create_cohort(mdd_protocol(), max_workers=1))
+        monkeypatch.delattr(LocalRecordsAPIWrapper, "countCohort")
+        fetched = []
+        fetch_chunks = bcj.fetch_chunks
+        monkeypatch.setattr(bcj, "fetch_chunks", lambda *args, **kwargs: fetched.append(args[0]) or fetch_chunks(*args, **kwargs))
+        with pytest.raises(ValueError):
+            bcj.create_cohort(mdd_protocol(), max_workers=1, budget=CostBudget(max_rows=10 ** 9))
+        assert fetched == []
+        assert sorted(bcj.create_cohort(mdd_protocol(), max_workers=1, budget=CostBudget(max_rows=10 ** 9, method="auto"))) == expected
+        assert fetched[:2] == ["mdd", "renal"]
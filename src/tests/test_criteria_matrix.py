@@ -0,0 +1,57 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from criteria_matrix import CriteriaMatrix
+from patient_sets import PatientIndex
+
+
+@pytest.fixture
+def matrix_and_sets():
+    rng = np.random.default_rng(0)
+    population = [f"NFER{ii}" for ii in range(1003)]
+    names = ["a", "b", "x", "y", "z"]
+    categories = ["inclusion", "inclusion", "exclusion", "exclusion", "exclusion"]
+    members = {name: set(rng.choice(population, rng.integers(100, 800))) for name in names}
+    index = PatientIndex()
+    patient_sets = [index.encode(sorted(members[name])) for name in names]
+    return CriteriaMatrix(index, names, categories, patient_sets), members
+
+
+def reference(members, inclusion, exclusion):
+    cohort = set.intersection(*[members[name] for name in inclusion]) if inclusion else set().union(*members.values())
+    for name in exclusion:
+        cohort -= members[name]
+    return cohort
+
+
+class TestCriteriaMatrix:
+    def test_every_combination_matches_sets(self, matrix_and_sets):
+        matrix, members = matrix_and_sets
+        for inclusion in [["a"], ["b"], ["a", "b"], []]:
+            for size in range(4):
+                for exclusion in itertools.combinations(["x", "y", "z"], size):
+                    expected = reference(members, inclusion, exclusion)
+                    assert matrix.count(inclusion, list(exclusion)) == len(expected)
+        assert set(matrix.patients()) == reference(members, ["a", "b"], ["x", "y", "z"])
+
+    def test_funnel_in_any_order(self, matrix_and_sets):
+        matrix, members = matrix_and_sets
+        steps = matrix.funnel(["b", "z", "a", "x", "y"])
+        assert [name for name, _, _ in steps] == ["b", "z", "a", "x", "y"]
+        assert [count for _, _, count in steps] == [
+            len(reference(members, ["b"], [])),
+            len(reference(members, ["b"], ["z"])),
+            len(reference(members, ["b", "a"], ["z"])),
+            len(reference(members, ["b", "a"], ["z", "x"])),
+            len(reference(members, ["b", "a"], ["z", "x", "y"])),
+        ]
+        assert matrix.funnel()[-1][2] == matrix.count()
+
+    def test_drop_impact(self, matrix_and_sets):
+        matrix, members = matrix_and_sets
+        impact = matrix.drop_impact()
+        assert impact["y"] == len(reference(members, ["a", "b"], ["x", "z"]))
+        assert impact["a"] == len(reference(members, ["b"], ["x", "y", "z"]))
+        assert all(count >= matrix.count() for count in impact.values())
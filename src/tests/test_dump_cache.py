@@ -0,0 +1,114 @@
+import json
+import multiprocessing
+import os
+import time
+
+import pandas as pd
+
+from dump_cache import DumpCache, dump_spec, in_spec, range_spec, and_spec, spec_key
+
+
+def spec_of(code):
+    return dump_spec(and_spec(in_spec("diagnosis_code", [code]), range_spec("timestamp", 0, 1)), ["patient_id", "timestamp"])
+
+
+def chunks_of(n_chunks, n_rows=1000):
+    return [pd.DataFrame({"patient_id": [f"NFER{ii}" for ii in range(n_rows)], "timestamp": [float(chunk)] * n_rows}) for chunk in range(n_chunks)]
+
+
+class Fetch():
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return iter(self.chunks)
+
+
+def read_through(cache_dir, spec, n_chunks, queue):
+    cache = DumpCache(cache_dir)
+    queue.put(sum(len(df) for df in cache.chunks(spec, lambda: iter(chunks_of(n_chunks)))))
+
+
+class TestDumpCache:
+    def test_hit_and_miss(self, tmp_path):
+        cache = DumpCache(str(tmp_path))
+        fetch = Fetch(chunks_of(3))
+        assert spec_of("F32") not in cache and cache.read(spec_of("F32")) is None
+        first = pd.concat(list(cache.chunks(spec_of("F32"), fetch)))
+        second = pd.concat(list(cache.chunks(spec_of("F32"), fetch)))
+        assert fetch.calls == 1 and spec_of("F32") in cache
+        pd.testing.assert_frame_equal(first.reset_index(drop=True), second.reset_index(drop=True))
+        assert len(cache.read(spec_of("F32"))) == 3
+        # value order and duplicates do not change the key
+        assert spec_key(dump_spec(in_spec("c", ["b", "a", "a"]), ["p"])) == spec_key(dump_spec(in_spec("c", ["a", "b"]), ["p"]))
+
+    def test_empty_dumps_are_cached(self, tmp_path):
+        cache = DumpCache(str(tmp_path))
+        fetch = Fetch([pd.DataFrame({"patient_id": []})])
+        assert list(cache.chunks(spec_of("F32"), fetch)) == []
+        assert list(cache.chunks(spec_of("F32"), fetch)) == []
+        assert fetch.calls == 1
+        assert cache.read(spec_of("F32")) == []
+        meta, paths = cache.parts(spec_of("F32"))
+        assert (meta["n_rows"], paths) == (0, [])
+
+    def test_least_recently_used_entries_are_evicted(self, tmp_path):
+        cache = DumpCache(str(tmp_path))
+        for code in ["A", "B", "C"]:
+            cache.write(spec_of(code), chunks_of(2))
+            time.sleep(0.01)
+        entry_bytes = max(meta["bytes"] for meta in cache.entries())
+        # A is read, so B becomes the least recently used
+        cache.read(spec_of("A"))
+        cache.max_bytes = 2 * entry_bytes
+        cache.write(spec_of("D"), chunks_of(2))
+        assert [code for code in "ABCD" if spec_of(code) in cache] == ["A", "D"]
+        # evicted entries take their lock files with them
+        assert not [code for code in "BC" if os.path.exists(os.path.join(str(tmp_path), spec_key(spec_of(code)) + ".lock"))]
+
+    def test_expired_entries_are_fetched_again(self, tmp_path):
+        cache = DumpCache(str(tmp_path), ttl=60)
+        fetch = Fetch(chunks_of(1))
+        list(cache.chunks(spec_of("F32"), fetch))
+        meta_path = os.path.join(str(tmp_path), spec_key(spec_of("F32")), "meta.json")
+        with open(meta_path) as handle:
+            meta = json.load(handle)
+        with open(meta_path, "w") as handle:
+            json.dump(dict(meta, created=time.time() - 120), handle)
+        assert spec_of("F32") not in cache and cache.read(spec_of("F32")) is None
+        assert len(pd.concat(list(cache.chunks(spec_of("F32"), fetch)))) == 1000
+        assert fetch.calls == 2 and spec_of("F32") in cache
+        cache.ttl = -1
+        cache.evict()
+        assert not cache.entries()
+
+    def test_concurrent_writers_and_readers(self, tmp_path):
+        context = multiprocessing.get_context("fork")
+        queue = context.Queue()
+        processes = [context.Process(target=read_through, args=(str(tmp_path), spec_of("F32"), 4, queue)) for _ in range(6)]
+        for process in processes:
+            process.start()
+        results = [queue.get(timeout=60) for _ in processes]
+        for process in processes:
+            process.join()
+        assert results == [4000] * 6
+        cache = DumpCache(str(tmp_path))
+        assert len(cache.entries()) == 1
+        assert not [name for name in os.listdir(str(tmp_path)) if name.startswith((".tmp-", ".trash-"))]
+
+    def test_entries_being_read_are_not_removed(self, tmp_path):
+        cache = DumpCache(str(tmp_path))
+        cache.write(spec_of("F32"), chunks_of(3))
+        reader = cache.chunks(spec_of("F32"), Fetch([]))
+        first = next(reader)
+        # the reader holds a shared lock: eviction and clear skip the entry
+        cache.max_bytes = 0
+        cache.evict()
+        cache.clear()
+        assert spec_of("F32") in cache
+        assert len(first) + sum(len(df) for df in reader) == 3000
+        cache.clear()
+        assert spec_of("F32") not in cache
+        assert os.listdir(str(tmp_path)) == [".lock"]
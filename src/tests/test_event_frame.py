@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from event_frame import EventEncoder
+from ingest import ChunkSpool, evaluate_chunks, frame_nbytes
+from temporal_kernel import events_occur_multiple_vectorized
+
+DAY = 24 * 60 * 60
+
+
+def random_chunks(seed, n_chunks=6):
+    rng = np.random.default_rng(seed)
+    chunks = []
+    for _ in range(n_chunks):
+        n = int(rng.integers(0, 3000))
+        chunks.append(pd.DataFrame({
+            "patient_id": rng.choice([f"NFER{ii}" for ii in range(300)], n),
+            "timestamp": 1.5e9 + rng.integers(0, 2000, n) * DAY + rng.integers(0, DAY, n),
+            "diagnosis_code": rng.choice(["F32", "F329", "E119", None], n),
+            "meds_drugs": rng.choice(["sertraline", "metformin", None], n),
+        }))
+    return chunks
+
+
+class TestEventFrame:
+    def test_round_trip_with_shared_dictionaries(self):
+        encoder = EventEncoder()
+        chunks = random_chunks(0)
+        compact = pd.concat([encoder.encode(df) for df in chunks], ignore_index=True)
+        raw = pd.concat(chunks, ignore_index=True)
+        assert compact["timestamp"].dtype == np.int32
+        assert compact["diagnosis_code"].dtype == np.int16
+        assert frame_nbytes(compact) * 4 < frame_nbytes(raw)
+
+        decoded = encoder.decode(compact)
+        for column in ["patient_id", "diagnosis_code", "meds_drugs"]:
+            assert decoded[column].astype(object).fillna("-").tolist() == raw[column].fillna("-").tolist()
+        assert np.array_equal(encoder.restore(decoded)["timestamp"].to_numpy(), raw["timestamp"].to_numpy())
+        assert decoded["diagnosis_code"].isin(["F32"]).sum() == (raw["diagnosis_code"] == "F32").sum()
+
+    def test_timestamps_out_of_int32_range_stay_exact(self):
+        encoder = EventEncoder()
+        first = encoder.encode(pd.DataFrame({"patient_id": ["a"], "timestamp": [0.0]}))
+        later = encoder.encode(pd.DataFrame({"patient_id": ["a", "b"], "timestamp": [3e9, 1.5]}))
+        assert first["timestamp"].dtype == np.int32 and later["timestamp"].dtype == np.float64
+        restored = encoder.restore(encoder.decode(pd.concat([first, later], ignore_index=True)))
+        assert restored["timestamp"].tolist() == [0.0, 3e9, 1.5]
+
+    @pytest.mark.parametrize("memory_limit", [None, 20000])
+    @pytest.mark.parametrize("seed", range(3))
+    def test_compact_evaluation_matches_raw(self, seed, memory_limit):
+        evaluate = lambda df: events_occur_multiple_vectorized(df, ["diagnosis_code", "meds_drugs"], [["F32", "F329"], ["sertraline"]], True, 30, 365)
+        results = []
+        for compact in [False, True]:
+            result = evaluate_chunks(random_chunks(seed), evaluate, memory_limit=memory_limit, compact=compact)
+            result = result.astype({"patient_id": object, "diagnosis_code": object, "meds_drugs": object})
+            results.append(result.sort_values(by=["patient_id", "timestamp"]).reset_index(drop=True))
+        assert len(results[0])
+        pd.testing.assert_frame_equal(results[0], results[1], check_dtype=False)
+
+    def test_spilled_partitions_are_decoded(self, tmp_path):
+        encoder = EventEncoder()
+        chunks = random_chunks(1)
+        with ChunkSpool(1000, n_partitions=4, spool_dir=str(tmp_path), encoder=encoder) as spool:
+            for df in chunks:
+                spool.add(df)
+            assert spool.spilled
+            partitions = list(spool.partitions())
+        patients = pd.concat([df["patient_id"].astype(object) for df in partitions])
+        assert sorted(patients) == sorted(pd.concat(chunks)["patient_id"])
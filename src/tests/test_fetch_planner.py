@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fetch_planner import ConstraintFetch, FetchPlan, fan_out
+from temporal_kernel import events_occur_multiple_vectorized
+
+DAY = 24 * 60 * 60
+MDD = ["F32", "F329"]
+SSRI = ["sertraline", "citalopram"]
+RENAL = ["N18.3"]
+
+
+def events(seed, n_rows=4000):
+    rng = np.random.default_rng(seed)
+    diagnosis = rng.random(n_rows) < 0.5
+    return pd.DataFrame({
+        "patient_id": rng.choice([f"NFER{ii}" for ii in range(150)], n_rows),
+        "timestamp": 1.5e9 + rng.integers(0, 2000, n_rows) * DAY,
+        "diagnosis_code": np.where(diagnosis, rng.choice(MDD + RENAL + ["E119"], n_rows), None),
+        "meds_drugs": np.where(diagnosis, None, rng.choice(SSRI + ["metformin"], n_rows)),
+    })
+
+
+def constraint_fetches(variable_name="mdd"):
+    count = lambda df: events_occur_multiple_vectorized(df, ["diagnosis_code"] * 2, [MDD] * 2, False, 30, 365)
+    time = lambda df: events_occur_multiple_vectorized(df, ["meds_drugs", "diagnosis_code"], [SSRI, MDD], True, 0, 180)
+    return [
+        ConstraintFetch(variable_name, "count", [[2, 30, 365], MDD], ["diagnosis"], [MDD], count),
+        ConstraintFetch(variable_name, "time", [[0, 180], SSRI, MDD], ["medication", "diagnosis"], [SSRI, MDD], time),
+        ConstraintFetch(variable_name, "count", [[1, 0, 0], RENAL], ["diagnosis"], [RENAL], None, existence=True),
+    ]
+
+
+def own_rows(df, codes):
+    return df[df["diagnosis_code"].isin(codes.get("diagnosis_code", [])) | df["meds_drugs"].isin(codes.get("meds_drugs", []))]
+
+
+def patients(df):
+    return sorted(set(df["patient_id"].astype(object))) if len(df) else []
+
+
+class TestFetchPlan:
+    def test_union_query_and_summary(self):
+        plan = FetchPlan([0, 1])
+        for fetch in constraint_fetches("mdd") + constraint_fetches("other")[:1]:
+            plan.add(fetch)
+        assert list(plan.groups) == ["mdd", "other"]
+        assert plan.union_query("mdd") == (["diagnosis", "medication"], [MDD + RENAL, SSRI])
+        summary = plan.summary()
+        assert (summary["constraints"], summary["queries"], summary["round_trips_saved"]) == (4, 2, 2)
+        assert summary["groups"][0]["codes"] == {"diagnosis": 3, "medication": 2}
+        assert summary["groups"][0]["codes_requested"] == 7
+        assert [group["existence_only"] for group in summary["groups"]] == [False, False]
+        cohort = FetchPlan([0, 1], scope="cohort")
+        for fetch in constraint_fetches("mdd") + constraint_fetches("other"):
+            cohort.add(fetch)
+        assert list(cohort.groups) == ["cohort"] and cohort.n_constraints == 6 and cohort.n_queries == 1
+        with pytest.raises(ValueError):
+            FetchPlan([0, 1], scope="constraint")
+
+    def test_existence_only_groups(self):
+        plan = FetchPlan([0, 1])
+        plan.add(constraint_fetches("renal")[2])
+        plan.add(constraint_fetches("mdd")[0])
+        assert plan.existence_only("renal") and not plan.existence_only("mdd")
+        assert plan.existence_columns("renal") == ["patient_id"]
+        plan.add(ConstraintFetch("renal", "count", [[1, 0, 0], SSRI], ["medication"], [SSRI], None, existence=True))
+        assert plan.existence_only("renal")
+        assert plan.existence_columns("renal") == ["patient_id", "diagnosis_code", "meds_drugs"]
+
+    @pytest.mark.parametrize("compact", [False, True])
+    @pytest.mark.parametrize("memory_limit", [None, 20000])
+    def test_fan_out_matches_each_constraints_own_query(self, compact, memory_limit):
+        df = events(0)
+        union = own_rows(df, {"diagnosis_code": MDD + RENAL, "meds_drugs": SSRI})
+        chunks = [union.iloc[start:start + 700] for start in range(0, len(union), 700)]
+        fetches = constraint_fetches()
+        results = fan_out(chunks, fetches, memory_limit=memory_limit, compact=compact)
+        count = fetches[0].evaluate(own_rows(df, {"diagnosis_code": MDD}).sort_values(by=["patient_id", "timestamp"]))
+        time = fetches[1].evaluate(own_rows(df, {"diagnosis_code": MDD, "meds_drugs": SSRI}).sort_values(by=["patient_id", "timestamp"]))
+        assert len(count) and len(time)
+        assert patients(results[0]) == patients(count)
+        assert patients(results[1]) == patients(time)
+        assert len(results[0]) == len(count) and len(results[1]) == len(time)
+        assert list(results[2].columns) == ["patient_id"]
+        assert patients(results[2]) == patients(own_rows(df, {"diagnosis_code": RENAL}))
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from fetch_planner import ConstraintFetch
+from incremental import lookback, merge_witnesses, met_by, refresh_criteria, witness_evaluator
+from rolling_windows import evaluate_only_one
+from temporal_kernel import events_occur_multiple_vectorized
+
+from .conftest import protocol, variable_of
+
+bcj = pytest.importorskip("build_cohort_je")
+
+DAY = 24 * 60 * 60
+
+CONSTRAINTS = [
+    ("count", [[2, 0, 30], ["F32", "F33"]]),
+    ("count", [[3, 10, 45], ["F32", "F33"]]),
+    ("count", [[2, 5, 0], ["F32", "F33"]]),
+    ("time", [[10, 40], ["sertraline"], ["F32"]]),
+    ("time", [[0, 20], ["F33"], ["F32"]]),
+    ("only_one", [15, ["sertraline", "fluoxetine"]]),
+]
+
+
+def random_events(seed):
+    rng = np.random.default_rng(seed)
+    n = 4000
+    df = pd.DataFrame({
+        "patient_id": rng.choice([f"NFER{ii}" for ii in range(60)], n),
+        "timestamp": rng.integers(0, 400, n) * float(DAY),
+        "diagnosis_code": rng.choice(["F32", "F33", None], n),
+        "meds_drugs": rng.choice(["sertraline", "fluoxetine", None], n),
+    })
+    return df.sort_values(by=["patient_id", "timestamp"], kind="stable").reset_index(drop=True)
+
+
+def full_evaluation(df, constraint_type, constraint):
+    if constraint_type == "only_one":
+        result = evaluate_only_one(df, "meds_drugs", constraint[1], constraint[0])
+    elif constraint_type == "time":
+        heads = ["meds_drugs" if "sertraline" in constraint[1] else "diagnosis_code", "diagnosis_code"]
+        result = events_occur_multiple_vectorized(df, heads, [constraint[1], constraint[2]], True, constraint[0][0], constraint[0][1])
+    else:
+        result = events_occur_multiple_vectorized(df, ["diagnosis_code"] * constraint[0][0], [constraint[1]] * constraint[0][0], False, constraint[0][1], constraint[0][2])
+    return sorted(set(result["patient_id"])) if len(result) else []
+
+
+def window(df, start, end):
+    return df[(df["timestamp"] >= start) & (df["timestamp"] <= end)]
+
+
+class TestIncremental:
+    @pytest.mark.parametrize("seed", range(3))
+    @pytest.mark.parametrize("constraint_type, constraint", CONSTRAINTS)
+    def test_refreshed_witnesses_match_full_evaluation(self, seed, constraint_type, constraint):
+        df = random_events(seed)
+        if constraint_type == "only_one" or "sertraline" in constraint[1]:
+            events = ["medication", "diagnosis"][:len(constraint) - 1]
+        else:
+            events = ["diagnosis"] * (len(constraint) - 1)
+        fetch = ConstraintFetch("test", constraint_type, constraint, events, constraint[1:], None)
+        evaluate = witness_evaluator(fetch)
+        rng = np.random.default_rng(seed)
+        start, end = 0, 100 * DAY
+        witnesses = evaluate(window(df, start, end))
+        for _ in range(4):
+            new_start, new_end = start + int(rng.integers(0, 30)) * DAY, end + int(rng.integers(1, 90)) * DAY
+            # pending rows of the previous window and the new rows
+            rows = pd.concat([window(df, max(new_start, end - lookback(fetch)), end), window(df, end + 1, new_end)])
+            witnesses = merge_witnesses(witnesses, evaluate(rows.sort_values(by=["patient_id", "timestamp"], kind="stable")))
+            start, end = new_start, new_end
+            assert sorted(met_by(witnesses, start)) == full_evaluation(window(df, start, end), constraint_type, constraint)
+
+    def test_refresh_matches_rebuild_and_only_fetches_new_rows(self, records_dir, tmp_path, monkeypatch):
+        def build(study_window):
+            depression = variable_of("depression", ["depression"], [["count", [2, 30, 365], "depression"]])
+            ssri = variable_of("ssri", ["ssri"], [["only_one", 60, "ssri"]])
+            diabetes = variable_of(
+                "uncontrolled diabetes", ["diabetes_codes", ("hba1c", "lab", ["hba1c"])],
+                [["time", [30, 90], "hba1c", "diabetes_codes"], ["threshold", [6.5, None], "hba1c"]])
+            return protocol([depression, ssri], [diabetes], study_window)
+
+        fetch_chunks = bcj.fetch_chunks
+        windows = []
+        monkeypatch.setattr(bcj, "fetch_chunks", lambda *args, **kwargs: windows.append(list(args[3])) or fetch_chunks(*args, **kwargs))
+        state_dir = str(tmp_path / "state")
+        for study_window in [[20000101, 20150101], [20000101, 20160101], [20020101, 20180101], [20020101, 20180101], [20010101, 20180101]]:
+            windows.clear()
+            cohort = build(study_window)
+            refreshed = refresh_criteria(cohort, state_dir)
+            fetched = list(windows)
+            rebuilt = bcj.evaluate_criteria(cohort, fetch_scope=None, max_workers=1)
+            for name in rebuilt.names:
+                assert refreshed.count(inclusion=[name], exclusion=[]) == rebuilt.count(inclusion=[name], exclusion=[])
+            assert sorted(refreshed.patients()) == sorted(rebuilt.patients())
+            unix_window = [bcj.convert_to_unix(element) for element in study_window]
+            if study_window == [20000101, 20150101] or study_window[0] == 20010101:
+                # first refresh, or a window starting earlier: rebuilt
+                assert all(fetched_window == unix_window for fetched_window in fetched)
+            elif study_window == previous:
+                assert fetched == []
+            else:
+                assert fetched and all(fetched_window == [bcj.convert_to_unix(previous[1]), unix_window[1]] for fetched_window in fetched)
+            previous = study_window
+        # one generation of files is kept per constraint
+        assert all(len(list(path.iterdir())) == 1 for path in (tmp_path / "state").iterdir() if path.is_dir())
@@ -0,0 +1,89 @@
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ingest import ChunkSpool, complete_patient_groups, distinct_patients, evaluate_chunks, frame_nbytes
+from temporal_kernel import events_occur_multiple_vectorized
+
+DAY = 24 * 60 * 60
+
+
+def split_chunks(seed, n_rows=6000, chunk_size=500):
+    '''
+    Events of 200 patients in chunks that cut through patient groups
+    '''
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "patient_id": rng.choice([f"NFER{ii}" for ii in range(200)], n_rows),
+        "timestamp": 1.5e9 + rng.integers(0, 2000, n_rows) * DAY,
+        "diagnosis_code": rng.choice(["F32", "F329", "E119"], n_rows),
+    })
+    return [df.iloc[start:start + chunk_size] for start in range(0, n_rows, chunk_size)]
+
+
+def evaluate(df):
+    # two depression codes 30 to 365 days apart: wrong unless every patient is complete
+    return events_occur_multiple_vectorized(df, ["diagnosis_code"] * 2, [["F32", "F329"]] * 2, False, 30, 365)
+
+
+def canonical(df):
+    return df.astype({"patient_id": object, "diagnosis_code": object}).sort_values(by=["patient_id", "timestamp", "diagnosis_code"]).reset_index(drop=True)
+
+
+class TestIngest:
+    def test_spilled_partitions_hold_complete_patients(self, tmp_path):
+        chunks = split_chunks(0)
+        with ChunkSpool(40000, n_partitions=16, spool_dir=str(tmp_path)) as spool:
+            for df in chunks:
+                spool.add(df)
+            assert spool.spilled and spool._n_flushes > 1
+            partitions = list(spool.partitions())
+            assert glob.glob(os.path.join(spool._dir, "part-*.parquet"))
+        assert not glob.glob(os.path.join(str(tmp_path), "cohort_spool_*", "*"))
+        assert 1 < len(partitions) <= 16
+        patient_sets = [set(df["patient_id"]) for df in partitions]
+        assert sum(len(patients) for patients in patient_sets) == len(set().union(*patient_sets))
+        expected = canonical(pd.concat(chunks))
+        pd.testing.assert_frame_equal(canonical(pd.concat(partitions)), expected)
+
+    def test_partitions_over_the_ceiling_are_split(self, tmp_path):
+        chunks = split_chunks(0)
+        with ChunkSpool(20000, n_partitions=2, spool_dir=str(tmp_path)) as spool:
+            for df in chunks:
+                spool.add(df)
+            partitions = list(spool.partitions())
+        assert len(partitions) > 2
+        assert max(frame_nbytes(df) for df in partitions) <= 20000
+        patient_sets = [set(df["patient_id"]) for df in partitions]
+        assert sum(len(patients) for patients in patient_sets) == len(set().union(*patient_sets))
+        pd.testing.assert_frame_equal(canonical(pd.concat(partitions)), canonical(pd.concat(chunks)))
+
+        # the rows of one patient stay together even over the ceiling
+        df = pd.concat(chunks)
+        one_patient = df[df["patient_id"] == df["patient_id"].iloc[0]]
+        with ChunkSpool(500, n_partitions=2, spool_dir=str(tmp_path)) as spool:
+            for start in range(0, len(one_patient), 5):
+                spool.add(one_patient.iloc[start:start + 5])
+            assert [len(df) for df in spool.partitions()] == [len(one_patient)]
+
+    @pytest.mark.parametrize("compact", [False, True])
+    @pytest.mark.parametrize("seed", range(3))
+    def test_spilled_evaluation_matches_in_memory(self, tmp_path, seed, compact):
+        in_memory = evaluate_chunks(split_chunks(seed), evaluate, compact=compact)
+        spilled = evaluate_chunks(split_chunks(seed), evaluate, memory_limit=10000, spool_dir=str(tmp_path), n_partitions=32, compact=compact)
+        assert len(in_memory)
+        pd.testing.assert_frame_equal(canonical(spilled), canonical(in_memory), check_dtype=False)
+
+    def test_patient_sorted_chunks_are_regrouped(self):
+        df = pd.concat(split_chunks(1)).sort_values(by=["patient_id", "timestamp"])
+        chunks = [df.iloc[start:start + 333] for start in range(0, len(df), 333)]
+        groups = list(complete_patient_groups(chunks))
+        patients = [set(group["patient_id"]) for group in groups]
+        assert sum(len(group) for group in groups) == len(df)
+        assert sum(len(group) for group in patients) == df["patient_id"].nunique()
+        in_memory = evaluate_chunks([df], evaluate, compact=False)
+        pd.testing.assert_frame_equal(canonical(evaluate_chunks(chunks, evaluate, patient_sorted=True)), canonical(in_memory))
+        assert sorted(distinct_patients(chunks)["patient_id"]) == sorted(df["patient_id"].unique())
@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+from local_records import LocalRecordsAPIWrapper, andQuery, inQuery, orQuery, rangeQuery
+from synthetic_ehr import write_synthetic_records
+
+CODE_LISTS = {"dx": {"mdd_codes": ["F32", "F329"]}, "drug": {"ssri_snri": ["sertraline"]}}
+
+
+@pytest.fixture(scope="module")
+def records_dir(tmp_path_factory):
+    out_dir = str(tmp_path_factory.mktemp("records"))
+    write_synthetic_records(out_dir, 20000, n_patients=500, partition_size=6000, code_lists=CODE_LISTS)
+    return out_dir
+
+
+def dump(cohort, projector):
+    cohort.initDump(projector)
+    chunks = []
+    while cohort.advanceDF():
+        chunks.append(cohort.getDF())
+    return chunks
+
+
+class TestLocalRecords:
+    def test_generator_is_deterministic(self, records_dir, tmp_path):
+        write_synthetic_records(str(tmp_path), 20000, n_patients=500, partition_size=6000, code_lists=CODE_LISTS)
+        pd.testing.assert_frame_equal(pd.read_parquet(f"{records_dir}/events"), pd.read_parquet(f"{tmp_path}/events"))
+
+    def test_query_matches_pandas_filter(self, records_dir):
+        rec = LocalRecordsAPIWrapper(records_dir, chunk_size=40)
+        query = andQuery(
+            orQuery(inQuery("diagnosis_code", ["F32", "F329"]), inQuery("meds_drugs", ["sertraline"])),
+            rangeQuery("timestamp", 1.0e9, 1.4e9),
+        )
+        chunks = dump(rec.makeCohort("mdd", cohortSpecifier=query), ["patient_id", "timestamp", "diagnosis_code"])
+
+        events = pd.read_parquet(f"{records_dir}/events")
+        expected = events[
+            (events["diagnosis_code"].isin(["F32", "F329"]) | events["meds_drugs"].isin(["sertraline"]))
+            & events["timestamp"].between(1.0e9, 1.4e9)
+        ]
+        assert len(expected) > 40
+        assert all(len(chunk) == 40 for chunk in chunks[:-1])
+        result = pd.concat(chunks, ignore_index=True)
+        assert list(result.columns) == ["patient_id", "timestamp", "diagnosis_code"]
+        pd.testing.assert_frame_equal(result, expected[result.columns].reset_index(drop=True))
+
+    def test_multi_column_in_query_and_missing_projector_column(self, records_dir):
+        rec = LocalRecordsAPIWrapper(records_dir)
+        query = inQuery(["diagnosis_code", "meds_drugs"], ["F32", "sertraline"])
+        result = pd.concat(dump(rec.makeCohort("any", cohortSpecifier=query), ["patient_id", "disease"]))
+        assert len(result) and result["disease"].isna().all()
+
+    def test_diagnostic_codes_from_disease(self, records_dir):
+        rec = LocalRecordsAPIWrapper(records_dir)
+        assert rec.getDiagnosticCodesFromDisease("mdd_codes") == ["F32", "F329"]
+        assert rec.getDiagnosticCodesFromDisease("unknown") == []
+
+    def test_rewriting_replaces_earlier_parts(self, tmp_path):
+        write_synthetic_records(str(tmp_path), 20000, n_patients=500, partition_size=5000, code_lists=CODE_LISTS)
+        paths = write_synthetic_records(str(tmp_path), 3000, n_patients=100, partition_size=5000, seed=1, code_lists=CODE_LISTS)
+        rec = LocalRecordsAPIWrapper(str(tmp_path))
+        assert rec.files == paths and len(paths) == 1
+        assert len(pd.read_parquet(f"{tmp_path}/events")) == 3000
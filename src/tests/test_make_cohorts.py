@@ -0,0 +1,61 @@
+import os
+
+import pandas as pd
+
+import make_cohorts
+from clincial_research_workflow.dump_cache import DumpCache
+
+
+class Records():
+    '''
+    Stands in for RecordsAPIWrapper: every cohort dumps the same chunks
+    '''
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.dumps = 0
+
+    def makeCohort(self, cohortName, cohortSpecifier=None, timeWindow=None, unit=None):
+        return Dump(self)
+
+
+class Dump():
+    def __init__(self, records):
+        self.records = records
+        self.remaining = []
+
+    def initDump(self, cohortProjector):
+        self.records.dumps += 1
+        self.remaining = list(self.records.chunks)
+
+    def advanceDF(self):
+        if not self.remaining:
+            return False
+        self.df = self.remaining.pop(0)
+        return True
+
+    def getDF(self):
+        return self.df
+
+
+def chunks_of(n_chunks, n_rows=100):
+    return [pd.DataFrame({"patient_id": range(start, start + n_rows), "diagnosis_code": "C921"}) for start in range(0, n_chunks * n_rows, n_rows)]
+
+
+class TestGetFilteredPatients:
+    def test_every_chunk_is_returned_with_and_without_a_cache(self, tmp_path, monkeypatch):
+        records = Records(chunks_of(3))
+        monkeypatch.setattr(make_cohorts, "rec", records)
+        cache = DumpCache(str(tmp_path))
+        direct = make_cohorts.get_filtered_patients(icd_code_list=["C921"])
+        cached = make_cohorts.get_filtered_patients(icd_code_list=["C921"], cache=cache)
+        assert len(direct) == 300
+        pd.testing.assert_frame_equal(cached, direct)
+        pd.testing.assert_frame_equal(make_cohorts.get_filtered_patients(icd_code_list=["C921"], cache=cache), direct)
+        assert records.dumps == 2
+        # the entry is no longer being read, so it can be removed
+        cache.clear()
+        assert os.listdir(str(tmp_path)) == [".lock"]
+
+    def test_empty_dump(self, monkeypatch):
+        monkeypatch.setattr(make_cohorts, "rec", Records([]))
+        assert make_cohorts.get_filtered_patients(icd_code_list=["C921"]) is None
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from patient_sets import PatientIndex, PatientSet, combine, intersect_all, union_all
+
+
+def reference(inclusion_or, inclusion_and, exclusion):
+    sets = [set().union(*inclusion_or)] if inclusion_or else []
+    sets += [set(patients) for patients in inclusion_and]
+    if not sets:
+        return set()
+    cohort = set.intersection(*sets)
+    for patients in exclusion:
+        cohort -= set(patients)
+    return cohort
+
+
+class TestPatientSets:
+    def test_encode_is_stable_and_decodes(self):
+        index = PatientIndex()
+        first = index.encode(["p3", "p1", "p3"])
+        second = index.encode(pd.Series(["p1", "p2"]))
+        assert len(index) == 3
+        assert index.decode(first) == ["p3", "p1"]
+        assert index.decode(second) == ["p1", "p2"]
+        assert index.decode(first & second) == ["p1"]
+        assert index.decode(first | second) == ["p3", "p1", "p2"]
+        assert index.decode(first - second) == ["p3"]
+
+    def test_encode_frames_skips_empty_frames(self):
+        index = PatientIndex()
+        patients = index.encode_frames([pd.DataFrame(), pd.DataFrame({"patient_id": ["a", "b", "a"]})])
+        assert index.decode(patients) == ["a", "b"]
+        assert len(index.encode_frames([pd.DataFrame()])) == 0
+
+    def test_combine_without_inclusion_or_seeds_from_inclusion_and(self):
+        index = PatientIndex()
+        inclusion = [index.encode(["a", "b", "c"]), index.encode(["b", "c", "d"])]
+        exclusion = [index.encode(["c"]), PatientSet()]
+        assert index.decode(combine(inclusion_and=inclusion, exclusion=exclusion, universe=len(index))) == ["b"]
+        assert len(combine(exclusion=exclusion, universe=len(index))) == 0
+        assert len(intersect_all([])) == 0
+
+    @pytest.mark.parametrize("seed", range(20))
+    def test_combine_matches_python_sets(self, seed):
+        rng = np.random.default_rng(seed)
+        population = [f"NFER{ii}" for ii in range(200)]
+        draw = lambda n: [list(rng.choice(population, rng.integers(0, 120))) for _ in range(n)]
+        inclusion_or, inclusion_and, exclusion = draw(rng.integers(0, 3)), draw(rng.integers(0, 4)), draw(rng.integers(0, 6))
+
+        index = PatientIndex()
+        encode = lambda lists: [index.encode(patients) for patients in lists]
+        result = combine(encode(inclusion_or), encode(inclusion_and), encode(exclusion), len(index))
+        assert set(index.decode(result)) == reference(inclusion_or, inclusion_and, exclusion)
+        assert np.all(np.diff(result.codes) > 0)
+        union = union_all(encode(inclusion_or or [[]]), len(index))
+        assert set(index.decode(union)) == set().union(*[set(patients) for patients in inclusion_or])
+        assert set(index.decode(intersect_all(encode(inclusion_and), len(index)))) == (set.intersection(*[set(patients) for patients in inclusion_and]) if inclusion_and else set())
+
+    def test_find_intersection(self):
+        bcj = pytest.importorskip("build_cohort_je")
+        frames = [pd.DataFrame({"patient_id": ["a", "b"]}), pd.DataFrame(), pd.DataFrame({"patient_id": ["b", "c"]})]
+        assert sorted(bcj.find_intersection(inclusion_or=frames, exclusion=[frames[2].iloc[1:]])) == ["a", "b"]
+        assert sorted(bcj.find_intersection(inclusion_and=[["a", "b"], ["b", "c"]], is_df=False)) == ["b"]
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cohorts import ClinicalCohort
+from local_records import LocalRecordsAPIWrapper
+from rolling_windows import evaluate_only_one
+from synthetic_ehr import write_synthetic_records
+from variables import ClinicalVariable
+
+bcj = pytest.importorskip("build_cohort_je")
+
+DAY = 24 * 60 * 60
+DRUGS = ["sertraline", "fluoxetine", "citalopram"]
+
+
+def random_events(seed):
+    rng = np.random.default_rng(seed)
+    n = rng.integers(1, 400)
+    df = pd.DataFrame({
+        "patient_id": rng.choice([f"p{ii}" for ii in range(12)], n),
+        "timestamp": rng.integers(0, 400, n) * DAY,
+        "meds_drugs": rng.choice(DRUGS + ["metformin"], n, p=[0.45, 0.1, 0.05, 0.4]),
+    })
+    return df.sort_values(by=["patient_id", "timestamp"], kind="stable")
+
+
+def reference_counts(df, interval_days):
+    counts = []
+    for row in df.itertuples():
+        window = df[(df["patient_id"] == row.patient_id) & (df["timestamp"] >= row.timestamp - interval_days * DAY) & (df["timestamp"] <= row.timestamp)]
+        counts.append(window["meds_drugs"].nunique())
+    return counts
+
+
+class TestOnlyOne:
+    @pytest.mark.parametrize("seed", range(15))
+    def test_matches_brute_force(self, seed):
+        df = random_events(seed)
+        events = df[df["meds_drugs"].isin(DRUGS)]
+        counts = reference_counts(events, 30)
+        event_level = evaluate_only_one(df, "meds_drugs", DRUGS, 30, event_level=True)
+        assert event_level["distinct_in_window"].tolist() == counts
+
+        ok = pd.Series(counts, index=events.index).groupby(events["patient_id"]).max() <= 1
+        result = evaluate_only_one(df, "meds_drugs", DRUGS, 30)
+        assert set(result["patient_id"] if len(result) else []) == set(ok[ok].index)
+
+    def test_many_distinct_values(self):
+        rng = np.random.default_rng(0)
+        values = [f"drug{ii}" for ii in range(60)]
+        df = pd.DataFrame({
+            "patient_id": rng.choice(["p0", "p1", "p2"], 300),
+            "timestamp": rng.integers(0, 200, 300) * DAY,
+            "meds_drugs": rng.choice(values, 300),
+        }).sort_values(by=["patient_id", "timestamp"], kind="stable")
+        assert evaluate_only_one(df, "meds_drugs", values, 20, event_level=True)["distinct_in_window"].tolist() == reference_counts(df, 20)
+
+    def test_window_is_inclusive(self):
+        df = pd.DataFrame({"patient_id": ["a", "a", "b", "b"], "timestamp": [0, 30 * DAY, 0, 31 * DAY], "meds_drugs": ["sertraline", "fluoxetine"] * 2})
+        assert evaluate_only_one(df, "meds_drugs", DRUGS, 30, event_level=True)["distinct_in_window"].tolist() == [1, 2, 1, 1]
+        assert evaluate_only_one(df, "meds_drugs", DRUGS, 30)["patient_id"].unique().tolist() == ["b"]
+        assert len(evaluate_only_one(df, "meds_drugs", ["metformin"], 30)) == 0
+
+    def test_only_one_constraint_cohort(self, tmp_path, monkeypatch):
+        write_synthetic_records(str(tmp_path), 30000, n_patients=200, code_lists={"dx": {}, "drug": {"ssri_snri": DRUGS}})
+        monkeypatch.setattr(bcj, "rec", LocalRecordsAPIWrapper(str(tmp_path), chunk_size=2000))
+        variable = ClinicalVariable("ssri_snri")
+        variable.add_subvariable(subvariable_name="ssri_snri", category="drug", value=DRUGS)
+        variable.add_constraint(["only_one", 30, "ssri_snri"])
+        variable.finalize_variable()
+        cohort = ClinicalCohort("test", [20000101, 20220101])
+        cohort.add_clinical_variable(variable, "inclusion")
+
+        events = pd.read_parquet(tmp_path / "events")
+        start, end = [bcj.convert_to_unix(element) for element in cohort.study_window]
+        events = events[events["meds_drugs"].isin(DRUGS) & (events["timestamp"] >= start) & (events["timestamp"] <= end)]
+        events = events.sort_values(by=["patient_id", "timestamp"])
+        expected = set(evaluate_only_one(events, "meds_drugs", DRUGS, 30)["patient_id"])
+        assert 0 < len(expected) < events["patient_id"].nunique()
+        assert set(bcj.create_cohort(cohort, max_workers=1)) == expected
+        assert set(cohort.build_cohort(max_workers=1)) == expected
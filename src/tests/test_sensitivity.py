@@ -0,0 +1,49 @@
+import itertools
+
+import pytest
+
+from .conftest import protocol, variable_of
+
+bcj = pytest.importorskip("build_cohort_je")
+
+COUNTS = [1, 2, 3]
+MIN_GAPS = [-10, 0, 7, 30, 120]
+MAX_GAPS = [-30, 0, 14, 90, 365, 1000]
+
+
+def sweep_protocol(depression, diabetes, swept="depression"):
+    depression = variable_of("depression", ["depression"], [depression])
+    diabetes = variable_of("diabetes", ["diabetes_codes", "metformin"], [diabetes])
+    renal = variable_of("renal", ["renal"])
+    if swept == "exclusion":
+        return protocol([diabetes], [depression, renal])
+    return protocol([depression, diabetes], [renal])
+
+
+class TestSensitivitySweep:
+    @pytest.mark.parametrize("category", ["inclusion", "exclusion"])
+    def test_count_sweep_matches_create_cohort(self, records_dir, category):
+        time_constraint = ["time", [0, 365], "metformin", "diabetes_codes"]
+        table = bcj.sweep_cohort(sweep_protocol(["count", [2, 30, 365], "depression"], time_constraint, category), "depression", counts=COUNTS, min_gaps=MIN_GAPS, max_gaps=MAX_GAPS, max_workers=1)
+        assert len(table) == len(COUNTS) * len(MIN_GAPS) * len(MAX_GAPS)
+        assert table["n"].nunique() > 2
+        for row in table.itertuples():
+            cohort = sweep_protocol(["count", [row.count, row.min_gap, row.max_gap], "depression"], time_constraint, category)
+            assert row.n == len(bcj.create_cohort(cohort, max_workers=1)), row
+
+    def test_time_sweep_matches_create_cohort(self, records_dir):
+        count_constraint = ["count", [1, 0, 0], "depression"]
+        table = bcj.sweep_cohort(sweep_protocol(count_constraint, ["time", [0, 365], "metformin", "diabetes_codes"]), "diabetes", min_gaps=MIN_GAPS, max_gaps=MAX_GAPS, max_workers=1)
+        assert list(table.columns) == ["min_gap", "max_gap", "n"]
+        assert table["n"].nunique() > 2
+        for min_gap, max_gap in itertools.product(MIN_GAPS, MAX_GAPS):
+            cohort = sweep_protocol(count_constraint, ["time", [min_gap, max_gap], "metformin", "diabetes_codes"])
+            assert table[(table["min_gap"] == min_gap) & (table["max_gap"] == max_gap)]["n"].item() == len(bcj.create_cohort(cohort, max_workers=1))
+
+    def test_defaults_to_the_constraint_and_rejects_thresholds(self, records_dir):
+        cohort = sweep_protocol(["count", [2, 30, 365], "depression"], ["time", [0, 365], "metformin", "diabetes_codes"])
+        table = bcj.sweep_cohort(cohort, "depression", max_workers=1)
+        assert table.to_dict("records") == [{"count": 2, "min_gap": 30, "max_gap": 365, "n": len(bcj.create_cohort(cohort, max_workers=1))}]
+        cohort.add_clinical_variable(variable_of("metformin", ["metformin"], [["only_one", 30, "metformin"]]), "exclusion")
+        with pytest.raises(ValueError):
+            bcj.sweep_cohort(cohort, "metformin", max_workers=1)
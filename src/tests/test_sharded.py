@@ -0,0 +1,92 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from concurrent_fetch import run_concurrently
+from sharded import SharedArrays, ShardedEvaluator, attached_arrays
+from temporal_kernel import events_occur_multiple_vectorized
+
+from .conftest import protocol, variable_of
+
+bcj = pytest.importorskip("build_cohort_je")
+
+DAY = 24 * 60 * 60
+
+
+@pytest.fixture(scope="module")
+def evaluator():
+    with ShardedEvaluator(n_workers=2, n_shards=5, min_rows=0) as evaluator:
+        yield evaluator
+
+
+def random_events(seed):
+    rng = np.random.default_rng(seed)
+    n = 5000
+    df = pd.DataFrame({
+        "patient_id": rng.choice([f"NFER{ii}" for ii in range(200)], n),
+        "timestamp": rng.integers(0, 400, n) * float(DAY),
+        "diagnosis_code": rng.choice(["F32", "F33", None], n),
+        "meds_drugs": rng.choice(["sertraline", "fluoxetine", None], n),
+    })
+    return df.sort_values(by=["patient_id", "timestamp"], kind="stable").reset_index(drop=True)
+
+
+def shared_blocks():
+    return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+
+class TestShardedEvaluator:
+    @pytest.mark.parametrize("seed", range(2))
+    @pytest.mark.parametrize("args", [
+        (["diagnosis_code", "diagnosis_code"], [["F32", "F33"], ["F32", "F33"]], False, 30, 90),
+        (["diagnosis_code"] * 3, [["F32"]] * 3, False, 0, 20),
+        (["meds_drugs", "diagnosis_code"], [["sertraline"], ["F32"]], True, 10, 60),
+    ])
+    def test_matches_single_process_kernel(self, evaluator, seed, args):
+        df = random_events(seed)
+        blocks = shared_blocks()
+        result = evaluator(df, *args)
+        expected = events_occur_multiple_vectorized(df, *args)
+        assert len(expected) and result.equals(expected)
+        assert shared_blocks() == blocks
+
+    def test_rows_without_patient_id_are_dropped(self, evaluator):
+        df = random_events(0)
+        args = (["diagnosis_code", "diagnosis_code"], [["F32", "F33"], ["F32", "F33"]], False, 30, 90)
+        missing = df.copy()
+        # the last patient sorts last, where rows coded -1 would land
+        last = missing["patient_id"] == missing["patient_id"].max()
+        missing.loc[last, "diagnosis_code"] = None
+        nulls = missing.sample(300, random_state=0).assign(patient_id=None)
+        with_nulls = pd.concat([missing, nulls]).sort_index(kind="stable")
+        result = evaluator(with_nulls, *args)
+        assert result["patient_id"].notna().all()
+        assert set(result["patient_id"]) == set(events_occur_multiple_vectorized(missing, *args)["patient_id"])
+
+    def test_concurrent_evaluations_share_one_pool(self):
+        with ShardedEvaluator(n_workers=2) as evaluator:
+            pools = run_concurrently([evaluator.pool for _ in range(8)], max_workers=8)
+            assert all(pool is pools[0] for pool in pools)
+            state = pickle.loads(pickle.dumps(evaluator))
+            assert state._pool is None and state.pool() is not pools[0]
+            state.close()
+
+    def test_shared_arrays_round_trip(self):
+        arrays = {"a": np.arange(10), "b": np.ones((2, 3), dtype=bool)}
+        with SharedArrays(arrays) as shared:
+            blocks, attached = attached_arrays(shared.spec)
+            assert all(np.array_equal(attached[name], arrays[name]) for name in arrays)
+            del attached
+            for block in blocks.values():
+                block.close()
+
+    def test_create_cohort_with_sharded_evaluator(self, evaluator, records_dir):
+        depression = variable_of("depression", ["depression"], [["count", [2, 30, 365], "depression"]])
+        diabetes = variable_of("diabetes", ["diabetes_codes", "metformin"], [["time", [0, 365], "metformin", "diabetes_codes"]])
+        cohort = protocol([depression], [diabetes])
+        for fetch_scope in [None, "variable"]:
+            expected = bcj.create_cohort(cohort, fetch_scope=fetch_scope, max_workers=1)
+            assert sorted(bcj.create_cohort(cohort, fetch_scope=fetch_scope, max_workers=2, evaluator=evaluator)) == sorted(expected)
@@ -0,0 +1,43 @@
+import os
+
+import pandas as pd
+import pytest
+
+from stage_metrics import METRICS_DIR_ENV, collecting, metered_chunks, read_events, summarize
+
+from .conftest import protocol, variable_of
+
+bcj = pytest.importorskip("build_cohort_je")
+
+
+def depression_protocol():
+    depression = variable_of("depression", ["depression"], [["count", [2, 30, 365], "depression"]])
+    return protocol([depression], [variable_of("renal", ["renal"])])
+
+
+class TestStageMetrics:
+    def test_metered_chunks_count_what_passes_through(self, tmp_path):
+        chunks = [pd.DataFrame({"patient_id": ["a", "b"]}), pd.DataFrame({"patient_id": ["c"]})]
+        assert list(metered_chunks(iter(chunks))) == chunks
+        with collecting(str(tmp_path)):
+            assert [len(df) for df in metered_chunks(iter(chunks), variable="v")] == [2, 1]
+        assert METRICS_DIR_ENV not in os.environ
+        events = read_events(str(tmp_path))
+        assert events[["stage", "variable", "chunks", "rows"]].values.tolist() == [["fetch", "v", 2, 3]]
+
+    @pytest.mark.parametrize("fetch_scope", [None, "variable"])
+    def test_cohort_build_reports_every_stage(self, records_dir, tmp_path, fetch_scope):
+        bcj.create_cohort(depression_protocol(), fetch_scope=fetch_scope, max_workers=1)
+        assert not (tmp_path / "metrics").exists()
+
+        with collecting(str(tmp_path / "metrics")):
+            cohort = bcj.create_cohort(depression_protocol(), fetch_scope=fetch_scope, max_workers=2)
+        summary = summarize(str(tmp_path / "metrics"), str(tmp_path / "summary.json"), run_id="test")
+        assert set(summary["stages"]) == {"query_build", "fetch", "sort", "evaluate", "set_algebra"}
+        assert summary["stages"]["set_algebra"]["patients"] == len(cohort)
+        depression = summary["variables"]["depression"]
+        assert depression["evaluate"]["rows"] == depression["sort"]["rows"]
+        assert 0 < depression["evaluate"]["rows_out"] <= depression["evaluate"]["rows"]
+        assert depression["evaluate"]["patients"] >= len(cohort)
+        assert summary["stages"]["fetch"]["rows"] > 0 and summary["stages"]["fetch"]["bytes"] > 0
+        assert (tmp_path / "summary.json").exists()
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from temporal_kernel import events_occur_multiple_vectorized, first_in_interval
+
+DAY = 24 * 60 * 60
+
+
+def make_events(rows):
+    df = pd.DataFrame(rows, columns=["patient_id", "timestamp", "diagnosis_code", "meds_drugs"])
+    df["timestamp"] = df["timestamp"] * DAY
+    return df.sort_values(by=["patient_id", "timestamp"])
+
+
+def included_patients(df):
+    return sorted(set(df["patient_id"])) if len(df) else []
+
+
+@pytest.fixture
+def events():
+    return make_events(
+        [
+            ["p1", 0, "F32", None],
+            ["p1", 40, "F32", None],
+            ["p2", 0, "F32", None],
+            ["p2", 10, "F32", None],
+            ["p3", 0, "F32", None],
+            ["p3", 0, None, "sertraline"],
+            ["p3", 400, "F32", None],
+            ["p4", 5, "E11", None],
+            ["p4", 20, None, "metformin"],
+        ]
+    )
+
+
+class TestCountConstraint:
+    def test_second_code_in_window(self, events):
+        result = events_occur_multiple_vectorized(
+            events, ["diagnosis_code", "diagnosis_code"], [["F32"], ["F32"]], False, 30, 365
+        )
+        assert included_patients(result) == ["p1"]
+
+    def test_returns_all_rows_of_included_patients(self, events):
+        result = events_occur_multiple_vectorized(
+            events, ["diagnosis_code", "diagnosis_code"], [["F32"], ["F32"]], False, 30, 365
+        )
+        assert result.equals(events[events["patient_id"] == "p1"])
+
+    def test_single_occurrence_matches_any_event(self, events):
+        result = events_occur_multiple_vectorized(events, ["diagnosis_code"], [["F32"]], False, 0, 0)
+        assert included_patients(result) == ["p1", "p2", "p3"]
+
+    def test_no_match_returns_empty_frame(self, events):
+        result = events_occur_multiple_vectorized(events, ["diagnosis_code"], [["Z99"]], False, 0, 0)
+        assert len(result) == 0
+
+
+class TestTimeConstraint:
+    def test_dependee_after_anchor(self, events):
+        result = events_occur_multiple_vectorized(
+            events, ["diagnosis_code", "meds_drugs"], [["E11"], ["metformin"]], True, 0, 90
+        )
+        assert included_patients(result) == ["p4"]
+
+    def test_dependee_before_inner_window(self, events):
+        result = events_occur_multiple_vectorized(
+            events, ["diagnosis_code", "meds_drugs"], [["E11"], ["metformin"]], True, 30, 90
+        )
+        assert included_patients(result) == []
+
+
+def linear_scan(timestamps, time_int):
+    def is_between(timestamp, gap):
+        return gap[0] != gap[1] and gap[0] <= timestamp <= gap[1]
+
+    for timestamp in timestamps:
+        if is_between(timestamp, time_int[1]) and not is_between(timestamp, time_int[0]):
+            return [True, timestamp]
+    return [False, None]
+
+
+def test_first_in_interval_matches_linear_scan():
+    rng = np.random.default_rng(3)
+    timestamps = sorted(set(rng.integers(0, 100, 40).tolist()))
+    for _ in range(500):
+        anchor, min_gap, max_gap = (int(x) for x in rng.integers(0, 100, 3))
+        for time_int in (
+            [[anchor, anchor + min_gap], [anchor, anchor + max_gap]],
+            [[anchor - min_gap, anchor + min_gap], [anchor - max_gap, anchor + max_gap]],
+        ):
+            assert first_in_interval(timestamps, time_int) == linear_scan(timestamps, time_int)
+
+
+def test_matches_per_patient_loop():
+    build_cohort_je = pytest.importorskip("build_cohort_je")
+    rng = np.random.default_rng(7)
+    for _ in range(100):
+        n = int(rng.integers(1, 60))
+        df = make_events(
+            zip(
+                rng.choice(["a", "b", "c", "d"], n),
+                rng.integers(0, 400, n),
+                rng.choice(["F32", "F320", "E11"], n),
+                rng.choice(["sertraline", "metformin"], n),
+            )
+        )
+        min_gap, max_gap = int(rng.integers(0, 60)), int(rng.integers(0, 365))
+        for args in [
+            (["diagnosis_code"] * 2, [["F32", "F320"]] * 2, False),
+            (["diagnosis_code", "meds_drugs"], [["E11"], ["metformin"]], True),
+        ]:
+            expected = build_cohort_je.events_occur_multiple(df, *args, min_gap, max_gap)
+            result = events_occur_multiple_vectorized(df, *args, min_gap, max_gap)
+            assert included_patients(result) == included_patients(expected)
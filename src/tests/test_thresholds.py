@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cohorts import ClinicalCohort
+from local_records import LocalCohort, LocalRecordsAPIWrapper
+from synthetic_ehr import write_synthetic_records
+from thresholds import apply_thresholds, evaluate_threshold, in_threshold
+from variables import ClinicalVariable
+
+bcj = pytest.importorskip("build_cohort_je")
+
+CODE_LISTS = {"dx": {"diabetes_codes": ["E119"]}, "drug": {}}
+STUDY_WINDOW = [20000101, 20220101]
+
+
+@pytest.fixture(scope="module")
+def records_dir(tmp_path_factory):
+    out_dir = str(tmp_path_factory.mktemp("records"))
+    write_synthetic_records(out_dir, 40000, n_patients=400, code_lists=CODE_LISTS)
+    return out_dir
+
+
+@pytest.fixture
+def rec(records_dir, monkeypatch):
+    rec = LocalRecordsAPIWrapper(records_dir, chunk_size=3000)
+    monkeypatch.setattr(bcj, "rec", rec)
+    return rec
+
+
+def window_events(records_dir):
+    events = pd.read_parquet(f"{records_dir}/events")
+    start, end = [bcj.convert_to_unix(element) for element in STUDY_WINDOW]
+    return events[(events["timestamp"] >= start) & (events["timestamp"] <= end)].sort_values(by=["patient_id", "timestamp"])
+
+
+def build(variable):
+    cohort = ClinicalCohort("test", STUDY_WINDOW)
+    cohort.add_clinical_variable(variable, "inclusion")
+    return cohort
+
+
+class TestThresholds:
+    def test_in_threshold_bounds_and_unparsable_values(self):
+        values = ["6.4", "6.5", 7, None, "high", 9.1]
+        assert in_threshold(values, [6.5, None]).tolist() == [False, True, True, False, False, True]
+        assert in_threshold(values, [None, 7]).tolist() == [True, True, True, False, False, False]
+
+    def test_evaluate_threshold_matches_groupby(self):
+        rng = np.random.default_rng(0)
+        # a few patients with long lab histories
+        df = pd.DataFrame({
+            "patient_id": np.repeat(["a", "b", "c"], 20000),
+            "timestamp": np.tile(np.arange(20000), 3),
+            "lab_test_name": rng.choice(["hba1c", "ldl"], 60000),
+            "lab_value": np.concatenate([rng.normal(5.5, 0.3, 40000), rng.normal(7, 0.3, 20000)]),
+        })
+        result = evaluate_threshold(df, "lab", ["hba1c"], [6.5, None])
+        hits = df[(df["lab_test_name"] == "hba1c") & (df["lab_value"] >= 6.5)]["patient_id"].unique()
+        assert set(result["patient_id"]) == set(hits)
+        assert len(result) == df["patient_id"].isin(hits).sum()
+        assert len(evaluate_threshold(df, "lab", ["tsh"], [0, None])) == 0
+
+    def test_apply_thresholds_only_drops_linked_results(self):
+        df = pd.DataFrame({"lab_test_name": ["hba1c", "hba1c", None, "ldl"], "lab_value": [6.0, 7.0, np.nan, 50.0]})
+        kept = apply_thresholds(df, [("lab", ["hba1c"], [6.5, None])])
+        assert kept.index.tolist() == [1, 2, 3]
+
+    @pytest.mark.parametrize("fetch_scope", [None, "variable", "cohort"])
+    def test_threshold_constraint_cohort(self, rec, records_dir, fetch_scope, monkeypatch):
+        projectors = []
+        init_dump = LocalCohort.initDump
+        monkeypatch.setattr(LocalCohort, "initDump", lambda self, cohortProjector: projectors.append(list(cohortProjector)) or init_dump(self, cohortProjector))
+        variable = ClinicalVariable("high ldl")
+        variable.add_subvariable(subvariable_name="ldl", category="lab", value=["ldl"])
+        variable.add_constraint(["threshold", [160, None], "ldl"])
+        variable.finalize_variable()
+        events = window_events(records_dir)
+        expected = events[(events["lab_test_name"] == "ldl") & (events["lab_value"] >= 160)]["patient_id"].unique()
+        assert len(expected)
+        assert sorted(bcj.create_cohort(build(variable), fetch_scope=fetch_scope, max_workers=1)) == sorted(expected)
+        assert projectors == [["patient_id", "timestamp", "lab_test_name", "lab_value"]]
+
+    def test_threshold_linked_to_time_constraint(self, rec, records_dir):
+        variable = ClinicalVariable("uncontrolled diabetes")
+        variable.add_subvariable(subvariable_name="diabetes_codes", category="dx", value=CODE_LISTS["dx"]["diabetes_codes"])
+        variable.add_subvariable(subvariable_name="hba1c", category="lab", value=["hba1c"])
+        variable.add_constraint(["time", [30, 90], "hba1c", "diabetes_codes"])
+        variable.add_constraint(["threshold", [6.5, None], "hba1c"])
+        variable.finalize_variable()
+        assert [constraint_type for constraint_type, constraint in bcj.evaluated_constraints(variable)] == ["time"]
+
+        events = window_events(records_dir)
+        events = events[events["diagnosis_code"].isin(["E119"]) | ((events["lab_test_name"] == "hba1c") & (events["lab_value"] >= 6.5))]
+        expected = bcj.events_occur_multiple(events, ["lab_test_name", "diagnosis_code"], [["hba1c"], ["E119"]], True, 30, 90)
+        expected = set(expected["patient_id"]) if len(expected) else set()
+        assert len(expected)
+        assert set(bcj.create_cohort(build(variable), max_workers=1)) == expected
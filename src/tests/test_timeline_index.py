@@ -0,0 +1,98 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from local_records import LocalRecordsAPIWrapper
+from synthetic_ehr import write_synthetic_records
+from timeline_index import TimelineIndex, build_timeline_index
+from variables import ClinicalVariable
+
+bcj = pytest.importorskip("build_cohort_je")
+
+CODE_LISTS = {"dx": {"depression": ["F32", "F33.0"], "diabetes_codes": ["E119"]}, "drug": {"metformin": ["metformin"]}}
+STUDY_WINDOW = [20000101, 20220101]
+
+
+@pytest.fixture(scope="module")
+def records_dir(tmp_path_factory):
+    out_dir = str(tmp_path_factory.mktemp("records"))
+    write_synthetic_records(out_dir, 30000, n_patients=300, partition_size=7000, code_lists=CODE_LISTS)
+    return out_dir
+
+
+@pytest.fixture(scope="module")
+def index(records_dir, tmp_path_factory):
+    # small batches exercise the multi-batch scatter and block sort
+    return build_timeline_index(records_dir, str(tmp_path_factory.mktemp("index")), batch_size=4000)
+
+
+def variable_with(name, subvariables, constraint):
+    variable = ClinicalVariable(name)
+    for subvariable_name, category in subvariables:
+        variable.add_subvariable(subvariable_name=subvariable_name, category=category, value=CODE_LISTS[category][subvariable_name])
+    variable.add_constraint(constraint)
+    return variable
+
+
+class TestTimelineIndex:
+    def test_events_are_patient_major_and_time_ordered(self, records_dir, index):
+        events = pd.read_parquet(f"{records_dir}/events")
+        assert len(index) == len(events) and index.n_patients == events["patient_id"].nunique()
+        frame = index.frame(np.arange(len(index)))
+        assert frame["patient_id"].cat.codes.is_monotonic_increasing
+        assert (np.diff(frame["timestamp"])[np.diff(frame["patient_id"].cat.codes) == 0] >= 0).all()
+
+        patient_id = events["patient_id"].iloc[0]
+        expected = events[events["patient_id"] == patient_id].sort_values(by="timestamp", kind="stable")
+        timeline = index.timeline(patient_id)
+        assert timeline["timestamp"].tolist() == expected["timestamp"].tolist()
+        codes = pd.Series(np.asarray(index.dictionaries["diagnosis_code"] + [None], dtype=object)[timeline["diagnosis_code"]])
+        assert sorted(codes.fillna("-")) == sorted(expected["diagnosis_code"].fillna("-"))
+        assert len(index.timeline("missing")["timestamp"]) == 0
+
+    def test_timelines_are_shared_read_only_views(self, index):
+        timeline = index.timeline(index.patient_ids[0])
+        assert np.shares_memory(timeline["timestamp"], index.arrays["timestamp"])
+        assert not timeline["timestamp"].flags.writeable
+        reopened = pickle.loads(pickle.dumps(index))
+        assert len(pickle.dumps(index)) < 1000
+        assert np.array_equal(reopened.arrays["diagnosis_code"], index.arrays["diagnosis_code"])
+
+    @pytest.mark.parametrize("constraint", [
+        ["count", [1, 0, 0], "depression"],
+        ["count", [2, 30, 365], "depression"],
+        ["time", [0, 180], "metformin", "depression"],
+    ])
+    def test_constraints_match_sdk_pull(self, records_dir, index, monkeypatch, constraint):
+        monkeypatch.setattr(bcj, "rec", LocalRecordsAPIWrapper(records_dir))
+        subvariables = [("depression", "dx"), ("metformin", "drug")]
+        variable = variable_with("test", subvariables, constraint)
+        variable_constraint = variable.constraint[constraint[0]][0]
+        study_window = [bcj.convert_to_unix(element) for element in STUDY_WINDOW]
+        expected = bcj.create_query_from_constraint(variable.name, variable, variable_constraint, constraint[0], study_window)
+        result = bcj.create_query_from_index(index, variable, variable_constraint, constraint[0], study_window, block_size=3000)
+        assert len(expected)
+        assert sorted(result["patient_id"].astype(object).unique()) == sorted(expected["patient_id"].unique())
+        if len(result.columns) > 1:
+            assert len(result) == len(expected)
+
+    def test_rejects_other_format_versions(self, tmp_path):
+        (tmp_path / "meta.json").write_text('{"format": 0}')
+        with pytest.raises(ValueError):
+            TimelineIndex(str(tmp_path))
+
+    def test_integer_and_null_patient_ids(self, tmp_path):
+        events = tmp_path / "records" / "events"
+        events.mkdir(parents=True)
+        pd.DataFrame({
+            "patient_id": pd.array([10, 2, None, 10, 2, None], dtype="Int64"),
+            "timestamp": [3.0, 2.0, 1.0, 1.0, 4.0, 0.0],
+            "diagnosis_code": ["F32", "E119", "F32", "E119", None, "F32"],
+        }).to_parquet(events / "part-0.parquet")
+        index = build_timeline_index(str(tmp_path / "records"), str(tmp_path / "index"), batch_size=2)
+        assert index.patient_ids.tolist() == [2, 10] and index.offsets.tolist() == [0, 2, 4]
+        assert index.timeline(10)["timestamp"].tolist() == [1.0, 3.0]
+        assert index.timeline(2)["timestamp"].tolist() == [2.0, 4.0]
+        assert index.frame(np.arange(4))["patient_id"].tolist() == [2, 2, 10, 10]
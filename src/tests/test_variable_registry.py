@@ -0,0 +1,67 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from variable_registry import SELTOREXANT_CATALOG, VariableRegistry, build_variable, variable_definition
+from variables import ClinicalVariable
+
+
+def time_variable():
+    variable = ClinicalVariable("insomnia after ssri")
+    variable.add_subvariable(subvariable_name="ssri", category="drug", value=["sertraline", "citalopram"])
+    variable.add_subvariable(subvariable_name="insomnia", category="dx", value=["G47.0", "F51.0"])
+    variable.add_subvariable(subvariable_name="renal", category="dx", value=["N18.3"])
+    variable.add_constraint(["time", [0, 180], "insomnia", "ssri"])
+    variable.add_constraint(["only_one", 30, "ssri"])
+    variable.finalize_variable()
+    return variable
+
+
+class TestVariableRegistry:
+    def test_definitions_rebuild_the_same_variable(self):
+        variable = time_variable()
+        definition = json.loads(json.dumps(variable_definition(variable, library="test")))
+        assert definition["constraints"][0] == ["time", [0, 180], "insomnia", "ssri"]
+        rebuilt = build_variable(definition)
+        assert rebuilt.variable_to_dict() == variable.variable_to_dict()
+        assert list(rebuilt.constraint) == list(variable.constraint)
+
+    def test_variables_are_built_on_first_use_and_shared(self, monkeypatch):
+        catalog = VariableRegistry(SELTOREXANT_CATALOG)
+        built = []
+        monkeypatch.setattr("variable_registry.build_variable", lambda definition: built.append(definition["name"]) or build_variable(definition))
+        assert len(catalog.names("diagnosis_variables")) == 11 and built == []
+        mdd = catalog.get("mdd inclusion")
+        assert catalog.get("mdd inclusion") is mdd and built == ["mdd inclusion"]
+        assert mdd.constraint["count"][0][0] == [2, 30, 365]
+        assert catalog.attribute("medication_variables", "ssri_snri")[0] == "citalopram"
+        assert catalog.attribute("medication_variables", "excl_var").name == "exclusion_drugs"
+        assert catalog.attribute("medication_variables", "mdd_codes") is None
+        with pytest.raises(KeyError):
+            catalog.get("unknown")
+
+    def test_library_modules_resolve_names_lazily(self):
+        from clincial_research_workflow import variable_registry
+
+        diagnosis = importlib.import_module("clincial_research_workflow.seltorexant_variables.diagnosis_variables")
+        from clincial_research_workflow.seltorexant_variables.medication_variables import meds_variables, mdd_var, ssri_snri
+        assert [variable.name for variable in meds_variables] == ["ssri_snri", "exclusion_drugs"]
+        assert mdd_var is variable_registry.registry().get("ssri_snri") and mdd_var.value[0] == ssri_snri
+        assert [variable.name for variable in diagnosis.diagnosis_variables][:2] == ["mdd inclusion", "psychiatric exclusion"]
+        assert diagnosis.mdd_var.value[0] == diagnosis.mdd_codes
+        assert diagnosis.diagnosis_variables is diagnosis.diagnosis_variables
+        assert diagnosis.mdd_codes is diagnosis.mdd_codes
+        with pytest.raises(ImportError):
+            from clincial_research_workflow.seltorexant_variables.diagnosis_variables import ssri_snri  # noqa: F401
+
+    def test_library_modules_import_from_the_package(self):
+        # without the workflow directory on sys.path, as when imported by package name
+        src_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+        code = "from clincial_research_workflow.seltorexant_variables.medication_variables import meds_variables; print(len(meds_variables))"
+        result = subprocess.run([sys.executable, "-c", code], cwd=src_dir, env=dict(os.environ, PYTHONPATH=""), capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip() == "2"
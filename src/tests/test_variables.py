@@ -0,0 +1,17 @@
+from variables import ClinicalVariable
+
+
+class TestClinicalVariable:
+    def test_default_count_constraints_are_added_as_constraint_lists(self):
+        variable = ClinicalVariable("renal")
+        variable.add_subvariable(subvariable_name="ckd3", category="dx", value=["N18.3"])
+        variable.add_subvariable(subvariable_name="ckd4", category="dx", value=["N184"])
+        variable.finalize_variable()
+        assert variable.constraint == {"count": [[[1, 0, 0], ["N18.3"]], [[1, 0, 0], ["N184"]]]}
+
+        variable = ClinicalVariable("mdd")
+        variable.add_subvariable(subvariable_name="mdd_codes", category="dx", value=["F32"])
+        variable.add_subvariable(subvariable_name="ssri", category="drug", value=["sertraline"])
+        variable.add_constraint(["count", [2, 30, 365], "mdd_codes"])
+        variable.finalize_variable()
+        assert variable.constraint == {"count": [[[2, 30, 365], ["F32"]], [[1, 0, 0], ["sertraline"]]]}